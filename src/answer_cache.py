@@ -0,0 +1,124 @@
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import faiss
+
+
+# Cache sémantique des réponses de ask_rag.
+# On retrouve les questions déjà posées par similarité d'embedding (petit index
+# FAISS IndexFlatIP sur les embeddings normalisés des questions), puis on ne
+# réutilise la réponse que si elle a été générée à partir des mêmes chunks et
+# de la même version d'index : un rebuild du corpus invalide tout le cache.
+
+
+class AnswerCache:
+    def __init__(self, threshold: float = 0.92, ttl: float = 3600.0, max_items: int = 1000, n_candidates: int = 8):
+        """
+        threshold    : similarité cosinus minimale entre la question et une question déjà posée
+        ttl          : durée de vie d'une entrée en secondes (None = illimitée)
+        max_items    : nb max d'entrées (LRU au-delà)
+        n_candidates : nb de questions proches examinées à chaque lookup
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_items = max_items
+        self.n_candidates = n_candidates
+
+        self._index = None  # créé au premier put (dimension connue)
+        self._entries = OrderedDict()  # id faiss -> entrée, du moins au plus récemment utilisé
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    # ----------------------------
+    # Interne
+    # ----------------------------
+    def _remove(self, entry_id):
+        self._entries.pop(entry_id, None)
+        self._index.remove_ids(np.asarray([entry_id], dtype=np.int64))
+
+    def _is_expired(self, entry, now):
+        return self.ttl is not None and now - entry["created"] > self.ttl
+
+    # ----------------------------
+    # API
+    # ----------------------------
+    def lookup(self, q_emb, chunk_ids, version):
+        """
+        Entrée en cache pour cette question (embedding normalisé), ces chunks et
+        cette version d'index, ou None.
+        """
+        q = np.ascontiguousarray(np.asarray(q_emb, dtype=np.float32).reshape(1, -1))
+        chunk_ids = tuple(chunk_ids)
+        now = time.time()
+
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                self.misses += 1
+                return None
+
+            scores, ids = self._index.search(q, min(self.n_candidates, self._index.ntotal))
+            for score, entry_id in zip(scores[0], ids[0]):
+                if entry_id < 0 or score < self.threshold:
+                    break  # résultats triés par score décroissant
+                entry = self._entries.get(int(entry_id))
+                if entry is None:
+                    continue
+                if self._is_expired(entry, now):
+                    self._remove(int(entry_id))
+                    self.expired += 1
+                    continue
+                if entry["chunk_ids"] == chunk_ids and entry["version"] == version:
+                    self._entries.move_to_end(int(entry_id))
+                    self.hits += 1
+                    return dict(entry, similarity=float(score))
+
+            self.misses += 1
+            return None
+
+    def put(self, q_emb, question, answer, chunk_ids, version):
+        q = np.ascontiguousarray(np.asarray(q_emb, dtype=np.float32).reshape(1, -1))
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(q.shape[1]))
+
+            while len(self._entries) >= self.max_items:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evicted += 1
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(q, np.asarray([entry_id], dtype=np.int64))
+            self._entries[entry_id] = {
+                "question": question,
+                "answer": answer,
+                "chunk_ids": tuple(chunk_ids),
+                "version": version,
+                "created": time.time(),
+            }
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+            "max_items": self.max_items,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "threshold": self.threshold,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+            self._entries.clear()
+            self.hits = self.misses = self.expired = self.evicted = 0
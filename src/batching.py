@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import deque
+
+
+# Micro-batching des appels modèles (encode des requêtes, predict du cross-encoder).
+# Sous charge concurrente (serveur), chaque requête dépose ses entrées dans une file ;
+# un thread unique appelle le modèle avec tout ce qui attend. Pas d'attente quand la
+# file est vide au départ : une requête isolée part tout de suite, et celles qui
+# arrivent pendant un appel modèle forment le lot suivant.
+# Hors serveur (aucun batcher activé), dispatch() appelle directement la fonction.
+
+
+class _Pending:
+    __slots__ = ("items", "event", "result", "error")
+
+    def __init__(self, items):
+        self.items = items
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    def __init__(self, fn, max_batch: int = 64, max_wait_ms: float = 0.0, name: str = "batcher"):
+        """
+        fn          : fonction list -> séquence (ou ndarray) de même longueur
+        max_batch   : nb max d'entrées par appel à fn
+        max_wait_ms : attente max pour compléter un lot, appliquée seulement sous charge
+                      (le lot précédent regroupait plusieurs requêtes) ; 0 = jamais
+        """
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.n_calls = 0
+        self.n_items = 0
+        self.n_requests = 0
+        self._last_requests = 0  # requêtes du dernier lot : > 1 = arrivées concurrentes
+
+        self._thread = threading.Thread(target=self._loop, name=f"{name}-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, items):
+        """Bloque jusqu'au résultat (même forme que fn(items))."""
+        items = list(items)
+        if not items:
+            return self.fn(items)
+        pending = _Pending(items)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"MicroBatcher {self.name} fermé")
+            self._queue.append(pending)
+            self._cond.notify()
+        pending.event.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return []
+            # sous charge seulement, on laisse max_wait aux autres requêtes pour arriver ;
+            # une requête isolée ne paie jamais l'attente
+            deadline = time.perf_counter() + (self.max_wait if self._last_requests > 1 else 0.0)
+            while sum(len(p.items) for p in self._queue) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or self._closed:
+                    break
+                self._cond.wait(remaining)
+
+            batch, size = [], 0
+            while self._queue and (not batch or size + len(self._queue[0].items) <= self.max_batch):
+                p = self._queue.popleft()
+                batch.append(p)
+                size += len(p.items)
+            return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            items = [x for p in batch for x in p.items]
+            try:
+                out = self.fn(items)
+                start = 0
+                for p in batch:
+                    p.result = out[start:start + len(p.items)]
+                    start += len(p.items)
+            except Exception as e:  # l'erreur est renvoyée à chaque appelant du lot
+                for p in batch:
+                    p.error = e
+            self.n_calls += 1
+            self.n_items += len(items)
+            self.n_requests += len(batch)
+            self._last_requests = len(batch)
+            for p in batch:
+                p.event.set()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def stats(self):
+        return {
+            "calls": self.n_calls,
+            "requests": self.n_requests,
+            "items": self.n_items,
+            "avg_batch_items": self.n_items / self.n_calls if self.n_calls else 0.0,
+            "avg_batch_requests": self.n_requests / self.n_calls if self.n_calls else 0.0,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
+
+
+_BATCHERS = {}
+_LOCK = threading.Lock()
+
+
+def enable(name: str, fn, max_batch: int = 64, max_wait_ms: float = 0.0):
+    """Active le micro-batching pour `name` ("encode", "rerank")."""
+    with _LOCK:
+        old = _BATCHERS.pop(name, None)
+        _BATCHERS[name] = MicroBatcher(fn, max_batch=max_batch, max_wait_ms=max_wait_ms, name=name)
+    if old is not None:
+        old.close()
+    return _BATCHERS[name]
+
+
+def disable(name: str = None):
+    """Désactive un batcher (ou tous si name est None)."""
+    with _LOCK:
+        names = [name] if name else list(_BATCHERS)
+        olds = [_BATCHERS.pop(n) for n in names if n in _BATCHERS]
+    for b in olds:
+        b.close()
+
+
+def dispatch(name: str, items, fn):
+    """
+    fn(items), via le batcher `name` s'il est activé.
+    """
+    batcher = _BATCHERS.get(name)
+    if batcher is None:
+        return fn(items)
+    return batcher.submit(items)
+
+
+def stats():
+    return {name: b.stats() for name, b in _BATCHERS.items()}
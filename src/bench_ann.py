@@ -0,0 +1,109 @@
+import json
+import sys
+import time
+
+import faiss
+import numpy as np
+
+from src.index_faiss import RescoredIndex, create_index, search_index
+
+
+# Benchmark recall / latence des types d'index FAISS par rapport à l'index exact (flat).
+# Données : vecteurs synthétiques regroupés en clusters (proche de la distribution
+# des embeddings de doc) ou vecteurs d'un index existant (--from-index).
+# Index quantifiés : "rescore" = facteur de shortlist re-scorée sur des vecteurs float16
+# (taille de ces vecteurs comptée à part : ils restent sur disque, en mmap).
+
+SWEEPS = {
+    "flat": [{}],
+    "ivf_flat": [{"nprobe": n} for n in (1, 4, 8, 16, 32, 64)],
+    "hnsw": [{"ef_search": e} for e in (16, 32, 64, 128, 256)],
+    "ivf_pq": [{"nprobe": n} for n in (1, 4, 8, 16, 32, 64)],
+    "fp16": [{}],
+    "sq8": [{}, {"rescore": 2}, {"rescore": 4}],
+    "binary": [{}, {"rescore": 4}, {"rescore": 10}, {"rescore": 32}],
+}
+
+
+def synthetic_vectors(n: int, dim: int = 384, n_clusters: int = 200, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype("float32")
+    labels = rng.integers(0, n_clusters, size=n)
+    x = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+def vectors_from_index(index_path: str):
+    index = faiss.read_index(index_path)
+    x = index.reconstruct_n(0, index.ntotal)
+    faiss.normalize_L2(x)
+    return x
+
+
+def recall_at_k(found, truth, k: int):
+    hits = [len(set(f[:k]) & set(t[:k])) for f, t in zip(found, truth)]
+    return float(np.mean(hits)) / k
+
+
+def run_benchmark(x, n_queries: int = 500, k: int = 10, modes=None, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    q_idx = rng.choice(len(x), size=min(n_queries, len(x)), replace=False)
+    # requêtes bruitées autour de vecteurs du corpus
+    queries = x[q_idx] + 0.05 * rng.standard_normal((len(q_idx), x.shape[1])).astype("float32")
+    faiss.normalize_L2(queries)
+
+    flat, _ = create_index(x, "flat")
+    _, truth = flat.search(queries, k)
+    flat_bytes = int(faiss.serialize_index(flat).nbytes)
+    rescore_vectors = None
+
+    results = []
+    for mode in modes or list(SWEEPS):
+        t0 = time.perf_counter()
+        index, params = create_index(x, mode)
+        build_s = time.perf_counter() - t0
+        index_bytes = int(faiss.serialize_index(index).nbytes)
+
+        for knobs in SWEEPS[mode]:
+            knobs = dict(knobs)
+            searcher, rescore_bytes = index, 0
+            if knobs.get("rescore"):
+                if rescore_vectors is None:
+                    rescore_vectors = x.astype("float16")
+                searcher = RescoredIndex(index, rescore_vectors, k_factor=knobs.pop("rescore"))
+                rescore_bytes = int(rescore_vectors.nbytes)
+
+            t0 = time.perf_counter()
+            _, found = search_index(searcher, queries, k, **knobs)
+            elapsed = time.perf_counter() - t0
+            row = {
+                "index_type": mode,
+                "build_params": params,
+                "search_params": knobs,
+                "rescore": getattr(searcher, "k_factor", None),
+                f"recall@{k}": recall_at_k(found, truth, k),
+                "ms_per_query": 1000 * elapsed / len(queries),
+                "build_s": build_s,
+                "bytes": index_bytes,
+                "rescore_bytes": rescore_bytes,
+                "compression": flat_bytes / index_bytes,
+            }
+            results.append(row)
+            label = json.dumps(knobs) if row["rescore"] is None else f"rescore={row['rescore']}"
+            print(
+                f"{mode:9s} {label:20s} recall@{k}={row[f'recall@{k}']:.3f} "
+                f"{row['ms_per_query']:.3f} ms/q  build={build_s:.1f}s  {row['bytes'] / 1e6:.1f} Mo "
+                f"(x{row['compression']:.1f} vs flat)"
+            )
+    return {"n": len(x), "dim": int(x.shape[1]), "n_queries": len(queries), "k": k, "results": results}
+
+
+if __name__ == "__main__":
+    # usage : python -m src.bench_ann [N | chemin/index.faiss] [rapport.json]
+    arg = sys.argv[1] if len(sys.argv) > 1 else "100000"
+    x = vectors_from_index(arg) if arg.endswith(".faiss") else synthetic_vectors(int(arg))
+    report = run_benchmark(x)
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
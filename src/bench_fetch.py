@@ -0,0 +1,159 @@
+import os
+import json
+import hashlib
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.ingest import download_symfony_docs, read_download_manifest
+
+
+# Banc de test du téléchargement contre un serveur HTTP local (stdlib, port 0) :
+# arborescence de .rst imbriqués, 503 injectés sur une partie des fichiers,
+# ETag / Last-Modified -> 304. Trois passages de download_symfony_docs :
+#   1. tout est téléchargé (les 503 passent par les retries de la session)
+#   2. rien n'a changé : que des 304
+#   3. un fichier modifié côté serveur : un seul re-téléchargement
+
+
+class _Site:
+    """Fichiers servis + compteurs de réponses par statut."""
+
+    def __init__(self, files, fail_every: int):
+        self.files = dict(files)
+        self.mtime = {f: time.time() for f in self.files}
+        self.fail_every = fail_every
+        self.failed = set()
+        self.statuses = {}
+        self.lock = threading.Lock()
+
+    def set(self, path, content):
+        with self.lock:
+            self.files[path] = content
+            self.mtime[path] = time.time() + 1  # Last-Modified à la seconde près
+
+    def count(self, status):
+        with self.lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def reset_counts(self):
+        with self.lock:
+            self.statuses = {}
+
+
+def _make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, body=b"", headers=None):
+            site.count(status)
+            self.send_response(status)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.lstrip("/")
+            with site.lock:
+                content = site.files.get(path)
+                mtime = site.mtime.get(path)
+                index = sorted(site.files).index(path) if content is not None else -1
+                # premier essai en 503 pour un fichier sur fail_every
+                fail = index % site.fail_every == 0 and path not in site.failed
+                if fail:
+                    site.failed.add(path)
+            if content is None:
+                return self._reply(404)
+            if fail:
+                return self._reply(503)
+            etag = '"' + hashlib.sha1(content).hexdigest() + '"'
+            last_modified = formatdate(mtime, usegmt=True)
+            headers = {"ETag": etag, "Last-Modified": last_modified}
+            if self.headers.get("If-None-Match") == etag:
+                return self._reply(304, headers=headers)
+            since = self.headers.get("If-Modified-Since")
+            if "If-None-Match" not in self.headers and since and parsedate_to_datetime(since).timestamp() >= int(mtime):
+                return self._reply(304, headers=headers)
+            self._reply(200, content, headers)
+
+    return Handler
+
+
+def synthetic_files(n_files: int):
+    files = {}
+    for i in range(n_files):
+        sub = f"section{i % 10}/part{i % 3}/" if i % 4 else ""
+        files[f"{sub}doc{i}.rst"] = f"Doc {i}\n======\n\nTexte du document {i}.\n".encode("utf-8")
+    return files
+
+
+def run_benchmark(n_files: int = 600, fail_every: int = 10):
+    site = _Site(synthetic_files(n_files), fail_every)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(site))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    folder = tempfile.mkdtemp(prefix="bench_fetch_")
+    raw_dir = os.path.join(folder, "raw")
+    manifest_path = os.path.join(folder, "download_manifest.json")
+    files = sorted(site.files)
+    report = {"n_files": n_files}
+
+    def run(name):
+        site.reset_counts()
+        t0 = time.perf_counter()
+        counts = download_symfony_docs(files, base_url=base_url, raw_dir=raw_dir, manifest_path=manifest_path)
+        report[name] = {"seconds": time.perf_counter() - t0, "counts": counts, "http": dict(site.statuses)}
+        print(f"{name:10s}: {report[name]['seconds']:6.2f}s  {counts}  réponses HTTP {site.statuses}")
+        return counts
+
+    try:
+        counts = run("initial")
+        n_503 = len(range(0, n_files, fail_every))
+        assert counts == {"downloaded": n_files, "not_modified": 0, "error": 0}, counts
+        assert site.statuses.get(503) == n_503, site.statuses
+        on_disk = [
+            os.path.relpath(os.path.join(d, f), raw_dir).replace(os.sep, "/")
+            for d, _, names in os.walk(raw_dir) for f in names
+        ]
+        assert sorted(on_disk) == files, "arborescence téléchargée différente"
+        for f in files:
+            with open(os.path.join(raw_dir, f), "rb") as fh:
+                assert fh.read() == site.files[f], f
+        manifest = read_download_manifest(manifest_path)
+        assert sorted(manifest) == files and all(manifest[f].get("etag") for f in files)
+
+        counts = run("unchanged")
+        assert counts == {"downloaded": 0, "not_modified": n_files, "error": 0}, counts
+        assert site.statuses == {304: n_files}, site.statuses
+
+        changed = files[len(files) // 2]
+        site.set(changed, b"Doc modifie\n===========\n")
+        counts = run("one_change")
+        assert counts == {"downloaded": 1, "not_modified": n_files - 1, "error": 0}, counts
+        with open(os.path.join(raw_dir, changed), "rb") as fh:
+            assert fh.read() == site.files[changed]
+        print("OK : retries, 304 et re-téléchargement vérifiés")
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(folder, ignore_errors=True)
+    return report
+
+
+if __name__ == "__main__":
+    # usage : python -m src.bench_fetch [N_FICHIERS] [rapport.json]
+    report = run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 600)
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
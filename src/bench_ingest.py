@@ -0,0 +1,142 @@
+import os
+import re
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from src.chunking import build_all_chunks
+from src.ingest import clean_text, load_rsts, prepare_docs
+
+
+# Benchmark du prétraitement (nettoyage + chunking) sur un corpus RST synthétique :
+# ancien clean_text vs clean_text compilé, puis prepare_docs / build_all_chunks
+# en séquentiel et avec un pool de processus (sorties comparées au séquentiel).
+
+WORDS = (
+    "symfony route controller service container bundle cache http request response "
+    "form validation doctrine entity repository messenger handler event listener "
+    "security firewall voter twig template console command config yaml php attribute"
+).split()
+
+
+def _sentence(rng, n):
+    out = []
+    for _ in range(n):
+        r = rng.random()
+        w = rng.choice(WORDS)
+        if r < 0.05:
+            out.append(f":ref:`{w} <{w}-ref>`")
+        elif r < 0.10:
+            out.append(f"``{w}()``")
+        elif r < 0.12:
+            out.append(f":class:`{w.title()}`")
+        else:
+            out.append(w)
+    return " ".join(out)
+
+
+def synthetic_rst(rng, n_sections: int = 8):
+    parts = []
+    title = _sentence(rng, 4).title()
+    parts += [title, "=" * len(title), ""]
+    for _ in range(n_sections):
+        sec = _sentence(rng, 3).title()
+        parts += [sec, "-" * len(sec), ""]
+        for _ in range(rng.randint(2, 5)):
+            parts += [_sentence(rng, rng.randint(20, 60)), ""]
+        if rng.random() < 0.5:
+            parts += [".. code-block:: php", "", "    $" + rng.choice(WORDS) + " = new Foo();", ""]
+        if rng.random() < 0.3:
+            parts += [".. note::", "", "    " + _sentence(rng, 15), ""]
+    return "\n".join(parts)
+
+
+def write_corpus(folder: str, n_files: int = 3000, seed: int = 0):
+    rng = random.Random(seed)
+    for i in range(n_files):
+        sub = f"section{i % 20}" if i % 4 else ""
+        path = os.path.join(folder, sub, f"doc{i}.rst")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(synthetic_rst(rng))
+
+
+def clean_text_legacy(text: str) -> str:
+    # version précédente de ingest.clean_text (plusieurs passes, regex non compilées),
+    # gardée ici comme référence de vitesse et de résultat
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    lines = text.split("\n")
+    cleaned_lines = []
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith(".. "):
+            continue
+        if stripped and len(stripped) >= 3 and set(stripped) <= set("=~`-^\"'*+_#-"):
+            continue
+        cleaned_lines.append(line)
+    cleaned = "\n".join(cleaned_lines)
+    cleaned = re.sub(r":\w+:`([^`<]+)(?:<[^`]+>)?`", r"\1", cleaned)
+    cleaned = re.sub(r"``([^`]+)``", r"\1", cleaned)
+    final_lines = []
+    for line in cleaned.split("\n"):
+        line = re.sub(r"\s+", " ", line).strip()
+        final_lines.append(line)
+    final_text = "\n".join(final_lines)
+    final_text = re.sub(r"\n{3,}", "\n\n", final_text)
+    return final_text.strip()
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def run_benchmark(n_files: int = 3000, workers_list=None):
+    workers_list = workers_list or sorted({2, 4, os.cpu_count() or 1} - {1})
+    folder = tempfile.mkdtemp(prefix="bench_ingest_")
+    report = {"n_files": n_files, "cpu_count": os.cpu_count()}
+    try:
+        _, t = _timed(lambda: write_corpus(folder, n_files))
+        print(f"Corpus synthétique : {n_files} fichiers ({t:.1f}s)")
+
+        raw, t = _timed(lambda: load_rsts(folder))
+        report["load_s"] = t
+        report["mb"] = sum(len(d["text"]) for d in raw) / 1e6
+        print(f"load_rsts          : {t:6.2f}s  ({report['mb']:.1f} Mo)")
+
+        texts = [d["text"] for d in raw]
+        legacy, t_old = _timed(lambda: [clean_text_legacy(t) for t in texts])
+        new, t_new = _timed(lambda: [clean_text(t) for t in texts])
+        report["clean_text"] = {"legacy_s": t_old, "new_s": t_new, "identical": legacy == new}
+        print(f"clean_text         : {t_old:6.2f}s -> {t_new:6.2f}s  (x{t_old / t_new:.1f}, identique={legacy == new})")
+
+        def fresh():
+            return [{"id": d["id"], "path": d["path"], "text": d["text"]} for d in raw]
+
+        ref_docs, t = _timed(lambda: prepare_docs(fresh(), workers=1))
+        ref_chunks, t_chunk = _timed(lambda: build_all_chunks(ref_docs, workers=1))
+        report["serial"] = {"prepare_s": t, "chunk_s": t_chunk}
+        print(f"séquentiel         : prepare {t:6.2f}s  chunks {t_chunk:6.2f}s")
+
+        report["pool"] = []
+        for w in workers_list:
+            docs, t = _timed(lambda: prepare_docs(fresh(), workers=w))
+            chunks, t_chunk = _timed(lambda: build_all_chunks(docs, workers=w))
+            same = docs == ref_docs and chunks == ref_chunks
+            report["pool"].append({"workers": w, "prepare_s": t, "chunk_s": t_chunk, "identical": same})
+            print(f"{w:2d} processus       : prepare {t:6.2f}s  chunks {t_chunk:6.2f}s  (identique={same})")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return report
+
+
+if __name__ == "__main__":
+    # usage : python -m src.bench_ingest [N_FICHIERS] [rapport.json]
+    report = run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 3000)
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
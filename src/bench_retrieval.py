@@ -0,0 +1,407 @@
+import os
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+from src import config
+from src.chunk_store import ChunkStore, ChunkStoreWriter, chunk_faiss_id
+from src.index_faiss import _encode_texts, _save_index, store_prefix, write_bm25
+from src.pipeline import IndexSink
+
+
+# Benchmark latence / débit de retrieve() sur des corpus synthétiques de taille croissante.
+#
+# Pour chaque taille, le corpus est écrit dans un dossier temporaire avec les mêmes
+# fichiers qu'un vrai build (chunk stores, index FAISS, BM25), puis mesuré dans un
+# processus neuf lancé dans ce dossier (config.INDEX_DIR est relatif) :
+#   - démarrage à froid (import + warmup) et pic RSS
+#   - p50 / p95 / p99 par stratégie, avec et sans rerank (requêtes toutes différentes,
+#     caches de requêtes et de rerank vidés : on mesure le calcul, pas les caches)
+#   - QPS à plusieurs niveaux de concurrence, sans puis avec le micro-batching de src.server
+#   - ask_rag de bout en bout contre le stub LLM local (jamais d'appel réseau)
+# Par défaut, embedder et cross-encoder factices (--model : modèles de config).
+#
+#   python -m src.bench_retrieval [1000,10000,100000] [rapport.json] [--model]
+
+STRATEGIES = ["fixed", "semantic", "bm25", "hybrid", "parent_child"]
+CONCURRENCY = [1, 4, 16]
+CHUNKS_PER_DOC = 10  # voisins pour parent_child
+WORDS_PER_CHUNK = 60
+N_TOPICS = 200
+VOCAB_SIZE = 5000
+TOPIC_WORDS = 40
+
+
+# ----------------------------
+# Modèles factices (déterministes, sans torch)
+# ----------------------------
+
+def _word_vector(word: str, dim: int):
+    rng = np.random.default_rng(zlib.crc32(word.encode("utf-8")))
+    return rng.standard_normal(dim).astype("float32")
+
+
+class HashEmbedder:
+    """
+    Embedding = somme normalisée de vecteurs aléatoires fixes par mot.
+    Des textes qui partagent des mots sont proches, comme avec un vrai modèle.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self._vectors = {}
+
+    def vector(self, word):
+        v = self._vectors.get(word)
+        if v is None:
+            v = self._vectors[word] = _word_vector(word, self.dim)
+        return v
+
+    def encode(self, texts, convert_to_numpy: bool = True, **kwargs):
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, text in enumerate(texts):
+            for w in text.lower().split():
+                out[i] += self.vector(w)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+
+class OverlapCrossEncoder:
+    """Score = nb de mots de la question présents dans le texte."""
+
+    def predict(self, pairs, **kwargs):
+        return np.asarray(
+            [len(set(q.lower().split()) & set(t.lower().split())) for q, t in pairs],
+            dtype="float32",
+        )
+
+
+def install_fake_models():
+    from src import resources
+    resources._RESOURCES["embedding_model"] = HashEmbedder()
+    resources._RESOURCES["cross_encoder"] = OverlapCrossEncoder()
+
+
+# ----------------------------
+# Corpus synthétique
+# ----------------------------
+
+def _vocab():
+    return np.asarray([f"w{i:04d}" for i in range(VOCAB_SIZE)])
+
+
+def _topic_words(seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, VOCAB_SIZE, size=(N_TOPICS, TOPIC_WORDS))
+
+
+def synthetic_word_ids(n: int, seed: int = 0):
+    """
+    (ids de mots (n, WORDS_PER_CHUNK), sujet de chaque chunk).
+    Un document = CHUNKS_PER_DOC chunks du même sujet ; 70 % des mots viennent du sujet.
+    """
+    rng = np.random.default_rng(seed + 1)
+    topics = _topic_words(seed)
+    doc_topic = rng.integers(0, N_TOPICS, size=n // CHUNKS_PER_DOC + 1)
+    chunk_topic = doc_topic[np.arange(n) // CHUNKS_PER_DOC]
+    from_topic = topics[chunk_topic[:, None], rng.integers(0, TOPIC_WORDS, size=(n, WORDS_PER_CHUNK))]
+    background = rng.integers(0, VOCAB_SIZE, size=(n, WORDS_PER_CHUNK))
+    ids = np.where(rng.random((n, WORDS_PER_CHUNK)) < 0.7, from_topic, background)
+    return ids, chunk_topic
+
+
+def synthetic_queries(n: int, seed: int = 0, offset: int = 0, n_words: int = 6):
+    """Requêtes de n_words mots d'un même sujet ; offset : autre jeu, sans doublons avec le premier."""
+    rng = np.random.default_rng(seed + 1000 + offset)
+    topics = _topic_words(seed)
+    vocab = _vocab()
+    t = rng.integers(0, N_TOPICS, size=n)
+    words = topics[t[:, None], rng.integers(0, TOPIC_WORDS, size=(n, n_words))]
+    return [f"{' '.join(vocab[w])} q{offset}_{i}" for i, w in enumerate(words)]
+
+
+def write_corpus(folder: str, n: int, fake: bool = True, seed: int = 0, batch_size: int = 10000):
+    """
+    Écrit index/ dans folder : stores + index FAISS flat fixed (copiés pour semantic
+    et structured) + BM25. Retourne les durées de construction.
+    """
+    index_dir = os.path.join(folder, "index")
+    os.makedirs(index_dir, exist_ok=True)
+    vocab = _vocab()
+    ids, chunk_topic = synthetic_word_ids(n, seed)
+    timings = {}
+
+    t0 = time.perf_counter()
+    if fake:
+        embedder = HashEmbedder()
+        word_vectors = np.stack([embedder.vector(w) for w in vocab])
+    meta_path = os.path.join(index_dir, "meta_fixed.jsonl")
+    writer = ChunkStoreWriter(store_prefix(meta_path))
+    sink = IndexSink("flat")
+    for start in range(0, n, batch_size):
+        batch_ids = ids[start:start + batch_size]
+        batch_texts = [" ".join(vocab[row]) for row in batch_ids]
+        chunk_ids = []
+        for j, text in enumerate(batch_texts):
+            i = start + j
+            doc = i // CHUNKS_PER_DOC
+            chunk = {
+                "chunk_id": f"doc{doc}.rst_fixed_{i % CHUNKS_PER_DOC}",
+                "source": f"doc{doc}.rst",
+                "text": text,
+                "title": f"Document {doc}",
+                "category": f"topic{chunk_topic[i]}",
+            }
+            writer.add(chunk)
+            chunk_ids.append(chunk["chunk_id"])
+        if fake:
+            # même calcul que HashEmbedder.encode, vectorisé sur les ids de mots
+            # (colonne par colonne : pas de tableau (lot, mots, dim) en mémoire)
+            emb = np.zeros((len(batch_ids), word_vectors.shape[1]), dtype="float32")
+            for j in range(batch_ids.shape[1]):
+                emb += word_vectors[batch_ids[:, j]]
+            emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+        else:
+            emb = _encode_texts(batch_texts, show_progress_bar=False)
+        sink.add(np.ascontiguousarray(emb, dtype="float32"), [chunk_faiss_id(c) for c in chunk_ids])
+    writer.close()
+    index, params = sink.finish()
+    index_path = os.path.join(index_dir, "index_fixed.faiss")
+    _save_index(index, index_path, "flat", params)
+    timings["store_and_index_s"] = time.perf_counter() - t0
+
+    # semantic / structured : mêmes fichiers (même taille de corpus, même coût de recherche)
+    for mode in ("semantic", "structured"):
+        shutil.copyfile(index_path, os.path.join(index_dir, f"index_{mode}.faiss"))
+        shutil.copyfile(index_path + ".json", os.path.join(index_dir, f"index_{mode}.faiss.json"))
+        for name in os.listdir(index_dir):
+            if name.startswith("meta_fixed."):
+                shutil.copyfile(os.path.join(index_dir, name), os.path.join(index_dir, name.replace("fixed", mode, 1)))
+
+    t0 = time.perf_counter()
+    # textes relus depuis le store mmap (un à la fois), comme src.pipeline
+    write_bm25(ChunkStore.open(store_prefix(meta_path)), os.path.join(index_dir, "bm25_fixed"))
+    timings["bm25_s"] = time.perf_counter() - t0
+    timings["disk_mb"] = sum(
+        os.path.getsize(os.path.join(index_dir, f)) for f in os.listdir(index_dir)
+    ) / 1e6
+    return timings
+
+
+# ----------------------------
+# Mesures (processus enfant)
+# ----------------------------
+
+def percentiles(latencies_s):
+    x = np.asarray(latencies_s) * 1000.0
+    return {
+        "n": int(len(x)),
+        "mean_ms": float(x.mean()),
+        "p50_ms": float(np.percentile(x, 50)),
+        "p95_ms": float(np.percentile(x, 95)),
+        "p99_ms": float(np.percentile(x, 99)),
+    }
+
+
+def rss_mb():
+    """Pic RSS du processus en Mo."""
+    # VmHWM plutôt que ru_maxrss : sous Linux, ru_maxrss d'un processus lancé
+    # par subprocess part du pic du parent au moment du fork
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _clear_caches():
+    from src import resources
+    from src.rerank import SCORE_CACHE
+    resources.get_query_cache().clear()
+    SCORE_CACHE.clear()
+
+
+def _query_fn(strategy: str, rerank: bool):
+    from src.rag import retrieve_for_rag
+    from src.rerank import rerank_with_cross_encoder
+    from src.retrieval import retrieve
+
+    if not rerank:
+        return lambda q: retrieve(q, k=5, strategy=strategy)
+    return lambda q: rerank_with_cross_encoder(q, retrieve_for_rag(q, strategy=strategy), k=5)
+
+
+def measure_latency(fn, queries, n_warmup: int = 5):
+    for q in queries[:n_warmup]:
+        fn(q)
+    latencies = []
+    for q in queries[n_warmup:]:
+        t0 = time.perf_counter()
+        fn(q)
+        latencies.append(time.perf_counter() - t0)
+    return percentiles(latencies)
+
+
+def measure_qps(fn, queries, concurrency: int):
+    from concurrent.futures import ThreadPoolExecutor
+
+    latencies = [0.0] * len(queries)
+
+    def timed(i):
+        t0 = time.perf_counter()
+        fn(queries[i])
+        latencies[i] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        list(ex.map(timed, range(len(queries))))
+    elapsed = time.perf_counter() - t0
+    return {"concurrency": concurrency, "qps": len(queries) / elapsed, **percentiles(latencies)}
+
+
+def run_child(args: dict):
+    """Mesures dans le processus courant (cwd = dossier du corpus)."""
+    out = {}
+    t0 = time.perf_counter()
+    from src import rag, resources
+    from src.server import enable_batching
+    from src import batching
+    out["import_s"] = time.perf_counter() - t0
+
+    if args["fake"]:
+        install_fake_models()
+    t0 = time.perf_counter()
+    resources.warmup(args["strategies"], rerank=True)
+    out["warmup_s"] = time.perf_counter() - t0
+    out["cold_start_s"] = out["import_s"] + out["warmup_s"]
+    out["rss_after_warmup_mb"] = rss_mb()
+
+    n_q, seed = args["n_queries"], args["seed"]
+    out["strategies"] = {}
+    offset = 0
+    for strategy in args["strategies"]:
+        out["strategies"][strategy] = {}
+        for rerank in (False, True):
+            fn = _query_fn(strategy, rerank)
+            _clear_caches()
+            offset += 1
+            row = {"latency": measure_latency(fn, synthetic_queries(n_q + 5, seed, offset)), "throughput": []}
+            for batched in (False, True):
+                if batched:
+                    enable_batching()
+                for c in args["concurrency"]:
+                    _clear_caches()
+                    offset += 1
+                    row["throughput"].append(
+                        dict(measure_qps(fn, synthetic_queries(n_q, seed, offset), c), batching=batched)
+                    )
+                batching.disable()
+            out["strategies"][strategy]["rerank" if rerank else "no_rerank"] = row
+
+    # bout en bout, LLM = stub local
+    from src.llm_stub import serve_stub
+    server, url = serve_stub(0)
+    os.environ["GROQ_BASE_URL"] = url
+    os.environ["GROQ_API_KEY"] = "stub"
+    rag._client = None
+    try:
+        _clear_caches()
+        offset += 1
+        ask = lambda q: rag.ask_rag(q, k=5, strategy="hybrid", use_rerank=True, use_cache=False)
+        out["ask_hybrid_rerank"] = measure_latency(ask, synthetic_queries(min(n_q, 50) + 5, seed, offset))
+    finally:
+        server.shutdown()
+        rag._client = None
+
+    out["peak_rss_mb"] = rss_mb()
+    return out
+
+
+_CHILD = r"""
+import json, sys
+from src.bench_retrieval import run_child
+print(json.dumps(run_child(json.loads(sys.argv[1]))))
+"""
+
+
+def run_size(n: int, strategies=None, n_queries: int = 200, concurrency=None, fake: bool = True, seed: int = 0):
+    folder = tempfile.mkdtemp(prefix=f"bench_retrieval_{n}_")
+    try:
+        t0 = time.perf_counter()
+        build = write_corpus(folder, n, fake=fake, seed=seed)
+        build["total_s"] = time.perf_counter() - t0
+
+        args = {
+            "strategies": strategies or STRATEGIES,
+            "n_queries": n_queries,
+            "concurrency": concurrency or CONCURRENCY,
+            "fake": fake,
+            "seed": seed,
+        }
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+        proc = subprocess.run(
+            [sys.executable, "-c", _CHILD, json.dumps(args)],
+            cwd=folder, env=env, capture_output=True, text=True, check=True,
+        )
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        return {"n_chunks": n, "build": build, **result}
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def print_size(r):
+    print(
+        f"\n=== {r['n_chunks']} chunks | build {r['build']['total_s']:.1f}s | "
+        f"démarrage à froid {r['cold_start_s']:.2f}s | pic RSS {r['peak_rss_mb']:.0f} Mo"
+    )
+    for strategy, rows in r["strategies"].items():
+        for mode, row in rows.items():
+            lat = row["latency"]
+            qps = "  ".join(
+                f"c={t['concurrency']}{'b' if t['batching'] else ''}:{t['qps']:.0f}" for t in row["throughput"]
+            )
+            print(
+                f"{strategy:13s} {mode:9s} p50={lat['p50_ms']:7.2f} p95={lat['p95_ms']:7.2f} "
+                f"p99={lat['p99_ms']:7.2f} ms | QPS {qps}"
+            )
+    ask = r["ask_hybrid_rerank"]
+    print(f"{'ask (stub)':13s} {'rerank':9s} p50={ask['p50_ms']:7.2f} p95={ask['p95_ms']:7.2f} p99={ask['p99_ms']:7.2f} ms")
+
+
+def run_benchmark(sizes=(1000, 10000, 100000), strategies=None, n_queries: int = 200, concurrency=None,
+                  fake: bool = True, seed: int = 0, save_path: str = None):
+    report = {
+        "model": "fake" if fake else config.MODEL_NAME,
+        "cross_encoder": "fake" if fake else config.CROSS_ENCODER_MODEL,
+        "cpu_count": os.cpu_count(),
+        "n_queries": n_queries,
+        "results": [],
+    }
+    for n in sizes:
+        r = run_size(n, strategies=strategies, n_queries=n_queries, concurrency=concurrency, fake=fake, seed=seed)
+        print_size(r)
+        report["results"].append(r)
+
+    if save_path:
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    # usage : python -m src.bench_retrieval [TAILLES] [rapport.json] [--model]
+    flags = {a for a in sys.argv[1:] if a.startswith("--")}
+    positional = [a for a in sys.argv[1:] if not a.startswith("--")]
+    sizes = [int(s) for s in positional[0].split(",")] if positional else [1000, 10000, 100000]
+    run_benchmark(sizes, fake="--model" not in flags, save_path=positional[1] if len(positional) > 1 else None)
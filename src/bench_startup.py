@@ -0,0 +1,67 @@
+import json
+import subprocess
+import sys
+
+
+# Benchmark de démarrage à froid : chaque mesure tourne dans un processus neuf
+# pour que rien ne soit déjà en mémoire.
+
+_CHILD = r"""
+import json, resource, sys, time
+
+def rss_mb():
+    # ru_maxrss est en Ko sous Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+steps = []
+t0 = time.perf_counter()
+import src.rag
+steps.append({"step": "import src.rag", "seconds": time.perf_counter() - t0, "peak_rss_mb": rss_mb()})
+
+from src import resources
+strategies = [s for s in sys.argv[1].split(",") if s]
+rerank = sys.argv[2] == "1"
+if strategies or rerank:
+    t0 = time.perf_counter()
+    resources.warmup(strategies, rerank=rerank)
+    steps.append({"step": "warmup", "seconds": time.perf_counter() - t0, "peak_rss_mb": rss_mb()})
+
+print(json.dumps({"loaded": resources.loaded(), "steps": steps}))
+"""
+
+SCENARIOS = [
+    ("import_only", [], False),
+    ("bm25", ["bm25"], False),
+    ("fixed", ["fixed"], False),
+    ("hybrid", ["hybrid"], False),
+    ("hybrid_rerank", ["hybrid"], True),
+    ("all", ["fixed", "semantic", "bm25", "hybrid", "parent_child"], True),
+]
+
+
+def run_scenario(strategies, rerank):
+    out = subprocess.run(
+        [sys.executable, "-c", _CHILD, ",".join(strategies), "1" if rerank else "0"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def run_benchmark(save_path: str = None):
+    report = {}
+    for name, strategies, rerank in SCENARIOS:
+        report[name] = run_scenario(strategies, rerank)
+        steps = report[name]["steps"]
+        total = sum(s["seconds"] for s in steps)
+        print(f"{name:15s} | {total:7.2f}s | peak RSS {steps[-1]['peak_rss_mb']:8.1f} Mo | {report[name]['loaded']}")
+
+    if save_path:
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    run_benchmark(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,207 @@
+import os
+import json
+from collections import Counter
+
+import numpy as np
+
+
+# Index inversé BM25 précalculé (mêmes scores que rank_bm25.BM25Okapi).
+# Pour chaque terme on stocke ses postings (doc, impact) où
+# impact = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)).
+# Une requête ne lit donc que les postings de ses termes.
+#
+# Fichiers ({prefix}.*) :
+#   vocab.json    terme -> id
+#   offsets.npy   int64 (V + 1), postings du terme t = [offsets[t], offsets[t+1])
+#   postings.npy  int32, numéro de ligne du document
+#   impacts.npy   float32, contribution BM25 précalculée
+#   meta.json     n_docs, fingerprint (empreinte du chunk store indexé), k1, b, epsilon, avgdl
+
+
+def tokenize(text: str):
+    # même tokenisation que l'ancien BM25Okapi (doc.split())
+    return text.split()
+
+
+class BM25Index:
+    def __init__(self, vocab, offsets, postings, impacts, n_docs, params=None, fingerprint=None):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.postings = postings
+        self.impacts = impacts
+        self.n_docs = int(n_docs)
+        self.params = params or {}
+        self.fingerprint = fingerprint  # ChunkStore.fingerprint() du corpus indexé
+
+    # ----------------------------
+    # Construction
+    # ----------------------------
+    @classmethod
+    def build(cls, tokenized_corpus, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        """tokenized_corpus : liste ou itérable (générateur) de listes de tokens."""
+        vocab = {}
+        term_col, doc_col, tf_col = [], [], []
+        doc_len = []
+
+        for d, tokens in enumerate(tokenized_corpus):
+            doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                tid = vocab.setdefault(term, len(vocab))
+                term_col.append(tid)
+                doc_col.append(d)
+                tf_col.append(tf)
+
+        doc_len = np.asarray(doc_len, dtype=np.float64)
+        n_docs = len(doc_len)
+        n_terms = len(vocab)
+        term_col = np.asarray(term_col, dtype=np.int64)
+        doc_col = np.asarray(doc_col, dtype=np.int32)
+        tf_col = np.asarray(tf_col, dtype=np.float64)
+
+        # idf comme BM25Okapi : idf négatifs remplacés par epsilon * idf moyen
+        df = np.bincount(term_col, minlength=n_terms).astype(np.float64)
+        idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+        if n_terms:
+            idf[idf < 0] = epsilon * idf.mean()
+
+        avgdl = float(doc_len.mean()) if n_docs else 0.0
+        norm = k1 * (1 - b + b * doc_len[doc_col] / avgdl) if avgdl else np.full(len(doc_col), k1)
+        impacts = idf[term_col] * tf_col * (k1 + 1) / (tf_col + norm)
+
+        # regrouper les postings par terme
+        order = np.argsort(term_col, kind="stable")
+        offsets = np.zeros(n_terms + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(df.astype(np.int64))
+
+        params = {"k1": k1, "b": b, "epsilon": epsilon, "avgdl": avgdl}
+        return cls(
+            vocab,
+            offsets,
+            doc_col[order],
+            impacts[order].astype(np.float32),
+            n_docs,
+            params,
+        )
+
+    @classmethod
+    def from_texts(cls, texts, **kwargs):
+        # générateur : un seul texte tokenisé en mémoire à la fois
+        return cls.build((tokenize(t) for t in texts), **kwargs)
+
+    # ----------------------------
+    # Persistance
+    # ----------------------------
+    def save(self, prefix: str):
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        with open(prefix + ".vocab.json", "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        np.save(prefix + ".offsets.npy", np.asarray(self.offsets))
+        np.save(prefix + ".postings.npy", np.asarray(self.postings))
+        np.save(prefix + ".impacts.npy", np.asarray(self.impacts))
+        with open(prefix + ".meta.json", "w", encoding="utf-8") as f:
+            json.dump({"n_docs": self.n_docs, "fingerprint": self.fingerprint, **self.params}, f)
+
+    @classmethod
+    def load(cls, prefix: str, mmap: bool = True):
+        mode = "r" if mmap else None
+        with open(prefix + ".vocab.json", "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        with open(prefix + ".meta.json", "r", encoding="utf-8") as f:
+            params = json.load(f)
+        n_docs = params.pop("n_docs")
+        fingerprint = params.pop("fingerprint", None)
+        return cls(
+            vocab,
+            np.load(prefix + ".offsets.npy", mmap_mode=mode),
+            np.load(prefix + ".postings.npy", mmap_mode=mode),
+            np.load(prefix + ".impacts.npy", mmap_mode=mode),
+            n_docs,
+            params,
+            fingerprint,
+        )
+
+    @staticmethod
+    def exists(prefix: str) -> bool:
+        return all(
+            os.path.exists(prefix + ext)
+            for ext in (".vocab.json", ".offsets.npy", ".postings.npy", ".impacts.npy", ".meta.json")
+        )
+
+    # ----------------------------
+    # Requêtes
+    # ----------------------------
+    def _gather(self, tokens):
+        """Postings (docs, impacts) de tous les termes de la requête."""
+        docs, impacts = [], []
+        for tok in tokens:
+            tid = self.vocab.get(tok)
+            if tid is None:
+                continue
+            start, end = self.offsets[tid], self.offsets[tid + 1]
+            docs.append(self.postings[start:end])
+            impacts.append(self.impacts[start:end])
+        if not docs:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        return np.concatenate(docs), np.concatenate(impacts)
+
+    def top_k(self, tokens, k: int = 5):
+        """
+        Retourne (lignes, scores) des k meilleurs documents, triés par score décroissant.
+        Seuls les documents contenant au moins un terme de la requête sont retournés.
+        """
+        docs, impacts = self._gather(tokens)
+        if len(docs) == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        rows, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=impacts).astype(np.float32)
+
+        if len(scores) > k:
+            part = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[part], scores[part]
+        order = np.argsort(-scores, kind="stable")
+        return rows[order].astype(np.int64), scores[order]
+
+    def top_k_many(self, token_lists, k: int = 5):
+        """
+        top_k pour plusieurs requêtes en un seul passage : les postings de toutes
+        les requêtes sont agrégés ensemble sur la clé (requête, document).
+        Retourne une liste [(lignes, scores)] dans l'ordre des requêtes.
+        """
+        keys, impacts = [], []
+        for qi, tokens in enumerate(token_lists):
+            docs, imp = self._gather(tokens)
+            keys.append(docs.astype(np.int64) + qi * self.n_docs)
+            impacts.append(imp)
+
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        n_queries = len(token_lists)
+        if not n_queries:
+            return []
+        keys = np.concatenate(keys)
+        if len(keys) == 0 or k <= 0:
+            return [empty] * n_queries
+
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(impacts)).astype(np.float32)
+        query_of = uniq // self.n_docs
+        bounds = np.searchsorted(query_of, np.arange(n_queries + 1))
+
+        results = []
+        for qi in range(n_queries):
+            start, end = bounds[qi], bounds[qi + 1]
+            rows = uniq[start:end] - qi * self.n_docs
+            q_scores = scores[start:end]
+            if len(q_scores) > k:
+                part = np.argpartition(-q_scores, k - 1)[:k]
+                rows, q_scores = rows[part], q_scores[part]
+            order = np.argsort(-q_scores, kind="stable")
+            results.append((rows[order], q_scores[order]))
+        return results
+
+    def get_scores(self, tokens):
+        """Scores de tous les documents (compatible BM25Okapi.get_scores)."""
+        scores = np.zeros(self.n_docs, dtype=np.float64)
+        docs, impacts = self._gather(tokens)
+        np.add.at(scores, docs, impacts)
+        return scores
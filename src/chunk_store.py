@@ -0,0 +1,287 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+
+
+# Stockage colonne des chunks (remplace la liste de dicts JSON en mémoire).
+#
+# Fichiers ({prefix}.*) :
+#   text.bin / text_offsets.npy   blob UTF-8 de tous les textes + offsets int64 (N + 1)
+#   ids.bin / ids_offsets.npy     idem pour les chunk_id
+#   {champ}.npy                   int32, indice dans la table internée (-1 = None)
+#   position.npy                  int32, position du chunk dans sa source (-1 = inconnue)
+#   faiss_id.npy                  int64, id stable du vecteur dans l'index FAISS (hash du chunk_id)
+#   tables.json                   n, champs internés et leurs tables de chaînes
+#
+# Les blobs et colonnes sont lus en mmap : un texte n'est décodé que
+# lorsqu'on le demande (hits finaux), et plusieurs processus partagent les pages.
+
+INTERNED_FIELDS = ("source", "title", "category")
+
+
+def chunk_position(meta):
+    """
+    Position du chunk dans son document source.
+    chunk_id format expected: {source}_{suffix}_{idx}  e.g. routing.rst_fixed_19
+    """
+    if meta.get("position") is not None:
+        return int(meta["position"])
+    try:
+        return int(meta.get("chunk_id", "").split("_")[-1])
+    except (ValueError, AttributeError):
+        return None
+
+
+def chunk_faiss_id(chunk_id: str) -> int:
+    """
+    Id FAISS stable d'un chunk (60 bits du sha1 du chunk_id, donc int64 positif) :
+    reste le même d'un build à l'autre, ce qui permet les mises à jour incrémentales.
+    """
+    return int(hashlib.sha1((chunk_id or "").encode("utf-8")).hexdigest()[:15], 16)
+
+
+class ChunkStoreWriter:
+    """
+    Écriture en flux : add(chunk) ajoute le texte au blob sur disque,
+    seules les colonnes entières restent en mémoire jusqu'à close().
+    """
+
+    def __init__(self, prefix: str, interned_fields=INTERNED_FIELDS):
+        self.prefix = prefix
+        self.interned_fields = tuple(interned_fields)
+        self._tables = {f: [] for f in self.interned_fields}
+        self._table_idx = {f: {} for f in self.interned_fields}
+        self._columns = {f: [] for f in self.interned_fields}
+        self._positions = []
+        self._faiss_ids = []
+        self._text_offsets = [0]
+        self._id_offsets = [0]
+
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        self._text_f = open(prefix + ".text.bin.tmp", "wb")
+        self._ids_f = open(prefix + ".ids.bin.tmp", "wb")
+
+    def _intern(self, field, value):
+        if value is None:
+            return -1
+        idx = self._table_idx[field].get(value)
+        if idx is None:
+            idx = len(self._tables[field])
+            self._table_idx[field][value] = idx
+            self._tables[field].append(value)
+        return idx
+
+    def add(self, chunk):
+        text = chunk["text"].encode("utf-8")
+        cid = (chunk.get("chunk_id") or "").encode("utf-8")
+        self._text_f.write(text)
+        self._ids_f.write(cid)
+        self._text_offsets.append(self._text_offsets[-1] + len(text))
+        self._id_offsets.append(self._id_offsets[-1] + len(cid))
+
+        for f in self.interned_fields:
+            self._columns[f].append(self._intern(f, chunk.get(f)))
+        pos = chunk_position(chunk)
+        self._positions.append(-1 if pos is None else pos)
+        self._faiss_ids.append(chunk_faiss_id(chunk.get("chunk_id")))
+
+    def __len__(self):
+        return len(self._positions)
+
+    def close(self):
+        self._text_f.close()
+        self._ids_f.close()
+        p = self.prefix
+        arrays = {
+            "text_offsets": np.asarray(self._text_offsets, dtype=np.int64),
+            "ids_offsets": np.asarray(self._id_offsets, dtype=np.int64),
+            "position": np.asarray(self._positions, dtype=np.int32),
+            "faiss_id": np.asarray(self._faiss_ids, dtype=np.int64),
+        }
+        for f in self.interned_fields:
+            arrays[f] = np.asarray(self._columns[f], dtype=np.int32)
+
+        # tout est écrit en .tmp puis renommé : un lecteur ne voit jamais un store à moitié écrit
+        for name, arr in arrays.items():
+            with open(f"{p}.{name}.npy.tmp", "wb") as fh:
+                np.save(fh, arr)
+        with open(p + ".tables.json.tmp", "w", encoding="utf-8") as fh:
+            json.dump({"n": len(self), "fields": list(self.interned_fields), "tables": self._tables}, fh, ensure_ascii=False)
+
+        for name in arrays:
+            os.replace(f"{p}.{name}.npy.tmp", f"{p}.{name}.npy")
+        os.replace(p + ".text.bin.tmp", p + ".text.bin")
+        os.replace(p + ".ids.bin.tmp", p + ".ids.bin")
+        os.replace(p + ".tables.json.tmp", p + ".tables.json")
+        return p
+
+    def abort(self):
+        """Abandonne l'écriture : le store existant (s'il y en a un) reste intact."""
+        self._text_f.close()
+        self._ids_f.close()
+        for tmp in (self.prefix + ".text.bin.tmp", self.prefix + ".ids.bin.tmp"):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_chunk_store(chunks, prefix: str, interned_fields=None):
+    """interned_fields=None : INTERNED_FIELDS, plus "section" pour les chunks structurés."""
+    if interned_fields is None:
+        interned_fields = INTERNED_FIELDS
+        if chunks and "section" in chunks[0]:
+            interned_fields += ("section",)
+    with ChunkStoreWriter(prefix, interned_fields) as writer:
+        for c in chunks:
+            writer.add(c)
+    return prefix
+
+
+def add_faiss_id_column(prefix: str):
+    """
+    Ajoute faiss_id.npy aux stores écrits avant cette colonne : sinon chaque
+    processus qui ouvre le store recalcule les hash de tous les chunk_id.
+    """
+    path = prefix + ".faiss_id.npy"
+    if os.path.exists(path):
+        return False
+    store = ChunkStore.open(prefix)
+    with open(path + ".tmp", "wb") as fh:
+        np.save(fh, np.asarray(store.faiss_ids, dtype=np.int64))
+    os.replace(path + ".tmp", path)
+    return True
+
+
+def _blob(path, mmap: bool):
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=np.uint8)
+    if mmap:
+        return np.memmap(path, dtype=np.uint8, mode="r")
+    return np.fromfile(path, dtype=np.uint8)
+
+
+class ChunkStore:
+    def __init__(self, text_blob, text_offsets, id_blob, id_offsets, columns, positions, tables, faiss_ids=None):
+        self.text_blob = text_blob
+        self.text_offsets = text_offsets
+        self.id_blob = id_blob
+        self.id_offsets = id_offsets
+        self.columns = columns
+        self.positions = positions
+        self.tables = tables
+        self.fields = tuple(columns)
+        if faiss_ids is None:
+            faiss_ids = np.asarray([chunk_faiss_id(c) for c in self.chunk_ids()], dtype=np.int64)
+        self.faiss_ids = faiss_ids
+
+    @staticmethod
+    def exists(prefix: str) -> bool:
+        return os.path.exists(prefix + ".tables.json")
+
+    @classmethod
+    def open(cls, prefix: str, mmap: bool = True):
+        mode = "r" if mmap else None
+        with open(prefix + ".tables.json", "r", encoding="utf-8") as f:
+            info = json.load(f)
+        fields = info["fields"]
+        return cls(
+            _blob(prefix + ".text.bin", mmap),
+            np.load(prefix + ".text_offsets.npy", mmap_mode=mode),
+            _blob(prefix + ".ids.bin", mmap),
+            np.load(prefix + ".ids_offsets.npy", mmap_mode=mode),
+            {f: np.load(f"{prefix}.{f}.npy", mmap_mode=mode) for f in fields},
+            np.load(prefix + ".position.npy", mmap_mode=mode),
+            info["tables"],
+            np.load(prefix + ".faiss_id.npy", mmap_mode=mode) if os.path.exists(prefix + ".faiss_id.npy") else None,
+        )
+
+    @classmethod
+    def from_metas(cls, metas, interned_fields=INTERNED_FIELDS):
+        """Store en mémoire construit depuis une liste de dicts (ancien format JSONL)."""
+        tables = {f: [] for f in interned_fields}
+        table_idx = {f: {} for f in interned_fields}
+        columns = {f: [] for f in interned_fields}
+        texts, ids, positions = [], [], []
+        for m in metas:
+            texts.append(m["text"].encode("utf-8"))
+            ids.append((m.get("chunk_id") or "").encode("utf-8"))
+            pos = chunk_position(m)
+            positions.append(-1 if pos is None else pos)
+            for f in interned_fields:
+                v = m.get(f)
+                if v is None:
+                    columns[f].append(-1)
+                    continue
+                if v not in table_idx[f]:
+                    table_idx[f][v] = len(tables[f])
+                    tables[f].append(v)
+                columns[f].append(table_idx[f][v])
+
+        def offsets(parts):
+            out = np.zeros(len(parts) + 1, dtype=np.int64)
+            out[1:] = np.cumsum([len(p) for p in parts])
+            return out
+
+        return cls(
+            np.frombuffer(b"".join(texts), dtype=np.uint8),
+            offsets(texts),
+            np.frombuffer(b"".join(ids), dtype=np.uint8),
+            offsets(ids),
+            {f: np.asarray(columns[f], dtype=np.int32) for f in interned_fields},
+            np.asarray(positions, dtype=np.int32),
+            tables,
+        )
+
+    def __len__(self):
+        return len(self.positions)
+
+    def fingerprint(self) -> str:
+        """Empreinte du corpus (ids + offsets des textes) : change si un chunk est ajouté, retiré ou modifié."""
+        h = hashlib.sha1()
+        h.update(np.ascontiguousarray(self.faiss_ids, dtype=np.int64).tobytes())
+        h.update(np.ascontiguousarray(self.text_offsets, dtype=np.int64).tobytes())
+        return h.hexdigest()
+
+    def _decode(self, blob, offsets, row):
+        start, end = offsets[row], offsets[row + 1]
+        return bytes(blob[start:end]).decode("utf-8")
+
+    def text(self, row) -> str:
+        return self._decode(self.text_blob, self.text_offsets, row)
+
+    def chunk_id(self, row):
+        return self._decode(self.id_blob, self.id_offsets, row) or None
+
+    def chunk_ids(self):
+        return [self.chunk_id(r) for r in range(len(self))]
+
+    def field(self, name, row):
+        idx = int(self.columns[name][row])
+        return None if idx < 0 else self.tables[name][idx]
+
+    def position(self, row):
+        pos = int(self.positions[row])
+        return None if pos < 0 else pos
+
+    def meta(self, row, with_text: bool = True):
+        """Dict du chunk (même forme que l'ancienne ligne JSONL)."""
+        m = {"chunk_id": self.chunk_id(row)}
+        for f in self.fields:
+            m[f] = self.field(f, row)
+        if with_text:
+            m["text"] = self.text(row)
+        return m
+
+    def texts(self):
+        for r in range(len(self)):
+            yield self.text(r)
@@ -1,8 +1,14 @@
 import os
+import re
 import json
+import hashlib
+import math
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-from src import config
-from src.ingest import load_rsts, prepare_docs, download_symfony_docs
+from src import config, resources
+from src.ingest import DECORATION_CHARS, clean_text, load_rsts, prepare_docs, download_symfony_docs
 
 
 def chunk_fixed(text: str, max_words: int = 500, overlap: int = 100):
@@ -43,6 +49,244 @@ def chunk_semantic(text: str, max_words: int = 500):
     return chunks
 
 
+# ----------------------------
+# Chunker structuré (sections RST + blocs de code + budget en tokens du modèle)
+# ----------------------------
+
+CODE_DIRECTIVES = {"code-block", "code", "sourcecode", "configuration-block"}
+DIRECTIVE_RE = re.compile(r"^(\s*)\.\. ([\w:-]+)::")
+
+
+def _is_adornment(line: str) -> bool:
+    s = line.strip()
+    return len(s) >= 3 and len(set(s)) == 1 and s[0] in DECORATION_CHARS
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+def token_counter():
+    """
+    (fonction de comptage, budget) pour le modèle d'embeddings :
+    tokenizer du modèle et max_seq_length - 2 ([CLS] / [SEP]) si disponibles,
+    sinon approximation en mots (config.STRUCT_TOKENS_PER_WORD).
+    """
+    try:
+        model = resources.get_embedding_model()
+        tokenizer = model.tokenizer
+        budget = int(model.max_seq_length) - 2
+
+        def count(text):
+            return len(tokenizer.tokenize(text))
+
+    except (ImportError, OSError, AttributeError):
+        budget = config.STRUCT_FALLBACK_MAX_TOKENS - 2
+
+        def count(text):
+            return math.ceil(len(text.split()) * config.STRUCT_TOKENS_PER_WORD)
+
+    if config.STRUCT_MAX_TOKENS:
+        budget = min(budget, config.STRUCT_MAX_TOKENS)
+    return count, budget
+
+
+def rst_sections(raw: str):
+    """
+    Découpe un texte RST brut en sections :
+    liste de (chemin de titres, numéro hiérarchique "1.2", blocs)
+    où un bloc est ("text" | "code", contenu brut).
+    Niveau d'un titre = ordre de première apparition de son style de soulignement.
+    """
+    lines = raw.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    styles = []
+    path, numbers = [], []
+    sections = [([], "0", [])]
+    para = []
+
+    def flush_para():
+        if para:
+            sections[-1][2].append(("text", "\n".join(para)))
+            para.clear()
+
+    def open_section(title, style):
+        nonlocal path, numbers
+        if style not in styles:
+            styles.append(style)
+        level = styles.index(style)
+        path = path[:level] + [title]
+        if level < len(numbers):
+            numbers = numbers[:level + 1]
+            numbers[level] += 1
+        else:
+            numbers = numbers + [1] * (level + 1 - len(numbers))
+        sections.append((list(path), ".".join(map(str, numbers)), []))
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+
+        # titre surligné + souligné
+        if (_is_adornment(line) and i + 2 < len(lines) and lines[i + 1].strip()
+                and lines[i + 2].strip() == stripped):
+            flush_para()
+            open_section(lines[i + 1].strip(), (stripped[0], True))
+            i += 3
+            continue
+
+        # titre souligné
+        if (stripped and not _is_adornment(line) and _indent(line) == 0 and i + 1 < len(lines)
+                and _is_adornment(lines[i + 1]) and len(lines[i + 1].strip()) >= min(len(stripped), 3)):
+            flush_para()
+            open_section(stripped, (lines[i + 1].strip()[0], False))
+            i += 2
+            continue
+
+        directive = DIRECTIVE_RE.match(line)
+        literal = not directive and stripped.endswith("::")
+        if directive or literal:
+            base = _indent(line)
+            if literal:
+                # "Exemple ::" / "Exemple::" -> "Exemple :" ; "::" seul disparaît
+                text = line.rstrip()[:-2].rstrip()
+                if text:
+                    para.append(text + (":" if not text.endswith(":") else ""))
+            flush_para()
+
+            # corps indenté (lignes vides comprises) jusqu'au retour à l'indentation de base
+            j = i + 1
+            body = []
+            while j < len(lines) and (not lines[j].strip() or _indent(lines[j]) > base):
+                body.append(lines[j])
+                j += 1
+            while body and not body[-1].strip():
+                body.pop()
+            # options de directive (":linenos:"...) en tête du corps
+            while body and (not body[0].strip() or (directive and body[0].strip().startswith(":"))):
+                body.pop(0)
+
+            if body:
+                content = textwrap.dedent("\n".join(body))
+                if literal or directive.group(2) in CODE_DIRECTIVES:
+                    sections[-1][2].append(("code", content))
+                else:
+                    # note, tip, versionadded... : le contenu est du texte
+                    for block in re.split(r"\n\s*\n", content):
+                        if block.strip():
+                            sections[-1][2].append(("text", block))
+            i = j
+            continue
+
+        if not stripped:
+            flush_para()
+        else:
+            para.append(line)
+        i += 1
+
+    flush_para()
+    return sections
+
+
+def _clean_block(kind, content):
+    if kind == "code":
+        return "\n".join(l.rstrip() for l in content.split("\n")).strip("\n")
+    return clean_text(content)
+
+
+def _split_oversized(text, kind, count, budget):
+    """Découpe un bloc trop long : lignes (code) ou phrases (texte), puis mots."""
+    units = text.split("\n") if kind == "code" else re.split(r"(?<=[.!?:])\s+", text)
+    sep = "\n" if kind == "code" else " "
+    pieces, current, current_tokens = [], [], 0
+    for unit in units:
+        n = count(unit)
+        if n > budget:
+            words = unit.split()
+            # unité elle-même trop longue : par paquets de mots
+            while words:
+                lo, hi = 1, len(words)
+                while lo < hi:
+                    mid = (lo + hi + 1) // 2
+                    if count(" ".join(words[:mid])) <= budget:
+                        lo = mid
+                    else:
+                        hi = mid - 1
+                if current:
+                    pieces.append(sep.join(current))
+                    current, current_tokens = [], 0
+                pieces.append(" ".join(words[:lo]))
+                words = words[lo:]
+            continue
+        if current and current_tokens + n > budget:
+            pieces.append(sep.join(current))
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += n
+    if current:
+        pieces.append(sep.join(current))
+    return pieces
+
+
+def chunk_structured(doc, count=None, budget: int = None):
+    """
+    Chunks alignés sur les sections du document (jamais à cheval sur deux sections),
+    blocs de code gardés entiers tant qu'ils tiennent dans le budget de tokens.
+    Chaque chunk tient dans la fenêtre du modèle : rien n'est tronqué à l'encodage.
+    id hiérarchique : {source}_struct_{numéro de section}_{n° de chunk dans la section}
+    """
+    if count is None or budget is None:
+        default_count, default_budget = token_counter()
+        count = count or default_count
+        budget = budget or default_budget
+
+    chunks = []
+    for path, number, blocks in rst_sections(doc["text"]):
+        pieces = []
+        for kind, content in blocks:
+            text = _clean_block(kind, content)
+            if not text:
+                continue
+            n = count(text)
+            if n > budget:
+                pieces.extend((p, count(p)) for p in _split_oversized(text, kind, count, budget))
+            else:
+                pieces.append((text, n))
+
+        # regroupement glouton des blocs de la section
+        groups, current, current_tokens = [], [], 0
+        for text, n in pieces:
+            if current and current_tokens + n > budget:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += n
+        if current:
+            groups.append(current)
+
+        for j, group in enumerate(groups):
+            chunks.append({
+                "chunk_id": f"{doc['id']}_struct_{number}_{j}",
+                "source": doc["id"],
+                "text": "\n\n".join(group),
+                "title": doc["metadata"]["title"],
+                "category": doc["metadata"]["category"],
+                "section": " > ".join(path) or None,
+                "section_path": path,
+                "position": len(chunks),
+            })
+    return chunks
+
+
+def build_structured_chunks(docs, budget: int = None):
+    count, default_budget = token_counter()
+    budget = budget or default_budget
+    chunks = []
+    for doc in docs:
+        chunks.extend(chunk_structured(doc, count=count, budget=budget))
+    return chunks
+
+
 def save_jsonl(chunks, path):
     os.makedirs(os.path.dirname(path), exist_ok=True)
     with open(path, "w", encoding="utf-8") as f:
@@ -58,55 +302,106 @@ def load_chunks_jsonl(path):
     return chunks
 
 
-def build_all_chunks(docs, max_words: int = 500, overlap: int = 100):
+def doc_chunks(doc, max_words: int = 500, overlap: int = 100):
+    """Chunks fixed et semantic d'un document préparé (prepare_doc)."""
+    fixed = []
+    for i, chunk_text in enumerate(chunk_fixed(doc["clean_text"], max_words=max_words, overlap=overlap)):
+        fixed.append({
+            "chunk_id": f"{doc['id']}_fixed_{i}",
+            "source": doc["id"],
+            "text": chunk_text,
+            "title": doc["metadata"]["title"],
+            "category": doc["metadata"]["category"],
+        })
+
+    semantic = []
+    for i, chunk_text in enumerate(chunk_semantic(doc["clean_text"], max_words=max_words)):
+        semantic.append({
+            "chunk_id": f"{doc['id']}_sem_{i}",
+            "source": doc["id"],
+            "text": chunk_text,
+            "title": doc["metadata"]["title"],
+            "category": doc["metadata"]["category"],
+        })
+
+    return fixed, semantic
+
+
+def build_all_chunks(docs, max_words: int = 500, overlap: int = 100, workers: int = None, chunksize: int = 16):
+    """
+    workers > 1 : chunking dans un pool de processus, dans l'ordre des documents.
+    """
+    workers = config.PREPROCESS_WORKERS if workers is None else workers
     all_chunks_fixed = []
     all_chunks_semantic = []
 
-    for doc in docs:
-        # Fixed
-        chunks_f = chunk_fixed(doc["clean_text"], max_words=max_words, overlap=overlap)
-        for i, chunk_text in enumerate(chunks_f):
-            all_chunks_fixed.append({
-                "chunk_id": f"{doc['id']}_fixed_{i}",
-                "source": doc["id"],
-                "text": chunk_text,
-                "title": doc["metadata"]["title"],
-                "category": doc["metadata"]["category"],
-            })
+    chunk_doc = partial(doc_chunks, max_words=max_words, overlap=overlap)
+    if workers <= 1 or len(docs) < 2:
+        for fixed, semantic in map(chunk_doc, docs):
+            all_chunks_fixed.extend(fixed)
+            all_chunks_semantic.extend(semantic)
+        return all_chunks_fixed, all_chunks_semantic
 
-        # Semantic
-        chunks_s = chunk_semantic(doc["clean_text"], max_words=max_words)
-        for i, chunk_text in enumerate(chunks_s):
-            all_chunks_semantic.append({
-                "chunk_id": f"{doc['id']}_sem_{i}",
-                "source": doc["id"],
-                "text": chunk_text,
-                "title": doc["metadata"]["title"],
-                "category": doc["metadata"]["category"],
-            })
+    # on n'envoie aux workers que ce dont le chunking a besoin (pas le texte brut)
+    light = [{"id": d["id"], "clean_text": d["clean_text"], "metadata": d["metadata"]} for d in docs]
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        for fixed, semantic in ex.map(chunk_doc, light, chunksize=chunksize):
+            all_chunks_fixed.extend(fixed)
+            all_chunks_semantic.extend(semantic)
 
     return all_chunks_fixed, all_chunks_semantic
 
 
+# Sources (hash du .rst brut) et réglages dont sont issus les chunks_*.jsonl :
+# build_all_indexes les recopie dans le manifest des index, même quand il réutilise
+# des chunks construits à partir d'une version plus ancienne de data/raw
+CHUNK_SOURCES_PATH = os.path.join(config.PROCESSED_DIR, "chunks_sources.json")
+
+
+def source_hashes(docs):
+    return {d["id"]: hashlib.sha1(d["text"].encode("utf-8")).hexdigest() for d in docs}
+
+
+def read_chunk_sources():
+    if not os.path.exists(CHUNK_SOURCES_PATH):
+        return None
+    with open(CHUNK_SOURCES_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_chunk_sources(hashes, chunking: dict):
+    os.makedirs(os.path.dirname(CHUNK_SOURCES_PATH), exist_ok=True)
+    with open(CHUNK_SOURCES_PATH + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"chunking": chunking, "sources": hashes}, f, ensure_ascii=False, indent=2)
+    os.replace(CHUNK_SOURCES_PATH + ".tmp", CHUNK_SOURCES_PATH)
+
+
 def build_and_save_chunks(max_words: int = 500, overlap: int = 100):
     os.makedirs(config.PROCESSED_DIR, exist_ok=True)
 
     docs = load_rsts()
+    hashes = source_hashes(docs)
     docs = prepare_docs(docs)
 
     all_fixed, all_sem = build_all_chunks(docs, max_words=max_words, overlap=overlap)
+    all_struct = build_structured_chunks(docs)
 
     fixed_path = os.path.join(config.PROCESSED_DIR, "chunks_fixed.jsonl")
     sem_path = os.path.join(config.PROCESSED_DIR, "chunks_semantic.jsonl")
+    struct_path = os.path.join(config.PROCESSED_DIR, "chunks_structured.jsonl")
 
     save_jsonl(all_fixed, fixed_path)
     save_jsonl(all_sem, sem_path)
+    save_jsonl(all_struct, struct_path)
+    write_chunk_sources(hashes, {"max_words": max_words, "overlap": overlap})
 
     return {
         "fixed_path": fixed_path,
         "semantic_path": sem_path,
+        "structured_path": struct_path,
         "n_fixed": len(all_fixed),
         "n_semantic": len(all_sem),
+        "n_structured": len(all_struct),
     }
 
 
@@ -115,7 +410,6 @@ if __name__ == "__main__":
     download_symfony_docs()
     info = build_and_save_chunks(max_words=500, overlap=100)
 
-    print("Chunks FIXED :", info["n_fixed"])
-    print("Chunks SEMANTIC :", info["n_semantic"])
-    print("Saved:", info["fixed_path"])
-    print("Saved:", info["semantic_path"])
+    print("Chunks FIXED :", info["n_fixed"], "| Saved:", info["fixed_path"])
+    print("Chunks SEMANTIC :", info["n_semantic"], "| Saved:", info["semantic_path"])
+    print("Chunks STRUCTURED :", info["n_structured"], "| Saved:", info["structured_path"])
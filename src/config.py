@@ -19,8 +19,71 @@ FILES = [
 
 DATA_DIR = "data"
 RAW_DIR = os.path.join(DATA_DIR, "raw")
+DOWNLOAD_MANIFEST_PATH = os.path.join(DATA_DIR, "download_manifest.json")  # ETag / Last-Modified par fichier
+DOWNLOAD_WORKERS = 16            # téléchargements parallèles
+DOCS_TREE_URL = "https://api.github.com/repos/symfony/symfony-docs/git/trees/7.3?recursive=1"
 PROCESSED_DIR = os.path.join(DATA_DIR, "processed")
 INDEX_DIR = "index"
 
 MODEL_NAME = "all-MiniLM-L6-v2"
 CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Cache des embeddings de requêtes (src.embedding_cache)
+QUERY_CACHE_SIZE = 4096          # nb max de requêtes gardées en mémoire (LRU)
+QUERY_CACHE_PERSIST = False      # True : tier disque sous INDEX_DIR
+
+# Cache des scores cross-encoder (src.rerank)
+RERANK_CACHE_SIZE = 20000        # nb max de paires (question, chunk) gardées
+
+# Type d'index FAISS (src.index_faiss.INDEX_TYPES) : "flat", "ivf_flat", "hnsw", "ivf_pq",
+# ou stockage quantifié "fp16", "sq8", "binary"
+INDEX_TYPE = "flat"
+INDEX_PARAMS = {}                # ex. {"nlist": 256, "nprobe": 16}, {"M": 32, "ef_search": 64} ou {"rescore": 4}
+INDEX_MMAP = True                # index FAISS lus en mmap (partagés entre processus)
+INDEX_BUILD_BATCH = 4096         # chunks encodés puis ajoutés à l'index par lot (build_index)
+
+# Évaluation (src.eval_runner)
+EVAL_WORKERS = 8
+EVAL_LLM_CACHE_PATH = os.path.join(DATA_DIR, "llm_cache.jsonl")  # réponses LLM par hash du prompt
+
+# Instrumentation (src.tracing)
+TRACE_TIMINGS = True     # "timings" par étape dans les réponses de ask_rag
+TRACE_HISTOGRAM = True   # serveur : latences par étape dans /stats
+TRACE_LOG = False        # serveur : une ligne par étape sur stderr
+
+# Fusion hybride dense + BM25 (src.fusion) : "minmax", "zscore" ou "rrf"
+HYBRID_FUSION = "minmax"
+RRF_K = 60
+
+# Chunker structuré (src.chunking.chunk_structured) : budget en tokens du modèle
+STRUCT_MAX_TOKENS = None         # None : max_seq_length du modèle - 2 (254 pour MiniLM)
+STRUCT_FALLBACK_MAX_TOKENS = 256 # fenêtre supposée si le tokenizer n'est pas disponible
+STRUCT_TOKENS_PER_WORD = 1.4     # approximation tokens / mot sans tokenizer
+
+# Prétraitement (src.ingest.prepare_docs, src.chunking.build_all_chunks)
+PREPROCESS_WORKERS = 1           # > 1 : pool de processus (gros corpus)
+
+# Pipeline de build en flux (src.pipeline)
+PIPELINE_BATCH_SIZE = 256        # chunks par lot d'encodage / d'ajout à l'index
+PIPELINE_QUEUE_SIZE = 4          # lots en attente entre deux étapes (backpressure)
+PIPELINE_TRAIN_SIZE = 50000      # vecteurs gardés pour entraîner un index IVF / sq8 / binary
+
+# Store persistant des embeddings de chunks (évite de ré-encoder les textes identiques)
+CHUNK_EMB_CACHE = True
+CHUNK_EMB_CACHE_DIR = os.path.join(INDEX_DIR, "emb_cache")
+
+# RAG asynchrone (src.rag_async) : threads pour l'encodage / le rerank (CPU)
+RAG_CPU_WORKERS = 4
+
+# Cache sémantique des réponses (src.answer_cache)
+ANSWER_CACHE = True
+ANSWER_CACHE_THRESHOLD = 0.92    # similarité cosinus min. entre deux questions
+ANSWER_CACHE_TTL = 3600          # secondes (None = pas d'expiration)
+ANSWER_CACHE_SIZE = 1000
+
+# Serveur HTTP (src.server) + micro-batching des modèles (src.batching)
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+BATCH_MAX_SIZE = 64              # nb max de textes / paires par appel modèle
+BATCH_MAX_WAIT_MS = 0.0          # attente max pour compléter un lot, sous charge seulement (0 = jamais)
+SERVER_WORKERS = 1               # > 1 : processus pré-forkés sur le même socket (Linux / macOS)
@@ -0,0 +1,120 @@
+import numpy as np
+
+from src.chunk_store import ChunkStore, chunk_faiss_id
+
+
+class Corpus:
+    """
+    Corpus chargé une seule fois avec l'index : chunks (ChunkStore colonne)
+    + clés de lookup triées (id FAISS -> ligne, (source, position) -> ligne).
+    Se comporte comme la liste des metas (len, [ligne], itération) ;
+    corpus[ligne] matérialise le dict du chunk, texte compris.
+    Les lookups sont des recherches dichotomiques sur des tableaux numpy
+    (pas de dict Python par chunk) : le coût mémoire par processus reste
+    faible quand le store est en mmap et partagé entre workers.
+    """
+
+    def __init__(self, store, faiss_ids: bool = False):
+        """
+        faiss_ids : True si l'index associé renvoie les ids stables des chunks
+        (IndexIDMap / add_with_ids) au lieu des numéros de ligne.
+        """
+        if not isinstance(store, ChunkStore):
+            # ancienne forme : liste de dicts
+            store = ChunkStore.from_metas(store)
+        self.store = store
+        self.faiss_ids = faiss_ids
+
+        # id stable (hash du chunk_id) -> ligne
+        ids = np.asarray(store.faiss_ids)
+        self._id_order = np.argsort(ids, kind="stable")
+        self._sorted_ids = ids[self._id_order]
+
+        # voisinage calculé sur les colonnes, sans décoder les textes :
+        # clé = (indice de source << 32) | position
+        self._pos_order = np.empty(0, dtype=np.int64)
+        self._sorted_pos = np.empty(0, dtype=np.int64)
+        sources = store.columns.get("source")
+        if sources is not None:
+            src = np.asarray(sources, dtype=np.int64)
+            pos = np.asarray(store.positions, dtype=np.int64)
+            rows = np.flatnonzero((src >= 0) & (pos >= 0))
+            keys = (src[rows] << 32) | pos[rows]
+            order = np.argsort(keys, kind="stable")
+            self._pos_order = rows[order]
+            self._sorted_pos = keys[order]
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, row):
+        return self.store.meta(int(row))
+
+    def __iter__(self):
+        for row in range(len(self.store)):
+            yield self.store.meta(row)
+
+    def meta(self, row, with_text: bool = True):
+        return self.store.meta(int(row), with_text=with_text)
+
+    def text(self, row):
+        return self.store.text(int(row))
+
+    def texts(self):
+        return self.store.texts()
+
+    def rows_from_ids(self, ids):
+        """
+        Convertit les ids renvoyés par FAISS en lignes du corpus (-1 conservé).
+        Identité si l'index est indexé par ligne.
+        """
+        ids = np.asarray(ids)
+        if not self.faiss_ids or len(self._sorted_ids) == 0:
+            return ids
+        pos = np.searchsorted(self._sorted_ids, ids)
+        pos = np.clip(pos, 0, len(self._sorted_ids) - 1)
+        found = self._sorted_ids[pos] == ids
+        return np.where(found, self._id_order[pos], -1)
+
+    def row_of(self, chunk_id):
+        if not chunk_id:
+            return None
+        h = chunk_faiss_id(chunk_id)
+        i = int(np.searchsorted(self._sorted_ids, h))
+        # collisions de hash (improbables) : on vérifie le chunk_id
+        while i < len(self._sorted_ids) and self._sorted_ids[i] == h:
+            row = int(self._id_order[i])
+            if self.store.chunk_id(row) == chunk_id:
+                return row
+            i += 1
+        return None
+
+    def get(self, chunk_id):
+        row = self.row_of(chunk_id)
+        return None if row is None else self[row]
+
+    def _row_at(self, src_idx, pos):
+        if pos < 0:
+            return None
+        key = (src_idx << 32) | pos
+        i = int(np.searchsorted(self._sorted_pos, key))
+        if i < len(self._sorted_pos) and self._sorted_pos[i] == key:
+            return int(self._pos_order[i])
+        return None
+
+    def neighbor_rows(self, row, window: int = 1):
+        """
+        Lignes des chunks voisins (même source, position +/- window), dans l'ordre.
+        Coût proportionnel à la fenêtre, pas à la taille du corpus.
+        """
+        sources = self.store.columns.get("source")
+        pos = self.store.position(row)
+        if sources is None or pos is None or sources[row] < 0:
+            return []
+        src_idx = int(sources[row])
+        rows = []
+        for delta in range(-window, window + 1):
+            r = self._row_at(src_idx, pos + delta)
+            if r is not None:
+                rows.append(r)
+        return rows
@@ -0,0 +1,292 @@
+import os
+import json
+import fcntl
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Caches d'embeddings adressés par contenu.
+# Requêtes : clé = sha1(nom du modèle + texte normalisé)
+# - tier mémoire : LRU borné (OrderedDict)
+# - tier disque (optionnel) : enregistrements clé + vecteur float32 ajoutés à un fichier
+#   lu en mmap, avec un en-tête (modèle, dim) vérifié au chargement
+# Chunks (build d'index) : clé = sha1(nom du modèle + texte exact), disque uniquement.
+
+
+def normalize_query(text: str) -> str:
+    # NFC + espaces compactés : ne change pas ce que voit le tokenizer
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split())
+
+
+def cache_key(text: str, model_name: str) -> str:
+    raw = model_name + "\0" + normalize_query(text)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class DiskVectorStore:
+    """
+    Vecteurs float32 adressés par clé (sha1 hex), en ajout seul, dans un seul fichier :
+    en-tête JSON de HEADER_SIZE octets (format, modèle, dim) puis des enregistrements
+    de taille fixe clé (40 octets) + vecteur, lus en mmap.
+    Chaque put écrit ses enregistrements en un seul write, sous verrou fcntl : plusieurs
+    processus (serveur prefork) peuvent ajouter au même fichier. En-tête, modèle, dim ou
+    taille incohérents : le tier disque est ignoré.
+    """
+
+    FORMAT = 1
+    HEADER_SIZE = 256
+    KEY_SIZE = 40
+
+    def __init__(self, path: str, model_name: str):
+        self.path = path
+        self.model_name = model_name
+        self._rows = {}
+        self._n = 0  # enregistrements lus (une clé écrite par deux processus compte deux fois)
+        self._vecs = None
+        self._dim = None
+        self._disabled = False
+        self._lock = threading.Lock()
+        self._load()
+
+    def _record_dtype(self):
+        return np.dtype([("key", f"S{self.KEY_SIZE}"), ("vec", "<f4", (self._dim,))])
+
+    def _disable(self, reason):
+        print(f"Cache d'embeddings disque {reason}, ignoré :", self.path)
+        self._disabled = True
+        self._rows, self._n, self._vecs = {}, 0, None
+
+    def _read_header(self, f):
+        raw = f.read(self.HEADER_SIZE)
+        try:
+            header = json.loads(raw.rstrip(b" \n").decode("utf-8"))
+        except ValueError:
+            return None
+        if len(raw) != self.HEADER_SIZE or header.get("format") != self.FORMAT:
+            return None
+        return header
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                header = self._read_header(f)
+                if header is None:
+                    return self._disable("illisible")
+                if header.get("model") != self.model_name:
+                    return self._disable(f"d'un autre modèle ({header.get('model')})")
+                self._dim = int(header["dim"])
+                self._refresh()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Relit les enregistrements ajoutés depuis le dernier passage (ce processus ou un autre)."""
+        body = os.path.getsize(self.path) - self.HEADER_SIZE
+        record_size = self._record_dtype().itemsize
+        if body < 0 or body % record_size:
+            return self._disable("incohérent (écriture interrompue ?)")
+        n = body // record_size
+        if n == 0:
+            return
+        records = np.memmap(self.path, dtype=self._record_dtype(), mode="r", offset=self.HEADER_SIZE, shape=(n,))
+        for i in range(self._n, n):
+            self._rows.setdefault(records["key"][i].decode("ascii"), i)
+        self._n = n
+        self._vecs = records["vec"]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def get(self, key):
+        row = self._rows.get(key)
+        if row is None or self._vecs is None:
+            return None
+        return np.array(self._vecs[row])
+
+    def put(self, items):
+        """items : liste de (clé, vecteur) ; les clés déjà présentes sont ignorées."""
+        new = [(k, v) for k, v in items if k not in self._rows]
+        if not new or self._disabled:
+            return
+        dim = len(new[0][1])
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock, open(self.path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if f.tell() == 0:
+                    header = json.dumps({"format": self.FORMAT, "model": self.model_name, "dim": dim}).encode("utf-8")
+                    f.write(header.ljust(self.HEADER_SIZE - 1) + b"\n")
+                    self._dim = dim
+                elif self._dim is None:
+                    # fichier créé par un autre processus depuis notre chargement
+                    with open(self.path, "rb") as fr:
+                        header = self._read_header(fr)
+                    if header is None or header.get("model") != self.model_name:
+                        return self._disable("illisible")
+                    self._dim = int(header["dim"])
+                if dim != self._dim:
+                    return self._disable(f"de dimension {self._dim} (vecteurs de dimension {dim})")
+
+                records = np.empty(len(new), dtype=self._record_dtype())
+                records["key"] = [k.encode("ascii") for k, _ in new]
+                records["vec"] = np.asarray([v for _, v in new], dtype=np.float32)
+                f.write(records.tobytes())  # un seul write, fichier en ajout
+                f.flush()
+                self._refresh()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class QueryEmbeddingCache:
+    def __init__(self, model_name: str, max_items: int = 4096, persist_dir: str = None):
+        self.model_name = model_name
+        self.max_items = max_items
+        self.persist_dir = persist_dir
+
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # tier disque
+        self._disk = None
+        if persist_dir:
+            safe_name = model_name.replace("/", "_")
+            self._disk = DiskVectorStore(os.path.join(persist_dir, f"query_emb_{safe_name}.vec"), model_name)
+
+    # ----------------------------
+    # API
+    # ----------------------------
+    def _lookup(self, key):
+        vec = self._lru.get(key)
+        if vec is not None:
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return vec
+        if self._disk is not None:
+            vec = self._disk.get(key)
+            if vec is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self._remember(key, vec)
+                return vec
+        self.misses += 1
+        return None
+
+    def _remember(self, key, vec):
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+
+    def encode(self, texts, encode_fn):
+        """
+        Retourne la matrice (n, d) des embeddings de `texts`.
+        Seuls les textes absents du cache passent par encode_fn(list[str]) -> ndarray.
+        """
+        texts = list(texts)
+        keys = [cache_key(t, self.model_name) for t in texts]
+
+        with self._lock:
+            found = [self._lookup(k) for k in keys]
+
+        missing = {}
+        for i, (key, vec) in enumerate(zip(keys, found)):
+            if vec is None:
+                missing.setdefault(key, i)
+
+        if missing:
+            new_vecs = encode_fn([texts[i] for i in missing.values()])
+            new_items = list(zip(missing.keys(), np.asarray(new_vecs, dtype=np.float32)))
+            with self._lock:
+                for key, vec in new_items:
+                    self._remember(key, vec)
+                if self._disk is not None:
+                    self._disk.put(new_items)
+            by_key = dict(new_items)
+            found = [vec if vec is not None else by_key[key] for key, vec in zip(keys, found)]
+
+        if not found:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack(found).astype(np.float32, copy=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._lru),
+            "max_items": self.max_items,
+            "disk_size": len(self._disk) if self._disk is not None else 0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+
+def text_key(text: str, model_name: str) -> str:
+    # texte exact (pas de normalisation) : un chunk modifié d'un caractère est ré-encodé
+    return hashlib.sha1((model_name + "\0" + text).encode("utf-8")).hexdigest()
+
+
+class ChunkEmbeddingStore:
+    """
+    Store persistant des embeddings de chunks : sha1(modèle + texte) -> vecteur float32.
+    build_index ne passe au modèle que les textes jamais encodés
+    (utile quand on balaie max_words / overlap : beaucoup de chunks reviennent à l'identique).
+    """
+
+    def __init__(self, model_name: str, directory: str):
+        self.model_name = model_name
+        safe_name = model_name.replace("/", "_")
+        self._disk = DiskVectorStore(os.path.join(directory, f"chunk_emb_{safe_name}.vec"), model_name)
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, texts, encode_fn):
+        texts = list(texts)
+        keys = [text_key(t, self.model_name) for t in texts]
+
+        # textes à encoder, dédupliqués
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self._disk and key not in missing:
+                missing[key] = text
+        self.misses += len(missing)
+        self.hits += len(texts) - sum(1 for k in keys if k in missing)
+
+        fresh = {}
+        if missing:
+            new_vecs = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            fresh = dict(zip(missing.keys(), new_vecs))
+            self._disk.put(list(fresh.items()))
+
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        # fresh : tier disque ignoré (incohérent) ou pas encore relu
+        return np.vstack([fresh[k] if k in fresh else self._disk.get(k) for k in keys]).astype(np.float32, copy=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._disk),
+        }
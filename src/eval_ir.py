@@ -0,0 +1,282 @@
+import json
+import sys
+import time
+from itertools import product
+
+import numpy as np
+
+from src import config, resources
+from src.bm25_index import tokenize
+from src.fusion import fuse, top_k
+from src.retrieval import _search, encode_queries, retrieve_many
+
+
+# Évaluation retrieval seule, sur un grand jeu de requêtes annotées (JSONL) :
+# - retrieval par batchs (retrieve_many : un encodage, une recherche FAISS, un passage BM25)
+# - hits -> matrice de labels (n_requêtes, profondeur), puis toutes les métriques
+#   en numpy d'un coup : MRR, nDCG@k, Recall@k, Hit@k, Precision@k
+# - balayage alpha / k_dense / k_bm25 de retrieve_hybrid : dense et BM25 calculés une
+#   seule fois à la profondeur max, puis seulement la fusion (src.fusion) par réglage
+#
+# Jeu JSONL, une requête par ligne :
+#   {"question": "...", "expected_sources": ["routing.rst"]}      pertinence par fichier
+#   {"question": "...", "expected_chunk_ids": ["routing_fixed_3"]} pertinence par chunk
+#
+#   python -m src.eval_ir [requetes.jsonl] [rapport.json] [--strategies=fixed,hybrid] [--no-sweep]
+
+KS = (1, 5, 10, 50)
+NDCG_K = 10
+BATCH_SIZE = 64
+STRATEGIES = ("fixed", "semantic", "bm25", "hybrid", "parent_child")
+
+SWEEP_ALPHAS = (0.0, 0.3, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+SWEEP_K_DENSE = (10, 20, 50)
+SWEEP_K_BM25 = (10, 20, 50)
+
+
+def load_queries(path: str = None):
+    """
+    Requêtes annotées (JSONL) ; défaut : eval.TEST_SET.
+    Retourne (items, field) avec field = "chunk_id" si toutes les requêtes ont
+    expected_chunk_ids, sinon "source". Les requêtes sans attendu sont ignorées.
+    """
+    if path is None:
+        from src.eval import TEST_SET
+        raw = [{"question": t["q"], "expected_sources": sorted(t["expected_sources"])} for t in TEST_SET]
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = [json.loads(line) for line in f if line.strip()]
+
+    field = "chunk_id" if raw and all(r.get("expected_chunk_ids") for r in raw) else "source"
+    key = "expected_chunk_ids" if field == "chunk_id" else "expected_sources"
+    items = []
+    for r in raw:
+        expected = list(dict.fromkeys(r.get(key) or []))
+        if expected:
+            items.append({"question": r.get("question") or r["q"], "expected": expected})
+    return items, field
+
+
+# ----------------------------
+# Métriques (numpy)
+# ----------------------------
+
+def label_hits(hit_lists, items, field: str, depth: int):
+    """
+    Matrice (n, depth) : position du hit dans la liste "expected" de sa requête, -1 si non pertinent
+    (ou absent : moins de depth hits).
+    """
+    labels = np.full((len(items), depth), -1, dtype=np.int64)
+    for i, (hits, item) in enumerate(zip(hit_lists, items)):
+        where = {v: j for j, v in enumerate(item["expected"])}
+        for r, h in enumerate(hits[:depth]):
+            labels[i, r] = where.get(h.get(field), -1)
+    return labels
+
+
+def ir_metrics(labels, n_expected, ks=KS, ndcg_k: int = NDCG_K):
+    """
+    Moyennes sur les requêtes, à partir de la matrice de labels :
+    - MRR           : 1 / rang du premier hit pertinent (0 si aucun dans la profondeur)
+    - Recall@k      : part des attendus distincts retrouvés dans le top-k
+    - Hit@k         : au moins un attendu dans le top-k (= eval.recall_at_k)
+    - Precision@k   : part des k hits qui sont pertinents
+    - nDCG@ndcg_k   : gain binaire, un attendu ne compte qu'à sa première apparition
+                      (plusieurs chunks d'un même fichier attendu ne gonflent pas le score)
+    """
+    labels = np.asarray(labels)
+    n_expected = np.asarray(n_expected, dtype=np.float64)
+    n, depth = labels.shape
+    relevant = labels >= 0
+
+    # gain 1 à la première apparition de chaque attendu
+    n_max = int(n_expected.max()) if n else 0
+    onehot = labels[:, :, None] == np.arange(n_max)
+    gain = (onehot & (np.cumsum(onehot, axis=1) == 1)).any(axis=2).astype(np.float64)
+
+    first = relevant.argmax(axis=1)
+    out = {"n_queries": n, "MRR": float(np.where(relevant.any(axis=1), 1.0 / (first + 1), 0.0).mean()) if n else 0.0}
+
+    for k in ks:
+        if k > depth:
+            continue
+        out[f"Recall@{k}"] = float((gain[:, :k].sum(axis=1) / n_expected).mean()) if n else 0.0
+        out[f"Hit@{k}"] = float(relevant[:, :k].any(axis=1).mean()) if n else 0.0
+        out[f"Precision@{k}"] = float(relevant[:, :k].mean()) if n else 0.0
+
+    if ndcg_k <= depth:
+        discounts = 1.0 / np.log2(np.arange(2, ndcg_k + 2))
+        dcg = gain[:, :ndcg_k] @ discounts
+        ideal = np.cumsum(discounts)[np.minimum(n_expected, ndcg_k).astype(np.int64) - 1]
+        out[f"nDCG@{ndcg_k}"] = float((dcg / ideal).mean()) if n else 0.0
+    return out
+
+
+# ----------------------------
+# Stratégies
+# ----------------------------
+
+def _batches(items, batch_size: int):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def evaluate_strategy(items, field: str, strategy: str, ks=KS, ndcg_k: int = NDCG_K,
+                      batch_size: int = BATCH_SIZE):
+    """Métriques + latence d'une stratégie (retrieve_many par batchs de batch_size requêtes)."""
+    depth = max(max(ks), ndcg_k)
+    resources.warmup([strategy], rerank=False)
+    # sans le cache des embeddings de requêtes, l'encodage est mesuré pour chaque stratégie
+    resources.get_query_cache().clear()
+
+    hit_lists, batch_times = [], []
+    for batch in _batches(items, batch_size):
+        t0 = time.perf_counter()
+        out = retrieve_many([it["question"] for it in batch], k=depth, strategy=strategy)
+        batch_times.append(time.perf_counter() - t0)
+        hit_lists.extend(out["per_query"])
+
+    metrics = ir_metrics(label_hits(hit_lists, items, field, depth),
+                         [len(it["expected"]) for it in items], ks, ndcg_k)
+    total = sum(batch_times)
+    batch_ms = np.asarray(batch_times) * 1000.0
+    metrics["latency"] = {
+        "batch_size": batch_size,
+        "per_query_ms": total * 1000.0 / max(len(items), 1),
+        "batch_p50_ms": float(np.percentile(batch_ms, 50)),
+        "batch_p95_ms": float(np.percentile(batch_ms, 95)),
+        "qps": len(items) / total if total else 0.0,
+    }
+    return metrics
+
+
+def evaluate_strategies(items, field: str, strategies=None, ks=KS, ndcg_k: int = NDCG_K,
+                        batch_size: int = BATCH_SIZE):
+    available = set(resources.available_strategies())
+    strategies = [s for s in (strategies or STRATEGIES) if s in available]
+    results = {}
+    for strategy in strategies:
+        results[strategy] = m = evaluate_strategy(items, field, strategy, ks, ndcg_k, batch_size)
+        print(f"{strategy:<13} MRR={m['MRR']:.3f} nDCG@{ndcg_k}={m.get(f'nDCG@{ndcg_k}', 0.0):.3f} "
+              f"R@10={m.get('Recall@10', 0.0):.3f} {m['latency']['per_query_ms']:.2f} ms/requête")
+    return results
+
+
+# ----------------------------
+# Balayage de la fusion hybride
+# ----------------------------
+
+def _expected_keys(items, field: str, corpus):
+    """
+    Attendus -> clés comparables aux lignes du corpus fixed :
+    indice de la table "source" (pertinence par fichier) ou ligne du chunk.
+    Retourne (row_keys (n_rows,), expected (n, n_max) complété par -2).
+    """
+    n_max = max(len(it["expected"]) for it in items)
+    expected = np.full((len(items), n_max), -2, dtype=np.int64)
+    if field == "source":
+        store = corpus.store
+        table = {name: i for i, name in enumerate(store.tables["source"])}
+        row_keys = np.asarray(store.columns["source"], dtype=np.int64)
+        for i, it in enumerate(items):
+            expected[i, :len(it["expected"])] = [table.get(s, -2) for s in it["expected"]]
+    else:
+        row_keys = np.arange(len(corpus), dtype=np.int64)
+        for i, it in enumerate(items):
+            rows = [corpus.row_of(cid) for cid in it["expected"]]
+            expected[i, :len(rows)] = [-2 if r is None else r for r in rows]
+    return row_keys, expected
+
+
+def _labels_from_rows(rows, row_keys, expected):
+    """Version numpy de label_hits pour des lignes du corpus (n, depth), -1 = pas de hit."""
+    keys = np.where(rows >= 0, row_keys[np.maximum(rows, 0)], -1)
+    eq = keys[:, :, None] == expected[:, None, :]
+    return np.where(eq.any(axis=2), eq.argmax(axis=2), -1)
+
+
+def sweep_hybrid(items, field: str, alphas=SWEEP_ALPHAS, k_dense=SWEEP_K_DENSE, k_bm25=SWEEP_K_BM25,
+                 fusion: str = None, ks=KS, ndcg_k: int = NDCG_K, batch_size: int = BATCH_SIZE,
+                 objective: str = None):
+    """
+    Métriques de retrieve_hybrid pour chaque (alpha, k_dense, k_bm25).
+    Dense et BM25 sont calculés une fois à max(k_dense) / max(k_bm25) par batchs ;
+    pour chaque requête et (k_dense, k_bm25), la normalisation est faite une fois
+    et tous les alphas sont combinés en un seul produit matriciel.
+    Retourne la liste des réglages triée par objective (défaut : nDCG@ndcg_k) décroissant.
+    """
+    fusion = fusion or config.HYBRID_FUSION
+    objective = objective or f"nDCG@{ndcg_k}"
+    depth = max(max(ks), ndcg_k)
+    index, corpus = resources.get_index("fixed")
+    bm25 = resources.get_bm25()
+    kd_max, kb_max = max(k_dense), max(k_bm25)
+
+    t0 = time.perf_counter()
+    dense_scores, dense_rows, bm25_results = [], [], []
+    for batch in _batches(items, batch_size):
+        questions = [it["question"] for it in batch]
+        scores, rows = _search(index, corpus, encode_queries(questions), kd_max)
+        dense_scores.append(scores)
+        dense_rows.append(rows)
+        bm25_results.extend(bm25.top_k_many([tokenize(q) for q in questions], kb_max))
+    dense_scores, dense_rows = np.vstack(dense_scores), np.vstack(dense_rows)
+    t_retrieval = time.perf_counter() - t0
+
+    row_keys, expected = _expected_keys(items, field, corpus)
+    n_expected = [len(it["expected"]) for it in items]
+    weights = np.array([[a, 1.0 - a] for a in alphas])
+
+    t0 = time.perf_counter()
+    results = []
+    for kd, kb in product(k_dense, k_bm25):
+        top_rows = np.full((len(alphas), len(items), depth), -1, dtype=np.int64)
+        for i, (b_rows, b_scores) in enumerate(bm25_results):
+            rows, _, _, norm = fuse(
+                (dense_rows[i, :kd], b_rows[:kb]), (dense_scores[i, :kd], b_scores[:kb]),
+                method=fusion, rrf_k=config.RRF_K,
+            )
+            fused = weights @ norm  # (n_alphas, n_candidats)
+            for a in range(len(alphas)):
+                best = rows[top_k(fused[a], depth)]
+                top_rows[a, i, :len(best)] = best
+        for a, alpha in enumerate(alphas):
+            m = ir_metrics(_labels_from_rows(top_rows[a], row_keys, expected), n_expected, ks, ndcg_k)
+            results.append(dict({"alpha": alpha, "k_dense": kd, "k_bm25": kb, "fusion": fusion}, **m))
+    t_fusion = time.perf_counter() - t0
+
+    results.sort(key=lambda r: -r.get(objective, 0.0))
+    print(f"balayage : {len(results)} réglages, retrieval {t_retrieval:.2f}s, fusion {t_fusion:.2f}s")
+    for r in results[:5]:
+        print(f"  alpha={r['alpha']:.2f} k_dense={r['k_dense']:<3} k_bm25={r['k_bm25']:<3} "
+              f"{objective}={r.get(objective, 0.0):.3f} MRR={r['MRR']:.3f}")
+    return results
+
+
+def run(path: str = None, save_path: str = "eval_ir_report.json", strategies=None, sweep: bool = True):
+    items, field = load_queries(path)
+    print(f"{len(items)} requêtes (pertinence par {field})")
+    report = {
+        "n_queries": len(items),
+        "relevance": field,
+        "strategies": evaluate_strategies(items, field, strategies),
+    }
+    if sweep:
+        report["hybrid_sweep"] = sweep_hybrid(items, field)
+    if save_path:
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nReport saved to: {save_path}")
+    return report
+
+
+if __name__ == "__main__":
+    flags = [a for a in sys.argv[1:] if a.startswith("--")]
+    positional = [a for a in sys.argv[1:] if not a.startswith("--")]
+    strategies = next((a.split("=", 1)[1].split(",") for a in flags if a.startswith("--strategies=")), None)
+    run(
+        path=positional[0] if positional else None,
+        save_path=positional[1] if len(positional) > 1 else "eval_ir_report.json",
+        strategies=strategies,
+        sweep="--no-sweep" not in flags,
+    )
@@ -0,0 +1,188 @@
+import os
+import json
+import sys
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src import config, rag, resources
+from src.eval_systematic import TEST_SET_QA, build_report, result_row, save_report
+
+
+# Évaluation parallèle et reproductible (même rapport que eval_systematic.evaluate_all) :
+# - chaque (question, système) est une tâche d'un pool de threads : les appels LLM
+#   (I/O) se recouvrent, le retrieval partage les index et modèles chargés une fois
+# - les réponses LLM sont mises en cache par hash du prompt (JSONL sur disque) :
+#   relancer l'éval après un changement ne rappelle le LLM que pour les prompts modifiés
+# - backend "stub" (défaut) : LLM local déterministe (src.llm_stub), sans réseau ;
+#   "groq" : API réelle, à travers le même cache
+#
+#   python -m src.eval_runner [jeu.jsonl] [rapport.json] [--groq] [--no-cache]
+
+SYSTEMS = {
+    "baseline": lambda q: rag.ask_baseline(q),
+    "rag": lambda q: rag.ask_rag(q, k=5, strategy="parent_child", use_rerank=True, window=1, use_cache=False)["answer"],
+    "iterative": lambda q: rag.ask_rag_iterative(q, k_final=5, strategy="parent_child", window=1)["answer"],
+}
+
+
+def prompt_key(backend_name: str, messages, model, temperature, max_tokens) -> str:
+    payload = json.dumps(
+        {"backend": backend_name, "model": model, "messages": messages,
+         "temperature": temperature, "max_tokens": max_tokens},
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Réponses LLM par hash du prompt (backend, modèle, messages, température, max_tokens).
+    Persistées en JSONL (une ligne ajoutée par nouvelle réponse) si path est donné.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._answers = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._answers[entry["key"]] = entry["answer"]
+
+    def get(self, key):
+        with self._lock:
+            answer = self._answers.get(key)
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return answer
+
+    def put(self, key, answer: str):
+        with self._lock:
+            self._answers[key] = answer
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"key": key, "answer": answer}, ensure_ascii=False) + "\n")
+
+    def wrap(self, backend, backend_name: str):
+        """Backend (voir rag.set_llm_backend) qui passe d'abord par le cache."""
+
+        def cached_backend(messages, model=None, temperature=None, max_tokens=500):
+            key = prompt_key(backend_name, messages, model, temperature, max_tokens)
+            answer = self.get(key)
+            if answer is None:
+                answer = backend(messages, model=model, temperature=temperature, max_tokens=max_tokens)
+                self.put(key, answer)
+            return answer
+
+        return cached_backend
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._answers),
+            "path": self.path,
+        }
+
+
+def load_test_set(path: str = None):
+    """Jeu de test JSONL ({"id", "question", "reference", ...} par ligne) ; défaut : TEST_SET_QA."""
+    if path is None:
+        return list(TEST_SET_QA)
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if line.strip():
+                item = json.loads(line)
+                item.setdefault("id", f"q{i}")
+                items.append(item)
+    return items
+
+
+def _backend(name: str):
+    if name == "stub":
+        return rag.stub_backend
+    if name == "groq":
+        return rag.groq_completion
+    raise ValueError(f"backend LLM inconnu : {name} (attendu : stub, groq)")
+
+
+def run_eval(
+    items=None,
+    backend: str = "stub",
+    workers: int = None,
+    cache_path: str = None,
+    use_cache: bool = True,
+    save_path: str = "eval_report.json",
+    top_failures: int = 3,
+):
+    """
+    Évalue baseline / rag / iterative sur items (défaut : TEST_SET_QA) en parallèle.
+    Le cache sémantique des réponses (config.ANSWER_CACHE) est coupé pendant l'éval :
+    chaque question est réellement traitée.
+    """
+    items = load_test_set() if items is None else items
+    workers = workers or config.EVAL_WORKERS
+    cache_path = cache_path or config.EVAL_LLM_CACHE_PATH
+    cache = LLMResponseCache(cache_path) if use_cache else None
+
+    llm = _backend(backend)
+    if cache is not None:
+        llm = cache.wrap(llm, backend)
+
+    previous_backend = rag.set_llm_backend(llm)
+    previous_answer_cache, config.ANSWER_CACHE = config.ANSWER_CACHE, False
+    t0 = time.perf_counter()
+    try:
+        resources.warmup(["parent_child"], rerank=True)  # chargé une fois, avant les threads
+        tasks = [(i, name) for i in range(len(items)) for name in SYSTEMS]
+        answers = [{} for _ in items]
+
+        def run_task(task):
+            i, name = task
+            answers[i][name] = SYSTEMS[name](items[i]["question"])
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="eval") as ex:
+            for done, _ in enumerate(ex.map(run_task, tasks), start=1):
+                if done % 50 == 0:
+                    print(f"{done}/{len(tasks)} réponses")
+    finally:
+        rag.set_llm_backend(previous_backend)
+        config.ANSWER_CACHE = previous_answer_cache
+    elapsed = time.perf_counter() - t0
+
+    # ordre des systèmes fixe dans le rapport, quel que soit l'ordre de fin des tâches
+    results = [result_row(item, {name: a[name] for name in SYSTEMS}) for item, a in zip(items, answers)]
+    report = build_report(results, top_failures)
+    report["run"] = {
+        "backend": backend,
+        "workers": workers,
+        "elapsed_s": elapsed,
+        "llm_cache": cache.stats() if cache is not None else None,
+    }
+    if save_path:
+        save_report(report, save_path)
+    print(f"{len(items)} questions en {elapsed:.1f}s ({workers} workers, backend {backend})")
+    return report
+
+
+if __name__ == "__main__":
+    flags = {a for a in sys.argv[1:] if a.startswith("--")}
+    positional = [a for a in sys.argv[1:] if not a.startswith("--")]
+    run_eval(
+        items=load_test_set(positional[0] if positional else None),
+        backend="groq" if "--groq" in flags else "stub",
+        use_cache="--no-cache" not in flags,
+        save_path=positional[1] if len(positional) > 1 else "eval_report.json",
+    )
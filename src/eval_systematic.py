@@ -101,30 +101,34 @@ def generate_answers(q: str) -> Dict[str, str]:
 # ----------------------------
 # Eval globale + rapport
 # ----------------------------
+def result_row(item: Dict, answers: Dict[str, str]) -> Dict:
+    row = {
+        "id": item["id"],
+        "question": item["question"],
+        "reference": item["reference"],
+        "answers": answers,
+        "metrics": {},
+    }
+
+    # metrics par système
+    for sys_name, pred in answers.items():
+        row["metrics"][sys_name] = compute_metrics(pred, item["reference"])
+    return row
+
+
 def evaluate_all(save_path: str = "eval_report.json", top_failures: int = 3):
     results: List[Dict] = []
 
     for item in TEST_SET_QA:
-        qid = item["id"]
-        q = item["question"]
-        ref = item["reference"]
+        answers = generate_answers(item["question"])
+        results.append(result_row(item, answers))
 
-        answers = generate_answers(q)
+    report = build_report(results, top_failures)
+    save_report(report, save_path)
+    return report
 
-        row = {
-            "id": qid,
-            "question": q,
-            "reference": ref,
-            "answers": answers,
-            "metrics": {},
-        }
-
-        # metrics par système
-        for sys_name, pred in answers.items():
-            row["metrics"][sys_name] = compute_metrics(pred, ref)
-
-        results.append(row)
 
+def build_report(results: List[Dict], top_failures: int = 3) -> Dict:
     # moyennes
     def avg(metric_name: str, sys_name: str) -> float:
         vals = [r["metrics"][sys_name][metric_name] for r in results]
@@ -165,12 +169,15 @@ def evaluate_all(save_path: str = "eval_report.json", top_failures: int = 3):
         ],
         "results": results,
     }
+    return report
+
 
+def save_report(report: Dict, save_path: str = "eval_report.json"):
     with open(save_path, "w", encoding="utf-8") as f:
         json.dump(report, f, ensure_ascii=False, indent=2)
 
     print("=== SUMMARY ===")
-    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    print(json.dumps(report["summary"], ensure_ascii=False, indent=2))
 
     print("\n=== TOP FAILURES (iterative, lowest ROUGE-L) ===")
     for f in report["failures_iterative_by_rougeL"]:
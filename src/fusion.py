@@ -0,0 +1,87 @@
+import numpy as np
+
+
+# Fusion de listes de résultats (dense, BM25...) sur des tableaux de lignes du corpus.
+# Tout reste en numpy jusqu'au top-k final : union des candidats, normalisation,
+# combinaison et sélection par argpartition ; les dicts de hits ne sont construits
+# qu'ensuite, pour les k lignes retenues (voir retrieval._fuse_hybrid).
+
+METHODS = ("minmax", "zscore", "rrf")
+
+
+def union_scores(row_lists, score_lists):
+    """
+    Union des candidats de plusieurs listes (lignes < 0 ignorées).
+    Retourne (rows triées, scores (n_listes, n_rows) à 0 si absent, présence booléenne,
+    rangs (n_listes, n_rows) dans chaque liste, -1 si absent).
+    """
+    row_lists = [np.asarray(r, dtype=np.int64).ravel() for r in row_lists]
+    score_lists = [np.asarray(s, dtype=np.float64).ravel() for s in score_lists]
+    valid = [r >= 0 for r in row_lists]
+
+    rows = np.unique(np.concatenate([r[v] for r, v in zip(row_lists, valid)]))
+    scores = np.zeros((len(row_lists), len(rows)), dtype=np.float64)
+    ranks = np.full((len(row_lists), len(rows)), -1, dtype=np.int64)
+    for i, (r, s, v) in enumerate(zip(row_lists, score_lists, valid)):
+        pos = np.searchsorted(rows, r[v])
+        scores[i, pos] = s[v]
+        ranks[i, pos] = np.flatnonzero(v)
+    return rows, scores, ranks >= 0, ranks
+
+
+def minmax(x):
+    """Min-max par ligne de x (n_listes, n) ; ligne constante -> 0."""
+    x = np.atleast_2d(x)
+    lo = x.min(axis=1, keepdims=True)
+    span = x.max(axis=1, keepdims=True) - lo
+    return np.divide(x - lo, span, out=np.zeros_like(x), where=span > 0)
+
+
+def zscore(x):
+    """z-score par ligne de x (n_listes, n) ; ligne constante -> 0."""
+    x = np.atleast_2d(x)
+    std = x.std(axis=1, keepdims=True)
+    return np.divide(x - x.mean(axis=1, keepdims=True), std, out=np.zeros_like(x), where=std > 0)
+
+
+def rrf(ranks, rrf_k: int = 60):
+    """Reciprocal Rank Fusion : 1 / (rrf_k + rang), rangs à partir de 1 ; 0 si absent."""
+    ranks = np.atleast_2d(ranks)
+    return np.where(ranks >= 0, 1.0 / (rrf_k + ranks + 1), 0.0)
+
+
+def fuse(row_lists, score_lists, weights=None, method: str = "minmax", rrf_k: int = 60):
+    """
+    Fusionne les listes (lignes, scores) :
+    - minmax / zscore : somme pondérée des scores normalisés (absent = score brut 0)
+    - rrf             : somme pondérée des 1 / (rrf_k + rang)
+    Retourne (rows, fused (n_rows,), raw (n_listes, n_rows), norm (n_listes, n_rows)).
+    """
+    if method not in METHODS:
+        raise ValueError(f"méthode de fusion inconnue : {method} (attendu : {', '.join(METHODS)})")
+    rows, raw, _, ranks = union_scores(row_lists, score_lists)
+    if len(rows) == 0:
+        empty = np.empty((len(row_lists), 0))
+        return rows, np.empty(0), empty, empty
+
+    if method == "minmax":
+        norm = minmax(raw)
+    elif method == "zscore":
+        norm = zscore(raw)
+    else:
+        norm = rrf(ranks, rrf_k)
+
+    weights = np.ones(len(row_lists)) if weights is None else np.asarray(weights, dtype=np.float64)
+    return rows, weights @ norm, raw, norm
+
+
+def top_k(scores, k: int):
+    """Positions des k meilleurs scores, triées par score décroissant (argpartition puis tri de k)."""
+    scores = np.asarray(scores)
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if n > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        return part[np.argsort(-scores[part], kind="stable")]
+    return np.argsort(-scores, kind="stable")
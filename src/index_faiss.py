@@ -1,42 +1,478 @@
 import os
+import sys
 import json
+import math
+import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
-from src import config
-from src.chunking import load_chunks_jsonl, build_and_save_chunks  
+from src import config, resources
+from src.bm25_index import BM25Index
+from src.chunk_store import ChunkStore, add_faiss_id_column, chunk_faiss_id, write_chunk_store
+from src.chunking import (
+    load_chunks_jsonl,
+    build_and_save_chunks,
+    build_all_chunks,
+    build_structured_chunks,
+    read_chunk_sources,
+    save_jsonl,
+    source_hashes,
+    write_chunk_sources,
+)
+from src.ingest import load_rsts, prepare_docs
 
 
-# Modèle embeddings
-EMB_MODEL = SentenceTransformer(config.MODEL_NAME)
+def __getattr__(name):
+    # Modèle embeddings partagé avec src.retrieval (une seule copie par processus)
+    if name == "EMB_MODEL":
+        return resources.get_embedding_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-def build_index(chunks, index_path, meta_path):
-    texts = [c["text"] for c in chunks]
-    print(f"Encodage de {len(texts)} chunks.")
+# Types d'index FAISS disponibles (produit scalaire sur vecteurs normalisés)
+#   flat     : exact, O(N·d) par requête
+#   ivf_flat : N vecteurs répartis en nlist listes (centroïdes entraînés), on en visite nprobe
+#   hnsw     : graphe HNSW (M voisins / nœud), largeur de recherche efSearch
+#   ivf_pq   : IVF + vecteurs compressés en m sous-vecteurs de nbits
+# Stockage quantifié, scan exhaustif comme flat :
+#   fp16     : float16 par composante (2x plus petit)
+#   sq8      : int8 par composante, bornes entraînées (4x plus petit)
+#   binary   : 1 bit par composante (au-dessus / en dessous de la médiane apprise de la
+#              composante), distance de Hamming (32x plus petit)
+# Avec rescore=f (ces trois types), on lit k·f candidats dans l'index compressé puis
+# on les re-score en produit scalaire exact sur des vecteurs float16 / float32 gardés
+# à côté de l'index (fichier mappé : seules les lignes candidates sont lues).
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "fp16", "sq8", "binary")
+QUANTIZED_TYPES = ("fp16", "sq8", "binary")
 
-    embeddings = EMB_MODEL.encode(
+DEFAULT_INDEX_PARAMS = {
+    "flat": {},
+    "ivf_flat": {"nlist": None, "nprobe": 8},
+    "hnsw": {"M": 32, "ef_construction": 200, "ef_search": 64},
+    "ivf_pq": {"nlist": None, "m": 16, "nbits": 8, "nprobe": 8},
+    "fp16": {"rescore": None, "rescore_dtype": "float16"},
+    "sq8": {"rescore": None, "rescore_dtype": "float16"},
+    "binary": {"rescore": 32, "rescore_dtype": "float16"},
+}
+
+
+def needs_training(index_type: str) -> bool:
+    return index_type.startswith("ivf") or index_type in ("sq8", "binary")
+
+
+def _auto_nlist(n: int) -> int:
+    # ~4·sqrt(N) listes, en gardant au moins ~39 points d'entraînement par centroïde
+    return max(1, min(int(4 * math.sqrt(n)), n // 39 or 1))
+
+
+def create_index(embeddings, index_type: str = "flat", ids=None, **params):
+    """
+    Crée, entraîne si besoin, et remplit un index FAISS du type demandé.
+    ids : ids int64 stables des vecteurs (sinon l'index renvoie les numéros de ligne).
+    Retourne (index, params effectifs).
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"index_type doit être parmi {INDEX_TYPES}")
+
+    p = dict(DEFAULT_INDEX_PARAMS[index_type])
+    p.update({k: v for k, v in params.items() if v is not None})
+    n, dim = embeddings.shape
+    metric = faiss.METRIC_INNER_PRODUCT
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+
+    elif index_type in ("fp16", "sq8"):
+        qtype = faiss.ScalarQuantizer.QT_fp16 if index_type == "fp16" else faiss.ScalarQuantizer.QT_8bit
+        index = faiss.IndexScalarQuantizer(dim, qtype, metric)
+        if index_type == "sq8":
+            index.train(embeddings)
+
+    elif index_type == "binary":
+        # bit i = composante i au-dessus de son seuil (médiane sur l'échantillon d'entraînement ;
+        # les embeddings ne sont pas centrés, le simple signe donnerait des bits presque constants)
+        index = faiss.IndexLSH(dim, dim, False, True)
+        index.train(embeddings)
+
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, p["M"], metric)
+        index.hnsw.efConstruction = p["ef_construction"]
+        index.hnsw.efSearch = p["ef_search"]
+
+    else:
+        p["nlist"] = p["nlist"] or _auto_nlist(n)
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, p["nlist"], metric)
+        else:
+            if dim % p["m"]:
+                raise ValueError(f"m={p['m']} doit diviser la dimension {dim}")
+            # pas assez de points pour 2^nbits centroïdes par sous-quantifieur
+            p["nbits"] = max(1, min(p["nbits"], int(math.log2(max(n // 39, 2)))))
+            index = faiss.IndexIVFPQ(quantizer, dim, p["nlist"], p["m"], p["nbits"], metric)
+        index.train(embeddings)
+        index.nprobe = p["nprobe"]
+
+    if ids is None:
+        index.add(embeddings)
+        return index, p
+
+    # IVF gère les ids nativement ; les autres passent par un IndexIDMap2
+    if not index_type.startswith("ivf"):
+        index = faiss.IndexIDMap2(index)
+    index.add_with_ids(embeddings, np.asarray(ids, dtype=np.int64))
+    return index, p
+
+
+def _base_index(index):
+    """Index sous-jacent (sans l'éventuel IndexIDMap)."""
+    base = faiss.downcast_index(index)
+    if isinstance(base, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        base = faiss.downcast_index(base.index)
+    return base
+
+
+def manifest_path(index_path):
+    return index_path + ".json"
+
+
+def write_manifest(index_path, manifest):
+    with open(manifest_path(index_path), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def read_manifest(index_path):
+    """Manifest de l'index ; les anciens index sans manifest sont des IndexFlatIP."""
+    path = manifest_path(index_path)
+    if not os.path.exists(path):
+        return {"index_type": "flat", "params": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def search_params(index, nprobe: int = None, ef_search: int = None):
+    """
+    Paramètres de recherche par requête (n'affectent pas l'index partagé entre threads).
+    Retourne None si rien à changer ou si le type d'index n'a pas ce réglage.
+    """
+    if ef_search is not None and isinstance(_base_index(index), faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    if nprobe is not None:
+        try:
+            faiss.extract_index_ivf(index)
+        except RuntimeError:
+            return None
+        return faiss.SearchParametersIVF(nprobe=nprobe)
+    return None
+
+
+def search_index(index, queries, k: int, nprobe: int = None, ef_search: int = None):
+    """
+    index.search avec les réglages nprobe / efSearch optionnels.
+    Index binaire : les distances de Hamming h sont converties en similarité 1 - 2h/d
+    (même sens que le produit scalaire : plus grand = plus proche).
+    """
+    if isinstance(index, RescoredIndex):
+        return index.search(queries, k, nprobe=nprobe, ef_search=ef_search)
+    params = search_params(index, nprobe=nprobe, ef_search=ef_search)
+    if params is None:
+        scores, ids = index.search(queries, k)
+    else:
+        scores, ids = index.search(queries, k, params=params)
+    if isinstance(_base_index(index), faiss.IndexLSH):
+        scores = 1.0 - 2.0 * scores / index.d
+    return scores, ids
+
+
+# ----------------------------
+# Re-scoring des index quantifiés
+# ----------------------------
+
+def rescore_paths(index_path):
+    """Vecteurs de re-scoring (binaire brut n×d, dtype du manifest) et leurs ids."""
+    return index_path + ".rescore", index_path + ".rescore_ids.npy"
+
+
+class RescoreWriter:
+    """
+    Écrit les vecteurs de re-scoring lot par lot (sans garder tout le corpus en float32) ;
+    les ids sont gardés dans l'ordre d'ajout, l'ordre des lignes du fichier.
+    """
+
+    def __init__(self, index_path, dtype: str = "float16"):
+        self.vec_path, self.ids_path = rescore_paths(index_path)
+        self.dtype = np.dtype(dtype)
+        self._ids = []
+        os.makedirs(os.path.dirname(self.vec_path) or ".", exist_ok=True)
+        self._f = open(self.vec_path + ".tmp", "wb")
+
+    def add(self, embeddings, ids):
+        self._f.write(np.ascontiguousarray(embeddings, dtype=self.dtype).tobytes())
+        self._ids.append(np.asarray(ids, dtype=np.int64))
+
+    def close(self):
+        self._f.close()
+        ids = np.concatenate(self._ids) if self._ids else np.empty(0, dtype=np.int64)
+        np.save(self.ids_path + ".tmp.npy", ids)
+        os.replace(self.ids_path + ".tmp.npy", self.ids_path)
+        os.replace(self.vec_path + ".tmp", self.vec_path)
+
+    def abort(self):
+        self._f.close()
+        os.remove(self._f.name)
+
+
+def read_rescore_vectors(index_path, dim: int, dtype: str, mmap: bool = True):
+    """(vecteurs (n, dim), ids (n,)) écrits par RescoreWriter ; vecteurs en mmap par défaut."""
+    vec_path, ids_path = rescore_paths(index_path)
+    if mmap:
+        vectors = np.memmap(vec_path, dtype=dtype, mode="r")
+    else:
+        vectors = np.fromfile(vec_path, dtype=dtype)
+    return vectors.reshape(-1, dim), np.load(ids_path)
+
+
+class RescoredIndex:
+    """
+    Index compressé + re-scoring : k·k_factor candidats lus dans l'index, puis
+    produit scalaire exact avec les vecteurs float16 / float32 de ces seuls candidats.
+    ids=None : les lignes de `vectors` sont les numéros renvoyés par l'index.
+    Le reste (ntotal, d, ...) est délégué à l'index FAISS.
+    """
+
+    def __init__(self, index, vectors, ids=None, k_factor: int = 10):
+        self.index = index
+        self.vectors = vectors
+        self.k_factor = int(k_factor)
+        if ids is None:
+            self._order, self._sorted_ids = None, None
+        else:
+            self._order = np.argsort(ids, kind="stable")
+            self._sorted_ids = np.asarray(ids)[self._order]
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+    def _rows(self, ids):
+        """Lignes de `vectors` pour les ids renvoyés par l'index (-1 si inconnu)."""
+        if self._sorted_ids is None:
+            return np.where((ids >= 0) & (ids < len(self.vectors)), ids, -1)
+        pos = np.clip(np.searchsorted(self._sorted_ids, ids), 0, max(len(self._sorted_ids) - 1, 0))
+        found = (ids >= 0) & (self._sorted_ids[pos] == ids)
+        return np.where(found, self._order[pos], -1)
+
+    def search(self, queries, k: int, nprobe: int = None, ef_search: int = None):
+        _, cand = search_index(self.index, queries, k * self.k_factor, nprobe=nprobe, ef_search=ef_search)
+        rows = self._rows(cand)
+        valid = rows >= 0
+        vecs = np.asarray(self.vectors[np.maximum(rows, 0)], dtype=np.float32)  # (n, k·f, d)
+        scores = np.einsum("nkd,nd->nk", vecs, queries)
+        scores[~valid] = -np.inf
+
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        top_scores = np.take_along_axis(scores, order, axis=1)
+        top_ids = np.where(np.isfinite(top_scores), np.take_along_axis(cand, order, axis=1), -1)
+        return top_scores.astype(np.float32), top_ids
+
+
+def _encode_texts(texts, show_progress_bar: bool = True):
+    embeddings = resources.get_embedding_model().encode(
         texts,
         batch_size=32,
         convert_to_numpy=True,
-        show_progress_bar=True
+        show_progress_bar=show_progress_bar
     )
-
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
     faiss.normalize_L2(embeddings)
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(embeddings)
+    return embeddings
+
+
+def embed_texts(texts, verbose: bool = True):
+    """
+    Embeddings normalisés des textes ; avec le store de chunks activé,
+    seuls les textes jamais encodés passent par le modèle.
+    verbose=False : ni barre de progression ni bilan (appels par lots).
+    """
+    def encode(batch):
+        return _encode_texts(batch, show_progress_bar=verbose)
+
+    store = resources.get_chunk_embedding_store()
+    if store is None:
+        return encode(texts)
+
+    before = store.stats()["misses"]
+    embeddings = store.encode(texts, encode)
+    if verbose:
+        print(f"Store d'embeddings : {store.stats()['misses'] - before} textes encodés sur {len(texts)}.")
+    return np.ascontiguousarray(embeddings, dtype="float32")
+
 
+def _save_index(index, index_path, index_type, params):
+    # écriture dans un .tmp puis renommage atomique
     os.makedirs(os.path.dirname(index_path), exist_ok=True)
-    faiss.write_index(index, index_path)
+    faiss.write_index(index, index_path + ".tmp")
+    os.replace(index_path + ".tmp", index_path)
+    write_manifest(index_path, {
+        "index_type": index_type,
+        "params": params,
+        "dim": int(index.d),
+        "ntotal": int(index.ntotal),
+        "metric": "inner_product",
+        "model": config.MODEL_NAME,
+        "ids": "chunk_hash",
+        "bytes_per_vector": _code_size(index),
+    })
+    if not (params or {}).get("rescore"):
+        # index sans re-scoring : on retire les vecteurs laissés par un index précédent
+        for path in rescore_paths(index_path):
+            if os.path.exists(path):
+                os.remove(path)
 
-    with open(meta_path, "w", encoding="utf-8") as f:
+
+def _code_size(index):
+    """Octets stockés par vecteur (codes FAISS, sans les ids) ; None si inconnu."""
+    base = _base_index(index)
+    try:
+        return int(faiss.extract_index_ivf(index).code_size)
+    except RuntimeError:
+        pass
+    if isinstance(base, faiss.IndexHNSW):
+        base = faiss.downcast_index(base.storage)
+    size = getattr(base, "code_size", None)
+    return int(size) if size is not None else None
+
+
+def _save_chunks(chunks, meta_path):
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
         for c in chunks:
             f.write(json.dumps(c, ensure_ascii=False) + "\n")
+    os.replace(meta_path + ".tmp", meta_path)
+
+    # store colonne (textes en blob mmap) utilisé au moment des requêtes
+    write_chunk_store(chunks, store_prefix(meta_path))
+
+
+def write_bm25(store, prefix: str = None):
+    """Index BM25 des textes du store, avec son empreinte (vérifiée au chargement)."""
+    bm25 = BM25Index.from_texts(store.texts())
+    bm25.fingerprint = store.fingerprint()
+    bm25.save(prefix or resources.BM25_PREFIX)
+    return bm25
+
+
+def build_index(chunks, index_path, meta_path, index_type: str = "flat", index_params: dict = None):
+    """
+    Encode et indexe par lots de config.INDEX_BUILD_BATCH chunks : les embeddings float32
+    du corpus entier ne sont jamais en mémoire en même temps (seulement l'échantillon
+    d'entraînement pour IVF / sq8, et ce que l'index stocke lui-même).
+    """
+    from src.pipeline import IndexSink  # src.pipeline importe ce module
+
+    print(f"Encodage de {len(chunks)} chunks.")
+    store = resources.get_chunk_embedding_store()
+    before = store.stats()["misses"] if store is not None else None
+
+    sink = IndexSink(index_type, index_params, index_path=index_path)
+    batch_size = config.INDEX_BUILD_BATCH
+    try:
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            embeddings = embed_texts([c["text"] for c in batch], verbose=False)
+            sink.add(embeddings, [chunk_faiss_id(c.get("chunk_id")) for c in batch])
+    except BaseException:
+        sink.abort()
+        raise
+    index, params = sink.finish()
+    if index is None:
+        raise RuntimeError(f"Aucun chunk à indexer : {index_path}")
+    if store is not None:
+        print(f"Store d'embeddings : {store.stats()['misses'] - before} textes encodés sur {len(chunks)}.")
+
+    _save_index(index, index_path, index_type, params)
+    _save_chunks(chunks, meta_path)
+
+    print(f"Index {index_type} + meta sauvegardés :", index_path, meta_path)
+
+
+def update_index(chunks, changed_sources, index_path, meta_path):
+    """
+    Mise à jour incrémentale : `chunks` est la liste complète à jour,
+    seuls les chunks des sources de `changed_sources` (ou nouveaux) sont encodés ;
+    les vecteurs des chunks disparus ou modifiés sont retirés de l'index.
+    """
+    manifest = read_manifest(index_path)
+    prefix = store_prefix(meta_path)
+    if manifest.get("ids") != "chunk_hash" or not os.path.exists(index_path) or not ChunkStore.exists(prefix):
+        print("Index sans ids stables, reconstruction complète :", index_path)
+        return build_index(chunks, index_path, meta_path, manifest["index_type"], manifest.get("params"))
 
-    print("Index + meta sauvegardés :", index_path, meta_path)
+    index = load_index(index_path, mmap=False, rescore=False)  # modifié puis réécrit
+    old_store = ChunkStore.open(prefix, mmap=False)
+    old_ids = set(np.asarray(old_store.faiss_ids).tolist())
+    new_ids = [chunk_faiss_id(c.get("chunk_id")) for c in chunks]
 
+    new_id_set = set(new_ids)
+    stale = [
+        fid for row, fid in enumerate(np.asarray(old_store.faiss_ids).tolist())
+        if fid not in new_id_set or old_store.field("source", row) in changed_sources
+    ]
+    to_add = [
+        (c, fid) for c, fid in zip(chunks, new_ids)
+        if c.get("source") in changed_sources or fid not in old_ids
+    ]
+    print(f"{index_path} : {len(stale)} vecteurs retirés, {len(to_add)} chunks encodés.")
 
-def build_all_indexes():
+    embeddings = embed_texts([c["text"] for c, _ in to_add]) if to_add else None
+    add_ids = np.asarray([fid for _, fid in to_add], dtype=np.int64)
+    index_type, params = manifest["index_type"], manifest.get("params", {})
+
+    if index_type == "hnsw":
+        # HNSW ne supporte pas remove_ids : on reconstruit le graphe à partir
+        # des vecteurs conservés (sans ré-encoder) + les nouveaux
+        stale_set = set(stale)
+        kept_ids = np.asarray([fid for fid in old_ids if fid not in stale_set], dtype=np.int64)
+        vectors = [index.reconstruct(int(fid)) for fid in kept_ids]
+        all_vecs = np.vstack(vectors + ([embeddings] if embeddings is not None else [])).astype("float32")
+        all_ids = np.concatenate([kept_ids, add_ids])
+        index, params = create_index(all_vecs, index_type, ids=all_ids, **params)
+    else:
+        if stale:
+            index.remove_ids(np.asarray(stale, dtype=np.int64))
+        if embeddings is not None:
+            index.add_with_ids(embeddings, add_ids)
+
+    if params.get("rescore"):
+        # vecteurs de re-scoring : lignes conservées + nouveaux chunks
+        old_vecs, old_vec_ids = read_rescore_vectors(index_path, int(index.d), params["rescore_dtype"])
+        keep = ~np.isin(old_vec_ids, np.asarray(stale, dtype=np.int64))
+        writer = RescoreWriter(index_path, params["rescore_dtype"])
+        writer.add(old_vecs[keep], old_vec_ids[keep])
+        if embeddings is not None:
+            writer.add(embeddings, add_ids)
+        writer.close()
+
+    _save_index(index, index_path, index_type, params)
+    _save_chunks(chunks, meta_path)
+
+
+# Manifest des sources (hash du .rst brut) pour les builds incrémentaux
+SOURCES_MANIFEST_PATH = os.path.join(config.INDEX_DIR, "sources_manifest.json")
+
+
+def read_sources_manifest():
+    if not os.path.exists(SOURCES_MANIFEST_PATH):
+        return None
+    with open(SOURCES_MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_sources_manifest(hashes, chunking: dict):
+    with open(SOURCES_MANIFEST_PATH + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"chunking": chunking, "sources": hashes}, f, ensure_ascii=False, indent=2)
+    os.replace(SOURCES_MANIFEST_PATH + ".tmp", SOURCES_MANIFEST_PATH)
+
+
+def build_all_indexes(index_type: str = None, index_params: dict = None):
+    index_type = index_type or config.INDEX_TYPE
+    index_params = config.INDEX_PARAMS if index_params is None else index_params
     os.makedirs(config.INDEX_DIR, exist_ok=True)
     os.makedirs(config.PROCESSED_DIR, exist_ok=True)
 
@@ -54,18 +490,147 @@ def build_all_indexes():
     build_index(
         chunks_fixed,
         os.path.join(config.INDEX_DIR, "index_fixed.faiss"),
-        os.path.join(config.INDEX_DIR, "meta_fixed.jsonl")
+        os.path.join(config.INDEX_DIR, "meta_fixed.jsonl"),
+        index_type=index_type,
+        index_params=index_params,
     )
 
+    write_bm25(ChunkStore.open(store_prefix(os.path.join(config.INDEX_DIR, "meta_fixed.jsonl"))))
+    print("Index BM25 sauvegardé :", resources.BM25_PREFIX)
+
     build_index(
         chunks_semantic,
         os.path.join(config.INDEX_DIR, "index_semantic.faiss"),
-        os.path.join(config.INDEX_DIR, "meta_semantic.jsonl")
+        os.path.join(config.INDEX_DIR, "meta_semantic.jsonl"),
+        index_type=index_type,
+        index_params=index_params,
     )
 
-    print("Index FIXED + SEMANTIC construits.")
+    # chunks structurés : générés à part s'ils manquent (build antérieur au chunker structuré)
+    structured_chunks_path = os.path.join(config.PROCESSED_DIR, "chunks_structured.jsonl")
+    if os.path.exists(structured_chunks_path):
+        chunks_structured = load_chunks_jsonl(structured_chunks_path)
+        build_index(
+            chunks_structured,
+            os.path.join(config.INDEX_DIR, "index_structured.faiss"),
+            os.path.join(config.INDEX_DIR, "meta_structured.jsonl"),
+            index_type=index_type,
+            index_params=index_params,
+        )
+    elif os.path.isdir(config.RAW_DIR):
+        print("Chunks structurés manquants alors génération.")
+        chunks_structured = build_structured_chunks(prepare_docs(load_rsts()))
+        save_jsonl(chunks_structured, structured_chunks_path)
+        build_index(
+            chunks_structured,
+            os.path.join(config.INDEX_DIR, "index_structured.faiss"),
+            os.path.join(config.INDEX_DIR, "meta_structured.jsonl"),
+            index_type=index_type,
+            index_params=index_params,
+        )
+
+    # manifest = sources dont les chunks indexés sont issus (pas l'état actuel de data/raw)
+    chunk_sources = read_chunk_sources()
+    if chunk_sources is not None:
+        write_sources_manifest(chunk_sources["sources"], chunk_sources["chunking"])
+    elif os.path.exists(SOURCES_MANIFEST_PATH):
+        print("Sources des chunks inconnues : manifest retiré, prochaine mise à jour en build complet.")
+        os.remove(SOURCES_MANIFEST_PATH)
+
+    print("Index FIXED + SEMANTIC + STRUCTURED construits.")
     print("Contenu de index/ :", os.listdir(config.INDEX_DIR))
 
+def _current_index_type(index_path):
+    """
+    (index_type, params) pour reconstruire index_path : son manifest s'il existe,
+    sinon celui de l'index fixed (type du dernier build), sinon la config.
+    """
+    fixed_path = os.path.join(config.INDEX_DIR, "index_fixed.faiss")
+    for path in (index_path, fixed_path):
+        if os.path.exists(manifest_path(path)):
+            manifest = read_manifest(path)
+            return manifest["index_type"], manifest.get("params", {})
+    return config.INDEX_TYPE, config.INDEX_PARAMS
+
+
+def update_all_indexes(max_words: int = 500, overlap: int = 100):
+    """
+    Build incrémental : ne re-découpe et ne ré-encode que les sources
+    dont le hash a changé depuis le dernier build.
+    """
+    chunking = {"max_words": max_words, "overlap": overlap}
+    docs = load_rsts()
+    hashes = source_hashes(docs)
+    previous = read_sources_manifest()
+
+    if previous is None or previous.get("chunking") != chunking:
+        print("Pas de manifest compatible : build complet.")
+        build_and_save_chunks(max_words=max_words, overlap=overlap)
+        build_all_indexes()
+        return
+
+    changed = {s for s, h in hashes.items() if previous["sources"].get(s) != h}
+    removed = set(previous["sources"]) - set(hashes)
+    if not changed and not removed:
+        print("Aucune source modifiée, index à jour.")
+        return
+    print(f"Sources modifiées : {sorted(changed)} | supprimées : {sorted(removed)}")
+
+    changed_docs = prepare_docs([d for d in docs if d["id"] in changed])
+    new_fixed, new_semantic = build_all_chunks(changed_docs, max_words=max_words, overlap=overlap)
+    new_structured = build_structured_chunks(changed_docs)
+    dropped = changed | removed
+
+    all_chunks = {}
+
+    def full_chunks(name):
+        # toutes les sources, découpées avec le chunker de ce type d'index
+        if name not in all_chunks:
+            prepared = prepare_docs(docs)
+            if name == "structured":
+                all_chunks[name] = build_structured_chunks(prepared)
+            else:
+                all_chunks["fixed"], all_chunks["semantic"] = build_all_chunks(
+                    prepared, max_words=max_words, overlap=overlap
+                )
+        return all_chunks[name]
+
+    for name, new_chunks in (("fixed", new_fixed), ("semantic", new_semantic), ("structured", new_structured)):
+        index_path = os.path.join(config.INDEX_DIR, f"index_{name}.faiss")
+        meta_path = os.path.join(config.INDEX_DIR, f"meta_{name}.jsonl")
+        if not ChunkStore.exists(store_prefix(meta_path)):
+            # index absent (ex. build antérieur au chunker structuré) : construit en entier, une fois
+            print("Index absent, construction complète :", index_path)
+            chunks = full_chunks(name)
+            save_jsonl(chunks, os.path.join(config.PROCESSED_DIR, f"chunks_{name}.jsonl"))
+            index_type, index_params = _current_index_type(index_path)
+            build_index(chunks, index_path, meta_path, index_type, index_params)
+            continue
+
+        old_store = ChunkStore.open(store_prefix(meta_path))
+        kept = []
+        for r in range(len(old_store)):
+            if old_store.field("source", r) in dropped:
+                continue
+            c = old_store.meta(r)
+            # position stockée : celle du chunker (l'id structuré ne se termine pas par la position)
+            if old_store.position(r) is not None:
+                c["position"] = old_store.position(r)
+            if c.get("section") is not None:
+                c["section_path"] = c["section"].split(" > ")
+            kept.append(c)
+        chunks = kept + new_chunks
+        save_jsonl(chunks, os.path.join(config.PROCESSED_DIR, f"chunks_{name}.jsonl"))
+        update_index(chunks, changed, index_path, meta_path)
+
+        if name == "fixed":
+            write_bm25(ChunkStore.open(store_prefix(meta_path)))
+
+    write_chunk_sources(hashes, chunking)
+    write_sources_manifest(hashes, chunking)
+    print("Index mis à jour (incrémental).")
+
+
 def load_jsonl(path):
     items = []
     with open(path, "r", encoding="utf-8") as f:
@@ -74,10 +639,109 @@ def load_jsonl(path):
     return items
 
 
+def store_prefix(meta_path):
+    # index/meta_fixed.jsonl -> index/meta_fixed.{text.bin, ...}
+    return os.path.splitext(meta_path)[0]
+
+
+def read_index(index_path, mmap: bool = None):
+    """
+    mmap=True (défaut : config.INDEX_MMAP) : les vecteurs / listes inversées
+    restent dans le fichier, mappé en lecture seule ; les processus qui servent
+    le même index partagent ces pages au lieu d'en avoir chacun une copie.
+    L'index est alors en lecture seule (pas d'add / remove_ids).
+    """
+    if mmap is None:
+        mmap = config.INDEX_MMAP
+    if mmap:
+        try:
+            return faiss.read_index(index_path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print("Lecture mmap impossible, lecture en mémoire :", index_path, e)
+    return faiss.read_index(index_path)
+
+
+def load_index(index_path, mmap: bool = None, rescore: bool = True):
+    """
+    Lit l'index et applique les réglages de recherche par défaut du manifest
+    (nprobe pour IVF, efSearch pour HNSW). Index quantifié avec rescore dans le
+    manifest : renvoie un RescoredIndex (rescore=False : l'index FAISS seul).
+    """
+    if mmap is None:
+        mmap = config.INDEX_MMAP
+    index = read_index(index_path, mmap=mmap)
+    params = read_manifest(index_path).get("params", {})
+    if rescore and params.get("rescore"):
+        vectors, ids = read_rescore_vectors(index_path, int(index.d), params["rescore_dtype"], mmap=mmap)
+        return RescoredIndex(index, vectors, ids, params["rescore"])
+    if params.get("nprobe") is not None:
+        try:
+            faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+        except RuntimeError:
+            pass
+    if params.get("ef_search") is not None:
+        base = _base_index(index)
+        if isinstance(base, faiss.IndexHNSW):
+            base.hnsw.efSearch = params["ef_search"]
+    return index
+
+
 def load_index_and_meta(index_path, meta_path):
-    index = faiss.read_index(index_path)
+    index = load_index(index_path)
     metas = load_jsonl(meta_path)
     return index, metas
 
+
+def load_index_and_store(index_path, meta_path):
+    """
+    Comme load_index_and_meta, mais les chunks sont chargés en ChunkStore
+    (colonnes + blob de texte en mmap). Sans store sur disque, on le
+    construit en mémoire depuis le JSONL.
+    """
+    index = load_index(index_path)
+    prefix = store_prefix(meta_path)
+    if ChunkStore.exists(prefix):
+        store = ChunkStore.open(prefix)
+    else:
+        store = ChunkStore.from_metas(load_jsonl(meta_path))
+    return index, store
+
+
+def prepare_serving_files():
+    """
+    Écrit une fois sur disque tout ce que les workers lisent en mmap
+    (chunk stores avec leur colonne faiss_id, index BM25), pour qu'aucun
+    worker n'ait à reconstruire ces structures dans sa propre mémoire.
+    """
+    for _, meta_path in resources.INDEX_PATHS.values():
+        prefix = store_prefix(meta_path)
+        if not ChunkStore.exists(prefix):
+            if not os.path.exists(meta_path):
+                continue
+            print("Écriture du chunk store :", prefix)
+            write_chunk_store(load_jsonl(meta_path), prefix)
+        elif add_faiss_id_column(prefix):
+            print("Colonne faiss_id ajoutée :", prefix)
+
+    fixed_prefix = store_prefix(resources.INDEX_PATHS["fixed"][1])
+    if ChunkStore.exists(fixed_prefix):
+        store = ChunkStore.open(fixed_prefix)
+        bm25_ok = (
+            BM25Index.exists(resources.BM25_PREFIX)
+            and BM25Index.load(resources.BM25_PREFIX).fingerprint == store.fingerprint()
+        )
+        if not bm25_ok:
+            print("Écriture de l'index BM25 :", resources.BM25_PREFIX)
+            write_bm25(store)
+
+
 if __name__ == "__main__":
-    build_all_indexes()
+    # python -m src.index_faiss [--incremental] [--index-type=sq8] [--rescore=4]
+    opts = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    if "--incremental" in sys.argv:
+        update_all_indexes()
+    else:
+        params = dict(config.INDEX_PARAMS)
+        if "rescore" in opts:
+            params["rescore"] = int(opts["rescore"])
+        build_all_indexes(index_type=opts.get("index-type"), index_params=params)
@@ -1,71 +1,205 @@
 import os
 import glob
+import json
+import hashlib
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from src import config
 
 
-def download_symfony_docs():
-    os.makedirs(config.RAW_DIR, exist_ok=True)
+_thread_local = threading.local()
 
-    for f in config.FILES:
-        url = config.BASE_URL + f
-        print("Téléchargement :", url)
-        response = requests.get(url)
 
-        if response.status_code == 200:
-            with open(os.path.join(config.RAW_DIR, f), "w", encoding="utf-8") as file:
-                file.write(response.text)
-            print("Enregistré dans", os.path.join(config.RAW_DIR, f))
-        else:
-            print(f"Erreur pour {f} :", response.status_code)
+def get_session(pool_size: int = None):
+    """
+    Session HTTP du thread courant : connexions keep-alive réutilisées
+    et retries avec backoff sur les erreurs transitoires (429, 5xx).
+    """
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        pool_size = pool_size or config.DOWNLOAD_WORKERS
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _thread_local.session = session
+    return session
+
+
+def read_download_manifest(path=None):
+    path = path or config.DOWNLOAD_MANIFEST_PATH
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_download_manifest(manifest, path=None):
+    path = path or config.DOWNLOAD_MANIFEST_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def fetch_file(f, base_url, raw_dir, entry=None, timeout: float = 30.0):
+    """
+    Télécharge un fichier (requête conditionnelle si on a déjà un ETag / Last-Modified).
+    Retourne (statut, entrée de manifest) ; statut = "downloaded", "not_modified" ou "error".
+    """
+    url = base_url + f
+    dest = os.path.join(raw_dir, f)
+    headers = {}
+    if entry and os.path.exists(dest):
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    try:
+        response = get_session().get(url, headers=headers, timeout=timeout)
+    except requests.RequestException as e:
+        print(f"Erreur pour {f} :", e)
+        return "error", entry
+
+    if response.status_code == 304:
+        return "not_modified", entry
+    if response.status_code != 200:
+        print(f"Erreur pour {f} :", response.status_code)
+        return "error", entry
+
+    # sous-dossiers (setup/docker.rst...) + écriture atomique
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    with open(dest + ".tmp", "wb") as file:
+        file.write(response.content)
+    os.replace(dest + ".tmp", dest)
+
+    return "downloaded", {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha1": hashlib.sha1(response.content).hexdigest(),
+    }
+
+
+def download_symfony_docs(files=None, base_url=None, raw_dir=None, workers: int = None, manifest_path=None):
+    """
+    Télécharge les fichiers en parallèle (pool de threads, sessions keep-alive).
+    Les fichiers inchangés depuis le dernier téléchargement ne sont pas
+    retransférés (ETag / If-Modified-Since -> 304), grâce au manifest.
+    """
+    files = list(files or config.FILES)
+    base_url = base_url or config.BASE_URL
+    raw_dir = raw_dir or config.RAW_DIR
+    workers = workers or config.DOWNLOAD_WORKERS
+    os.makedirs(raw_dir, exist_ok=True)
+
+    manifest = read_download_manifest(manifest_path)
+    counts = {"downloaded": 0, "not_modified": 0, "error": 0}
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download") as ex:
+        futures = {ex.submit(fetch_file, f, base_url, raw_dir, manifest.get(f)): f for f in files}
+        for fut in as_completed(futures):
+            f = futures[fut]
+            status, entry = fut.result()
+            counts[status] += 1
+            if entry is not None:
+                manifest[f] = entry
+            if status == "downloaded":
+                print("Enregistré dans", os.path.join(raw_dir, f))
+
+    write_download_manifest(manifest, manifest_path)
+    print(f"Téléchargés : {counts['downloaded']}, inchangés : {counts['not_modified']}, erreurs : {counts['error']}")
+    return counts
+
+
+def list_symfony_docs_files(tree_url=None):
+    """
+    Liste tous les .rst du dépôt symfony-docs (API GitHub, arbre récursif) :
+    download_symfony_docs(list_symfony_docs_files()) fait un miroir complet.
+    """
+    response = get_session().get(tree_url or config.DOCS_TREE_URL, timeout=30)
+    response.raise_for_status()
+    return sorted(
+        item["path"] for item in response.json().get("tree", [])
+        if item.get("type") == "blob" and item["path"].endswith(".rst")
+    )
 
 
 def load_rsts(folder=None):
+    """
+    Charge récursivement les .rst de `folder` ; l'id d'un document est son chemin
+    relatif (ex. "setup/docker.rst"), comme dans config.FILES.
+    """
+    return list(iter_rsts(folder))
+
+
+def iter_rsts(folder=None):
+    """Comme load_rsts, mais un document à la fois (un seul texte en mémoire)."""
     folder = folder or config.RAW_DIR
-    docs = []
-    for path in glob.glob(os.path.join(folder, "*.rst")):
+    for path in sorted(glob.glob(os.path.join(folder, "**", "*.rst"), recursive=True)):
         with open(path, "r", encoding="utf-8") as f:
             text = f.read()
-        docs.append({
-            "id": os.path.basename(path),
+        yield {
+            "id": os.path.relpath(path, folder).replace(os.sep, "/"),
             "path": path,
             "text": text
-        })
-    return docs
+        }
+
+
+DECORATION_CHARS = frozenset("=~`-^\"'*+_#-")
+ROLE_RE = re.compile(r":\w+:`([^`<]+)(?:<[^`]+>)?`")
+LITERAL_RE = re.compile(r"``([^`]+)``")
 
 
 def clean_text(text: str) -> str:
+    """
+    Nettoyage RST : directives et lignes de décoration retirées, rôles / littéraux
+    inline remplacés par leur texte, espaces compactés, au plus une ligne vide d'affilée.
+    Les motifs sont compilés une fois ; hors substitutions inline (qui peuvent
+    couvrir plusieurs lignes), chaque ligne n'est parcourue qu'une fois.
+    """
     text = text.replace("\r\n", "\n").replace("\r", "\n")
-    lines = text.split("\n")
 
-    cleaned_lines = []
-    for line in lines:
+    kept = []
+    for line in text.split("\n"):
         stripped = line.strip()
-
         if stripped.startswith(".. "):
             continue
-
-        if stripped and len(stripped) >= 3 and set(stripped) <= set("=~`-^\"'*+_#-"):
+        if len(stripped) >= 3 and DECORATION_CHARS.issuperset(stripped):
             continue
+        kept.append(line)
+    cleaned = "\n".join(kept)
 
-        cleaned_lines.append(line)
-
-    cleaned = "\n".join(cleaned_lines)
-
-    cleaned = re.sub(r":\w+:`([^`<]+)(?:<[^`]+>)?`", r"\1", cleaned)
-    cleaned = re.sub(r"``([^`]+)``", r"\1", cleaned)
+    if "`" in cleaned:
+        cleaned = ROLE_RE.sub(r"\1", cleaned)
+        cleaned = LITERAL_RE.sub(r"\1", cleaned)
 
+    # espaces compactés + lignes vides consécutives fusionnées (équivaut à \n{3,} -> \n\n)
     final_lines = []
+    blank = False
     for line in cleaned.split("\n"):
-        line = re.sub(r"\s+", " ", line).strip()
+        line = " ".join(line.split())
+        if not line:
+            if blank:
+                continue
+            blank = True
+        else:
+            blank = False
         final_lines.append(line)
 
-    final_text = "\n".join(final_lines)
-    final_text = re.sub(r"\n{3,}", "\n\n", final_text)
-
-    return final_text.strip()
+    return "\n".join(final_lines).strip()
 
 
 def extract_doc_metadata(doc):
@@ -88,7 +222,7 @@ def extract_section_titles_from_raw(text: str):
         line = lines[i].strip()
         deco = lines[i + 1].strip()
 
-        if line and deco and len(deco) >= 3 and set(deco) <= set("=~`-^\"'*+_#-"):
+        if line and deco and len(deco) >= 3 and DECORATION_CHARS.issuperset(deco):
             titles.append(line)
             i += 2
         else:
@@ -96,11 +230,35 @@ def extract_section_titles_from_raw(text: str):
     return titles
 
 
-def prepare_docs(docs):
-    for doc in docs:
-        doc["clean_text"] = clean_text(doc["text"])
-        doc["metadata"] = extract_doc_metadata(doc)
-        doc["section_titles"] = extract_section_titles_from_raw(doc["text"])
+def prepare_doc(doc):
+    doc["clean_text"] = clean_text(doc["text"])
+    doc["metadata"] = extract_doc_metadata(doc)
+    doc["section_titles"] = extract_section_titles_from_raw(doc["text"])
+    return doc
+
+
+def _prepared_fields(doc):
+    # renvoyé par les workers : uniquement les champs calculés (pas le texte brut)
+    prepare_doc(doc)
+    return {k: doc[k] for k in ("clean_text", "metadata", "section_titles")}
+
+
+def prepare_docs(docs, workers: int = None, chunksize: int = 16):
+    """
+    workers > 1 : nettoyage dans un pool de processus ; l'ordre des documents
+    est conservé (résultat identique au mode séquentiel).
+    """
+    workers = config.PREPROCESS_WORKERS if workers is None else workers
+    if workers <= 1 or len(docs) < 2:
+        for doc in docs:
+            prepare_doc(doc)
+        return docs
+
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        prepared = list(ex.map(_prepared_fields, docs, chunksize=chunksize))
+    # même contrat que le mode séquentiel : les dicts d'entrée sont complétés
+    for doc, out in zip(docs, prepared):
+        doc.update(out)
     return docs
 
 
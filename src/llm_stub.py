@@ -0,0 +1,150 @@
+import json
+import re
+import sys
+import threading
+import time
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Serveur local compatible OpenAI/Groq (POST .../chat/completions) qui répond de façon
+# déterministe, sans réseau ni clé API ("stream": true -> réponse SSE mot par mot). Pour s'en servir avec src.rag / src.rag_async :
+#   python -m src.llm_stub 8008
+#   GROQ_BASE_URL=http://127.0.0.1:8008 GROQ_API_KEY=stub python -m src.main
+
+
+def stub_completion(messages, max_tokens: int = 500) -> str:
+    """
+    Réponse déterministe à partir des messages :
+    - demande de reformulations / sous-questions -> N lignes dérivées de la question
+    - sinon -> réponse courte citant la question et les sources du contexte
+    """
+    prompt = messages[-1]["content"] if messages else ""
+
+    question = re.search(r"Question:\s*(.+)", prompt)
+    question = question.group(1).strip() if question else prompt.strip().split("\n")[-1]
+
+    n_match = re.search(r"(?:Génère|propose)\s+(\d+)", prompt)
+    if n_match:
+        n = int(n_match.group(1))
+        return "\n".join(f"- {question} (variante {i + 1})" for i in range(n))
+
+    rag_question = re.search(r"QUESTION:\n(.+?)\n", prompt, flags=re.S)
+    if rag_question:
+        question = rag_question.group(1).strip()
+    sources = re.findall(r"\[Source \d+ - ([^\]]+)\]", prompt)
+    digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+
+    answer = f"Réponse (stub {digest}) à : {question}"
+    if sources:
+        answer += " Sources : " + ", ".join(dict.fromkeys(sources)) + "."
+    # max_tokens approximé en mots
+    return " ".join(answer.split()[:max_tokens])
+
+
+def _completion_body(content: str, model: str):
+    return {
+        "id": "stub-" + hashlib.sha1(content.encode("utf-8")).hexdigest()[:12],
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(content.split()), "total_tokens": len(content.split())},
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive : le client réutilise ses connexions
+    disable_nagle_algorithm = True  # en-têtes et corps écrits séparément : sinon ~40 ms d'ACK retardé par réponse
+    delay = 0.0
+    token_delay = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+
+        if self.delay:
+            time.sleep(self.delay)  # latence réseau / génération simulée
+
+        content = stub_completion(payload.get("messages", []), payload.get("max_tokens") or 500)
+        if payload.get("stream"):
+            self._send_stream(content, payload.get("model", "stub"))
+        else:
+            self._send_json(200, _completion_body(content, payload.get("model", "stub")))
+
+    def _send_stream(self, content: str, model: str):
+        # Server-Sent Events, un mot par chunk, comme l'API en mode stream
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            chunk = {
+                "id": "stub-stream",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": word if i == 0 else " " + word},
+                    "finish_reason": "stop" if i == len(words) - 1 else None,
+                }],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def serve_stub(port: int = 0, delay: float = 0.0, host: str = "127.0.0.1", token_delay: float = 0.0):
+    """
+    Démarre le stub dans un thread ; retourne (server, base_url).
+    port=0 : port libre choisi par l'OS.
+    delay : attente avant la réponse ; token_delay : attente entre deux tokens (stream).
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"delay": delay, "token_delay": token_delay})
+    server = ThreadingHTTPServer((host, port), handler, bind_and_activate=False)
+    server.daemon_threads = True
+    server.request_queue_size = 128  # beaucoup de requêtes concurrentes (benchmarks)
+    server.server_bind()
+    server.server_activate()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8008
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    token_delay = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    server, url = serve_stub(port, delay, token_delay=token_delay)
+    print("Stub LLM sur", url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
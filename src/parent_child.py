@@ -1,28 +1,30 @@
-def expand_with_neighbors(hit, all_metas, window: int = 1, suffix: str = "fixed"):
+from src import tracing
+from src.corpus import Corpus
+
+
+def expand_with_neighbors(hit, corpus, window: int = 1, suffix: str = "fixed"):
     """
     Expand text by taking neighbors from the same source:
     chunk_id format expected: {source}_{suffix}_{idx}  e.g. routing.rst_fixed_19
+
+    corpus : Corpus chargé avec l'index (lookups précalculés).
+    Une simple liste de metas est encore acceptée (on construit alors les tables).
     """
-    source = hit.get("source")
-    chunk_id = hit.get("chunk_id", "")
+    if not isinstance(corpus, Corpus):
+        corpus = Corpus([m for m in corpus if f"_{suffix}_" in (m.get("chunk_id") or "")])
 
-    # extract idx
-    try:
-        idx = int(chunk_id.split("_")[-1])
-    except:
+    chunk_id = hit.get("chunk_id", "")
+    if not hit.get("source"):
         return hit
 
-    if not source:
+    row = corpus.row_of(chunk_id)
+    if row is None:
         return hit
 
-    # build a map for fast access
-    by_id = {m.get("chunk_id"): m for m in all_metas}
-
     neighbors = []
-    for delta in range(-window, window + 1):
-        target_id = f"{source}_{suffix}_{idx + delta}"
-        m = by_id.get(target_id)
-        if m and m.get("text"):
+    for r in corpus.neighbor_rows(row, window):
+        m = corpus[r]
+        if m.get("text"):
             neighbors.append(m["text"])
 
     if not neighbors:
@@ -33,3 +35,9 @@ def expand_with_neighbors(hit, all_metas, window: int = 1, suffix: str = "fixed"
     new_hit["expanded_from"] = chunk_id
     new_hit["window"] = window
     return new_hit
+
+
+def expand_hits(hits, corpus, window: int = 1, suffix: str = "fixed"):
+    """expand_with_neighbors sur une liste de hits (une seule étape "neighbors" tracée)."""
+    with tracing.span("neighbors", n=len(hits), window=window):
+        return [expand_with_neighbors(h, corpus, window, suffix) for h in hits]
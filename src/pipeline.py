@@ -0,0 +1,296 @@
+import os
+import json
+import queue
+import threading
+import time
+
+import numpy as np
+
+from src import config, resources
+from src.chunk_store import INTERNED_FIELDS, ChunkStore, ChunkStoreWriter, chunk_faiss_id
+from src.chunking import chunk_structured, doc_chunks, token_counter, write_chunk_sources
+from src.index_faiss import (
+    DEFAULT_INDEX_PARAMS,
+    RescoreWriter,
+    _save_index,
+    create_index,
+    embed_texts,
+    needs_training,
+    source_hashes,
+    store_prefix,
+    write_bm25,
+    write_sources_manifest,
+)
+from src.ingest import iter_rsts, prepare_doc
+
+
+# Pipeline en flux : documents -> nettoyage -> chunks -> embeddings -> index.
+#
+#   [thread parse]  iter_rsts + prepare_doc + doc_chunks / chunk_structured, lots de `batch_size` chunks
+#        | file bornée (queue_size lots)
+#   [thread embed]  embed_texts par lot (le modèle libère le GIL pendant l'encodage)
+#        | file bornée
+#   [thread principal]  ChunkStoreWriter + JSONL en flux + index.add par lot
+#
+# Les files bornées font le backpressure : si l'encodage est plus lent que le parsing,
+# le thread parse attend au lieu d'accumuler des chunks. En mémoire à un instant
+# donné : quelques lots de chunks / vecteurs + l'index lui-même.
+# Même résultat que build_and_save_chunks + build_all_indexes (même ordre, mêmes ids).
+
+MODES = ("fixed", "semantic", "structured")
+
+_DONE = object()
+
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(q, item, stop):
+    # put bloquant, mais qui abandonne si le pipeline s'arrête (erreur en aval)
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    # get bloquant, qui rend None si le pipeline s'arrête
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+
+def _parse_stage(folder, out_q, stop, batch_size, max_words, overlap, stats):
+    try:
+        hashes = {}
+        pending = {mode: [] for mode in MODES}
+        count, budget = token_counter()
+        for doc in iter_rsts(folder):
+            hashes.update(source_hashes([doc]))
+            prepare_doc(doc)
+            fixed, semantic = doc_chunks(doc, max_words=max_words, overlap=overlap)
+            structured = chunk_structured(doc, count=count, budget=budget)
+            stats["docs"] += 1
+            for mode, chunks in zip(MODES, (fixed, semantic, structured)):
+                pending[mode].extend(chunks)
+                while len(pending[mode]) >= batch_size:
+                    batch, pending[mode] = pending[mode][:batch_size], pending[mode][batch_size:]
+                    if not _put(out_q, (mode, batch), stop):
+                        return
+        for mode in MODES:
+            if pending[mode] and not _put(out_q, (mode, pending[mode]), stop):
+                return
+        stats["source_hashes"] = hashes
+        _put(out_q, _DONE, stop)
+    except Exception as e:
+        _put(out_q, _StageError(e), stop)
+
+
+def _embed_stage(in_q, out_q, stop, stats):
+    try:
+        while True:
+            item = _get(in_q, stop)
+            if item is None:
+                return
+            if item is _DONE or isinstance(item, _StageError):
+                _put(out_q, item, stop)
+                return
+            mode, batch = item
+            t = time.perf_counter()
+            embeddings = embed_texts([c["text"] for c in batch], verbose=False)
+            stats["embed_s"] += time.perf_counter() - t
+            if not _put(out_q, (mode, batch, embeddings), stop):
+                return
+    except Exception as e:
+        _put(out_q, _StageError(e), stop)
+
+
+class IndexSink:
+    """
+    Index FAISS rempli lot par lot (add_with_ids).
+    flat / hnsw / fp16 : créé au premier lot. IVF / sq8 / binary : les premiers vecteurs
+    sont gardés jusqu'à `train_size` pour l'entraînement, puis on ajoute au fil de l'eau.
+    Index quantifié avec rescore : les vecteurs de re-scoring sont écrits à côté de
+    index_path au fil des lots.
+    """
+
+    def __init__(self, index_type: str, index_params: dict = None, train_size: int = None, index_path: str = None):
+        self.index_type = index_type
+        self.index_params = dict(index_params or {})
+        self.train_size = train_size or config.PIPELINE_TRAIN_SIZE
+        self.index = None
+        self.params = None
+        self._buf_vecs, self._buf_ids = [], []
+        rescore = {**DEFAULT_INDEX_PARAMS.get(index_type, {}), **self.index_params}
+        self.rescore_writer = None
+        if index_path and rescore.get("rescore"):
+            self.rescore_writer = RescoreWriter(index_path, rescore["rescore_dtype"])
+
+    def _needs_training(self):
+        return needs_training(self.index_type)
+
+    def _create(self, embeddings, ids):
+        self.index, self.params = create_index(embeddings, self.index_type, ids=ids, **self.index_params)
+
+    def add(self, embeddings, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.rescore_writer is not None:
+            self.rescore_writer.add(embeddings, ids)
+        if self.index is not None:
+            self.index.add_with_ids(embeddings, ids)
+            return
+        if not self._needs_training():
+            self._create(embeddings, ids)
+            return
+        self._buf_vecs.append(embeddings)
+        self._buf_ids.append(ids)
+        if sum(len(v) for v in self._buf_vecs) >= self.train_size:
+            self._flush()
+
+    def _flush(self):
+        if self._buf_vecs:
+            self._create(np.vstack(self._buf_vecs), np.concatenate(self._buf_ids))
+            self._buf_vecs, self._buf_ids = [], []
+
+    def finish(self):
+        self._flush()
+        if self.rescore_writer is not None:
+            self.rescore_writer.close()
+        return self.index, self.params
+
+    def abort(self):
+        if self.rescore_writer is not None:
+            self.rescore_writer.abort()
+
+
+class _ModeSink:
+    """Sorties d'un type de chunks : JSONL (processed + meta), chunk store, index."""
+
+    def __init__(self, mode, index_type, index_params):
+        self.mode = mode
+        self.index_path = os.path.join(config.INDEX_DIR, f"index_{mode}.faiss")
+        self.meta_path = os.path.join(config.INDEX_DIR, f"meta_{mode}.jsonl")
+        self.chunks_path = os.path.join(config.PROCESSED_DIR, f"chunks_{mode}.jsonl")
+        fields = INTERNED_FIELDS + (("section",) if mode == "structured" else ())
+        self.writer = ChunkStoreWriter(store_prefix(self.meta_path), fields)
+        self.index_sink = IndexSink(index_type, index_params, index_path=self.index_path)
+        self.index_type = index_type
+        self._files = [open(p + ".tmp", "w", encoding="utf-8") for p in (self.chunks_path, self.meta_path)]
+
+    def add(self, batch, embeddings):
+        for c in batch:
+            line = json.dumps(c, ensure_ascii=False) + "\n"
+            for f in self._files:
+                f.write(line)
+            self.writer.add(c)
+        self.index_sink.add(embeddings, [chunk_faiss_id(c.get("chunk_id")) for c in batch])
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        index, params = self.index_sink.finish()
+        if index is None:
+            raise RuntimeError(f"Aucun chunk {self.mode} : rien à indexer")
+        _save_index(index, self.index_path, self.index_type, params)
+        os.replace(self.chunks_path + ".tmp", self.chunks_path)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+        self.writer.close()
+        return int(index.ntotal)
+
+    def abort(self):
+        for f in self._files:
+            f.close()
+            os.remove(f.name)
+        self.writer.abort()
+        self.index_sink.abort()
+
+
+def run_pipeline(
+    folder: str = None,
+    index_type: str = None,
+    index_params: dict = None,
+    batch_size: int = None,
+    queue_size: int = None,
+    max_words: int = 500,
+    overlap: int = 100,
+):
+    """
+    Construit chunks + index fixed / semantic / structured + BM25 en un seul passage en flux.
+    Retourne des statistiques (nb de docs / chunks, durées).
+    """
+    index_type = index_type or config.INDEX_TYPE
+    index_params = config.INDEX_PARAMS if index_params is None else index_params
+    batch_size = batch_size or config.PIPELINE_BATCH_SIZE
+    queue_size = queue_size or config.PIPELINE_QUEUE_SIZE
+    os.makedirs(config.INDEX_DIR, exist_ok=True)
+    os.makedirs(config.PROCESSED_DIR, exist_ok=True)
+
+    t0 = time.perf_counter()
+    stats = {"docs": 0, "chunks": {m: 0 for m in MODES}, "embed_s": 0.0}
+    chunk_q = queue.Queue(maxsize=queue_size)
+    vec_q = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    threads = [
+        threading.Thread(
+            target=_parse_stage, name="pipeline-parse", daemon=True,
+            args=(folder, chunk_q, stop, batch_size, max_words, overlap, stats),
+        ),
+        threading.Thread(target=_embed_stage, name="pipeline-embed", daemon=True, args=(chunk_q, vec_q, stop, stats)),
+    ]
+    sinks = {mode: _ModeSink(mode, index_type, index_params) for mode in MODES}
+    for t in threads:
+        t.start()
+
+    try:
+        while True:
+            item = vec_q.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _StageError):
+                raise item.error
+            mode, batch, embeddings = item
+            sinks[mode].add(batch, embeddings)
+            stats["chunks"][mode] += len(batch)
+    except BaseException:
+        stop.set()
+        for sink in sinks.values():
+            sink.abort()
+        raise
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+
+    for mode, sink in sinks.items():
+        ntotal = sink.close()
+        print(f"Index {index_type} {mode} : {ntotal} vecteurs ->", sink.index_path)
+
+    # BM25 relu depuis le store mmap (un texte à la fois)
+    write_bm25(ChunkStore.open(store_prefix(sinks["fixed"].meta_path)))
+    print("Index BM25 sauvegardé :", resources.BM25_PREFIX)
+
+    hashes, chunking = stats.pop("source_hashes", {}), {"max_words": max_words, "overlap": overlap}
+    write_chunk_sources(hashes, chunking)
+    write_sources_manifest(hashes, chunking)
+
+    stats["total_s"] = time.perf_counter() - t0
+    print(
+        f"Pipeline : {stats['docs']} documents, {stats['chunks']['fixed']} chunks fixed, "
+        f"{stats['chunks']['semantic']} chunks semantic, "
+        f"{stats['chunks']['structured']} chunks structured en {stats['total_s']:.1f}s "
+        f"(encodage {stats['embed_s']:.1f}s)"
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    run_pipeline()
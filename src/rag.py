@@ -1,25 +1,156 @@
 import os
+import time
 from dotenv import load_dotenv
 from groq import Groq
 
-from src.retrieval import retrieve
+from src import config, resources, tracing
+from src.retrieval import encode_queries, retrieve, retrieve_many
 from src.rerank import rerank_with_cross_encoder
 
 
 load_dotenv()  # lit .env (GROQ_API_KEY)
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+_client = None
+_llm_backend = None  # None : API Groq (voir set_llm_backend)
 
 
-def call_llm(messages, model="llama-3.1-8b-instant", temperature=0.2, max_tokens=500):
-    resp = client.chat.completions.create(
+def get_client():
+    """Client Groq créé au premier appel (pas au moment de l'import)."""
+    global _client
+    if _client is None:
+        _client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+    return _client
+
+
+def __getattr__(name):
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def set_llm_backend(backend):
+    """
+    Remplace l'API Groq pour tous les appels LLM (call_llm, stream_llm, rag_async) :
+    - None   : API Groq (défaut)
+    - "stub" : réponses déterministes de src.llm_stub, en processus (ni réseau ni clé)
+    - fonction (messages, model, temperature, max_tokens) -> str
+    Retourne le backend précédent (pour le remettre ensuite).
+    """
+    global _llm_backend
+    if backend == "stub":
+        backend = stub_backend
+    previous, _llm_backend = _llm_backend, backend
+    return previous
+
+
+def stub_backend(messages, model=None, temperature=None, max_tokens=500):
+    """Backend LLM local et déterministe (même réponse que le serveur src.llm_stub)."""
+    from src.llm_stub import stub_completion
+    return stub_completion(messages, max_tokens)
+
+
+def get_llm_backend():
+    return _llm_backend
+
+
+def call_llm(messages, model="llama-3.1-8b-instant", temperature=0.2, max_tokens=500, stream: bool = False):
+    """
+    stream=False : retourne la réponse complète (str).
+    stream=True  : retourne un générateur de morceaux de texte, au fil de la génération.
+    """
+    backend = _llm_backend
+    if backend is not None:
+        with tracing.span("llm", stream=stream):
+            text = backend(messages, model=model, temperature=temperature, max_tokens=max_tokens)
+        if stream:
+            # un mot par morceau, comme le stub en SSE
+            return iter([w if i == 0 else " " + w for i, w in enumerate(text.split(" "))])
+        return text
+
+    # en stream, le span s'arrête à l'ouverture du flux (la suite est dans StreamedAnswer.metrics)
+    with tracing.span("llm", stream=stream):
+        if not stream:
+            return groq_completion(messages, model=model, temperature=temperature, max_tokens=max_tokens)
+        resp = get_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+    return _iter_stream(resp)
+
+
+def groq_completion(messages, model="llama-3.1-8b-instant", temperature=0.2, max_tokens=500):
+    """Appel direct à l'API Groq, sans passer par le backend (ex. à envelopper dans un cache)."""
+    resp = get_client().chat.completions.create(
         model=model,
         messages=messages,
         temperature=temperature,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
     )
     return resp.choices[0].message.content
 
 
+def _iter_stream(resp):
+    for chunk in resp:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+class StreamedAnswer:
+    """
+    Réponse en flux : on itère dessus pour recevoir les tokens.
+    metrics est rempli au fil de l'eau :
+    - ttft_s       : délai du premier token depuis le début de la requête (retrieval compris)
+    - llm_ttft_s   : délai du premier token depuis l'appel LLM
+    - generation_s : durée totale de la génération (appel LLM -> dernier token)
+    - total_s      : durée totale de la requête
+    """
+
+    def __init__(self, tokens, request_start: float, llm_start: float, on_complete=None):
+        self._tokens = tokens
+        self._on_complete = on_complete  # appelé avec le texte complet en fin de flux
+        self._request_start = request_start
+        self._llm_start = llm_start
+        self.parts = []
+        self.metrics = {
+            "ttft_s": None,
+            "llm_ttft_s": None,
+            "generation_s": None,
+            "total_s": None,
+            "n_chunks": 0,
+        }
+
+    def __iter__(self):
+        for tok in self._tokens:
+            if self.metrics["ttft_s"] is None:
+                now = time.perf_counter()
+                self.metrics["ttft_s"] = now - self._request_start
+                self.metrics["llm_ttft_s"] = now - self._llm_start
+            self.metrics["n_chunks"] += 1
+            self.parts.append(tok)
+            yield tok
+        end = time.perf_counter()
+        self.metrics["generation_s"] = end - self._llm_start
+        self.metrics["total_s"] = end - self._request_start
+        if self._on_complete is not None:
+            self._on_complete(self.text)
+
+    @property
+    def text(self):
+        """Texte reçu jusqu'ici (complet une fois le flux consommé)."""
+        return "".join(self.parts)
+
+
+def stream_llm(messages, request_start: float = None, on_complete=None, **kwargs):
+    llm_start = time.perf_counter()
+    tokens = call_llm(messages, stream=True, **kwargs)
+    return StreamedAnswer(tokens, request_start or llm_start, llm_start, on_complete=on_complete)
+
+
 def ask_baseline(question: str):
     messages = [
         {"role": "system", "content": "Tu es un assistant expert Symfony. Réponds clairement."},
@@ -45,13 +176,65 @@ def build_rag_prompt(question: str, chunks: list):
     return prompt
 
 
-def ask_rag(question: str, k: int = 5, strategy: str = "hybrid", use_rerank: bool = True, window: int = 1):
+def retrieve_for_rag(question: str, strategy: str = "hybrid", window: int = 1):
+    # parent_child : moins de chunks, mais étendus avec leurs voisins
+    if strategy == "parent_child":
+        return retrieve(question, k=6, strategy="parent_child", window=window)
+    return retrieve(question, k=10, strategy=strategy)
+
+
+MAX_CHARS_PER_CHUNK = 1500
+
+
+def truncate_chunks(chunks, max_chars: int = MAX_CHARS_PER_CHUNK):
+    # Sécurité taille
+    for c in chunks:
+        if "text" in c and len(c["text"]) > max_chars:
+            c["text"] = c["text"][:max_chars]
+    return chunks
+
+
+def sources_of(chunks):
+    return [
+        {
+            "source": c.get("source"),
+            "chunk_id": c.get("chunk_id"),
+            "expanded_from": c.get("expanded_from"),
+            "window": c.get("window"),
+        }
+        for c in chunks
+    ]
+
+
+def rag_messages(question: str, chunks: list, system: str = "Tu es un assistant expert Symfony."):
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": build_rag_prompt(question, chunks)},
+    ]
+
+
+def ask_rag(question: str, k: int = 5, strategy: str = "hybrid", use_rerank: bool = True, window: int = 1,
+            stream: bool = False, use_cache: bool = None):
+    """
+    stream=True : les sources sont retournées tout de suite et la réponse arrive
+    en flux dans "answer_stream" (StreamedAnswer) ; "metrics" (TTFT, durée de
+    génération) se remplit pendant qu'on consomme le flux.
+    use_cache : cache sémantique des réponses (défaut : config.ANSWER_CACHE) ;
+    "cache_hit" indique si la réponse vient du cache.
+    "timings" : durée de chaque étape en ms (src.tracing ; {} si désactivé).
+    """
+    with tracing.request("ask_rag") as trace:
+        out = _ask_rag(question, k, strategy, use_rerank, window, stream, use_cache)
+        out["timings"] = trace.timings()
+        return out
+
+
+def _ask_rag(question, k, strategy, use_rerank, window, stream, use_cache):
+    request_start = time.perf_counter()
 
     # Retrieval 
-    if strategy == "parent_child":
-        retrieved = retrieve(question, k=6, strategy="parent_child", window=window)
-    else:
-        retrieved = retrieve(question, k=10, strategy=strategy)
+    with tracing.span("retrieve", strategy=strategy):
+        retrieved = retrieve_for_rag(question, strategy=strategy, window=window)
 
     # Rerank
     if use_rerank:
@@ -59,83 +242,109 @@ def ask_rag(question: str, k: int = 5, strategy: str = "hybrid", use_rerank: boo
     else:
         top_chunks = retrieved[:k]
 
-    # Sécurité taille
-    MAX_CHARS_PER_CHUNK = 1500
-    for c in top_chunks:
-        if "text" in c and len(c["text"]) > MAX_CHARS_PER_CHUNK:
-            c["text"] = c["text"][:MAX_CHARS_PER_CHUNK]
+    truncate_chunks(top_chunks)
+
+    # Cache sémantique : même question (ou très proche), mêmes chunks, même index
+    if use_cache is None:
+        use_cache = config.ANSWER_CACHE
+    cached = None
+    if use_cache:
+        with tracing.span("answer_cache") as span:
+            cache = resources.get_answer_cache()
+            q_emb = encode_queries([question])[0]  # déjà calculé par le retrieval (cache de requêtes)
+            chunk_ids = [c.get("chunk_id") for c in top_chunks]
+            version = resources.index_version()
+            cached = cache.lookup(q_emb, chunk_ids, version)
+            span.set(hit=cached is not None)
+
+        def remember(answer):
+            cache.put(q_emb, question, answer, chunk_ids, version)
+    else:
+        remember = None
 
     # Prompt + LLM
-    prompt = build_rag_prompt(question, top_chunks)
+    if stream:
+        if cached is not None:
+            now = time.perf_counter()
+            answer_stream = StreamedAnswer(iter([cached["answer"]]), request_start, now)
+        else:
+            with tracing.span("prompt"):
+                messages = rag_messages(question, top_chunks)
+            answer_stream = stream_llm(messages, request_start=request_start, on_complete=remember)
+        return {
+            "answer_stream": answer_stream,
+            "metrics": answer_stream.metrics,
+            "chunks": top_chunks,
+            "sources": sources_of(top_chunks),
+            "cache_hit": cached is not None,
+        }
 
-    messages = [
-        {"role": "system", "content": "Tu es un assistant expert Symfony."},
-        {"role": "user", "content": prompt},
-    ]
-    answer = call_llm(messages)
+    if cached is not None:
+        answer = cached["answer"]
+    else:
+        with tracing.span("prompt"):
+            messages = rag_messages(question, top_chunks)
+        answer = call_llm(messages)
+        if remember is not None:
+            remember(answer)
 
     return {
     "answer": answer,
     "chunks": top_chunks,
-    "sources": [
-        {
-            "source": c.get("source"),
-            "chunk_id": c.get("chunk_id"),
-            "expanded_from": c.get("expanded_from"),
-            "window": c.get("window"),
-        }
-        for c in top_chunks
-    ],
+    "sources": sources_of(top_chunks),
+    "cache_hit": cached is not None,
 }
 
 
+def answer_cache_stats():
+    return resources.get_answer_cache().stats()
+
+
     
 
-def generate_alternative_queries(question: str, n: int = 3):
-    prompt = (
+def alternative_queries_prompt(question: str, n: int = 3):
+    return (
         "Génère " + str(n) + " reformulations différentes  de la question suivante.\n"
         "Retourne uniquement une liste, une reformulation par ligne.\n\n"
         f"Question: {question}"
     )
-    messages = [{"role": "user", "content": prompt}]
-    text = call_llm(messages, temperature=0.7, max_tokens=200)
 
-    lines = [l.strip("- ").strip() for l in text.split("\n") if l.strip()]
+
+def parse_lines(text: str, n: int, strip_chars: str = "- "):
+    lines = [l.strip(strip_chars).strip() for l in text.split("\n") if l.strip()]
     return lines[:n]
 
 
-def ask_rag_multi_query(question: str, k: int = 5, use_rerank: bool = True):
-    #  reformulations
-    queries = [question] + generate_alternative_queries(question, n=3)
-
-    # retrieval sur chaque query
-    all_hits = []
-    seen = set()
-    for q in queries:
-        hits = retrieve(q, k=5, strategy="hybrid")
-        for h in hits:
-            cid = h.get("chunk_id")
-            if cid and cid not in seen:
-                seen.add(cid)
-                all_hits.append(h)
-
-    #  rerank 
-    if use_rerank:
-        top_chunks = rerank_with_cross_encoder(question, all_hits, k=k)
-    else:
-        top_chunks = all_hits[:k]
+def generate_alternative_queries(question: str, n: int = 3):
+    messages = [{"role": "user", "content": alternative_queries_prompt(question, n)}]
+    text = call_llm(messages, temperature=0.7, max_tokens=200)
+    return parse_lines(text, n)
 
-    prompt = build_rag_prompt(question, top_chunks)
-    messages = [
-        {"role": "system", "content": "Tu es un assistant expert Symfony."},
-        {"role": "user", "content": prompt},
-    ]
-    answer = call_llm(messages)
 
-    return {
-        "answer": answer,
-        "chunks": top_chunks, 
-    }
+def ask_rag_multi_query(question: str, k: int = 5, use_rerank: bool = True):
+    with tracing.request("ask_rag_multi_query") as trace:
+        #  reformulations
+        queries = [question] + generate_alternative_queries(question, n=3)
+
+        # retrieval batché sur toutes les queries (un seul encodage + une seule recherche)
+        with tracing.span("retrieve", strategy="hybrid", n=len(queries)):
+            all_hits = retrieve_many(queries, k=5, strategy="hybrid")["fused"]
+
+        #  rerank 
+        if use_rerank:
+            top_chunks = rerank_with_cross_encoder(question, all_hits, k=k)
+        else:
+            top_chunks = all_hits[:k]
+
+        with tracing.span("prompt"):
+            messages = rag_messages(question, top_chunks)
+        answer = call_llm(messages)
+
+        return {
+            "answer": answer,
+            "chunks": top_chunks, 
+            "timings": trace.timings(),
+        }
 
 
 if __name__ == "__main__":
@@ -148,12 +357,29 @@ if __name__ == "__main__":
     out = ask_rag(q, k=5, strategy="hybrid", use_rerank=True)
     print(out["answer"])
     print("Sources:", out["sources"])
+
+
+ITERATIVE_SYSTEM_PROMPT = "Tu es un assistant expert Symfony. Réponds en te basant UNIQUEMENT sur le contexte fourni."
+
+
+def subqueries_prompt(question: str, draft: str, n_subqueries: int = 3):
+    return (
+        "Tu aides à faire une recherche documentaire dans la doc Symfony.\n"
+        "À partir de la question et de la réponse provisoire, propose "
+        f"{n_subqueries} sous-questions très courtes  "
+        "pour compléter l'information.\n\n"
+        f"Question: {question}\n\n"
+        f"Réponse provisoire:\n{draft}\n"
+    )
+
+
 def ask_rag_iterative(
     question: str,
     k_final: int = 5,
     strategy: str = "parent_child",
     window: int = 1,
     n_subqueries: int = 3,
+    stream: bool = False,
 ):
     
     
@@ -166,7 +392,16 @@ def ask_rag_iterative(
     RAG itératif (2 tours) :
     - Tour 1 : RAG standard
     - Tour 2 : génération de sous-questions -> retrieval -> réponse finale
+    stream=True : seule la réponse finale est en flux (voir ask_rag).
     """
+    with tracing.request("ask_rag_iterative") as trace:
+        out = _ask_rag_iterative(question, k_final, strategy, window, n_subqueries, stream)
+        out["timings"] = trace.timings()
+        return out
+
+
+def _ask_rag_iterative(question, k_final, strategy, window, n_subqueries, stream):
+    request_start = time.perf_counter()
 
     # --------------------
     #  (RAG standard)
@@ -177,56 +412,39 @@ def ask_rag_iterative(
     # --------------------
     # Générer des sous-questions (agent)
     # --------------------
-    prompt_subq = (
-        "Tu aides à faire une recherche documentaire dans la doc Symfony.\n"
-        "À partir de la question et de la réponse provisoire, propose "
-        f"{n_subqueries} sous-questions très courtes  "
-        "pour compléter l'information.\n\n"
-        f"Question: {question}\n\n"
-        f"Réponse provisoire:\n{draft}\n"
-    )
-
     subq_text = call_llm(
-        [{"role": "user", "content": prompt_subq}],
+        [{"role": "user", "content": subqueries_prompt(question, draft, n_subqueries)}],
         temperature=0.2,
         max_tokens=120
     )
 
-    subqueries = [l.strip("-• ").strip() for l in subq_text.split("\n") if l.strip()]
-    subqueries = subqueries[:n_subqueries]
+    subqueries = parse_lines(subq_text, n_subqueries, strip_chars="-• ")
 
     # --------------------
     # (retrieval sur sous-questions + fusion)
     # --------------------
-    all_hits = []
-    seen_ids = set()
-
-    for sq in subqueries:
-        hits = retrieve(sq, k=6, strategy=strategy, window=window) if strategy == "parent_child" \
-               else retrieve(sq, k=10, strategy=strategy)
-
-        for h in hits:
-            cid = h.get("chunk_id")
-            if cid and cid not in seen_ids:
-                seen_ids.add(cid)
-                all_hits.append(h)
+    k_sub = 6 if strategy == "parent_child" else 10
+    with tracing.span("retrieve", strategy=strategy, n=len(subqueries)):
+        all_hits = retrieve_many(subqueries, k=k_sub, strategy=strategy, window=window)["fused"]
 
     # Rerank final sur question originale
     top_chunks = rerank_with_cross_encoder(question, all_hits, k=k_final)
 
     #  tronquer
-    MAX_CHARS_PER_CHUNK = 1500
-    for c in top_chunks:
-        if "text" in c and len(c["text"]) > MAX_CHARS_PER_CHUNK:
-            c["text"] = c["text"][:MAX_CHARS_PER_CHUNK]
+    truncate_chunks(top_chunks)
 
     # Prompt final + réponse finale
-    final_prompt = build_rag_prompt(question, top_chunks)
-
-    final_messages = [
-        {"role": "system", "content": "Tu es un assistant expert Symfony. Réponds en te basant UNIQUEMENT sur le contexte fourni."},
-        {"role": "user", "content": final_prompt},
-    ]
+    with tracing.span("prompt"):
+        final_messages = rag_messages(question, top_chunks, system=ITERATIVE_SYSTEM_PROMPT)
+    if stream:
+        answer_stream = stream_llm(final_messages, request_start=request_start, temperature=0.2, max_tokens=450)
+        return {
+            "answer_stream": answer_stream,
+            "metrics": answer_stream.metrics,
+            "subqueries": subqueries,
+            "chunks": top_chunks,
+            "sources": sources_of(top_chunks),
+        }
 
     final_answer = call_llm(final_messages, temperature=0.2, max_tokens=450)
 
@@ -234,15 +452,7 @@ def ask_rag_iterative(
         "answer": final_answer,
         "subqueries": subqueries,
         "chunks": top_chunks,
-        "sources": [
-            {
-                "source": c.get("source"),
-                "chunk_id": c.get("chunk_id"),
-                "expanded_from": c.get("expanded_from"),
-                "window": c.get("window"),
-            }
-            for c in top_chunks
-        ],
+        "sources": sources_of(top_chunks),
     }
     def format_sources(chunks, top: int = 5):
      out = []
@@ -0,0 +1,226 @@
+import os
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from groq import AsyncGroq
+
+from src import config, resources, tracing
+from src.retrieval import encode_queries, fuse_hits, retrieve_many
+from src.rerank import rerank_with_cross_encoder
+from src.rag import (
+    ITERATIVE_SYSTEM_PROMPT,
+    alternative_queries_prompt,
+    get_llm_backend,
+    parse_lines,
+    rag_messages,
+    retrieve_for_rag,
+    sources_of,
+    subqueries_prompt,
+    truncate_chunks,
+)
+
+
+# Variante asyncio de src.rag : les appels LLM ne bloquent plus le worker,
+# l'encodage / FAISS / BM25 / cross-encoder (CPU) partent dans un pool de threads.
+# Le client AsyncGroq garde un pool de connexions HTTP : on en crée un par event loop.
+# GROQ_BASE_URL permet de viser un serveur compatible (ex. src.llm_stub).
+
+load_dotenv()
+_clients = {}
+_executor = None
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+        _clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=config.RAG_CPU_WORKERS, thread_name_prefix="rag-cpu")
+    return _executor
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Exécute une étape CPU (retrieval, rerank) dans le pool de threads."""
+    loop = asyncio.get_running_loop()
+    # contexte copié : les spans du thread s'ajoutent au Trace de la requête (src.tracing)
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_get_executor(), lambda: ctx.run(fn, *args, **kwargs))
+
+
+async def call_llm_async(messages, model="llama-3.1-8b-instant", temperature=0.2, max_tokens=500):
+    backend = get_llm_backend()
+    if backend is not None:
+        # backend synchrone (stub, cache...) : hors event loop
+        with tracing.span("llm"):
+            return await run_cpu(backend, messages, model=model, temperature=temperature, max_tokens=max_tokens)
+    with tracing.span("llm"):
+        resp = await get_async_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    return resp.choices[0].message.content
+
+
+async def ask_baseline_async(question: str):
+    messages = [
+        {"role": "system", "content": "Tu es un assistant expert Symfony. Réponds clairement."},
+        {"role": "user", "content": question},
+    ]
+    return await call_llm_async(messages)
+
+
+async def _rerank_or_cut(question, hits, k, use_rerank):
+    if use_rerank:
+        return await run_cpu(rerank_with_cross_encoder, question, hits, k=k)
+    return hits[:k]
+
+
+async def ask_rag_async(question: str, k: int = 5, strategy: str = "hybrid", use_rerank: bool = True, window: int = 1,
+                        use_cache: bool = None):
+    with tracing.request("ask_rag") as trace:
+        out = await _ask_rag_async(question, k, strategy, use_rerank, window, use_cache)
+        out["timings"] = trace.timings()
+        return out
+
+
+async def _ask_rag_async(question, k, strategy, use_rerank, window, use_cache):
+    with tracing.span("retrieve", strategy=strategy):
+        retrieved = await run_cpu(retrieve_for_rag, question, strategy=strategy, window=window)
+    top_chunks = truncate_chunks(await _rerank_or_cut(question, retrieved, k, use_rerank))
+
+    # cache sémantique des réponses (voir rag.ask_rag)
+    if use_cache is None:
+        use_cache = config.ANSWER_CACHE
+    cached = None
+    if use_cache:
+        with tracing.span("answer_cache") as span:
+            cache = resources.get_answer_cache()
+            q_emb = (await run_cpu(encode_queries, [question]))[0]
+            chunk_ids = [c.get("chunk_id") for c in top_chunks]
+            version = resources.index_version()
+            cached = cache.lookup(q_emb, chunk_ids, version)
+            span.set(hit=cached is not None)
+
+    if cached is not None:
+        answer = cached["answer"]
+    else:
+        answer = await call_llm_async(rag_messages(question, top_chunks))
+        if use_cache:
+            cache.put(q_emb, question, answer, chunk_ids, version)
+    return {
+        "answer": answer,
+        "chunks": top_chunks,
+        "sources": sources_of(top_chunks),
+        "cache_hit": cached is not None,
+    }
+
+
+async def ask_rag_multi_query_async(question: str, k: int = 5, use_rerank: bool = True):
+    with tracing.request("ask_rag_multi_query") as trace:
+        out = await _ask_rag_multi_query_async(question, k, use_rerank)
+        out["timings"] = trace.timings()
+        return out
+
+
+async def _ask_rag_multi_query_async(question, k, use_rerank):
+    # le retrieval de la question d'origine tourne pendant que le LLM génère les reformulations
+    original_task = asyncio.ensure_future(run_cpu(retrieve_many, [question], k=5, strategy="hybrid"))
+    text = await call_llm_async(
+        [{"role": "user", "content": alternative_queries_prompt(question, 3)}],
+        temperature=0.7,
+        max_tokens=200,
+    )
+    alternatives = parse_lines(text, 3)
+
+    alt_hits = await run_cpu(retrieve_many, alternatives, k=5, strategy="hybrid") if alternatives else {"per_query": []}
+    original = await original_task
+
+    # même ordre que la version synchrone : question d'origine puis reformulations
+    all_hits = fuse_hits(original["per_query"] + alt_hits["per_query"])
+
+    top_chunks = await _rerank_or_cut(question, all_hits, k, use_rerank)
+    answer = await call_llm_async(rag_messages(question, top_chunks))
+    return {
+        "answer": answer,
+        "chunks": top_chunks,
+    }
+
+
+async def ask_rag_iterative_async(
+    question: str,
+    k_final: int = 5,
+    strategy: str = "parent_child",
+    window: int = 1,
+    n_subqueries: int = 3,
+):
+    """
+    RAG itératif (2 tours), version asyncio de rag.ask_rag_iterative.
+    """
+    with tracing.request("ask_rag_iterative") as trace:
+        out = await _ask_rag_iterative_async(question, k_final, strategy, window, n_subqueries)
+        out["timings"] = trace.timings()
+        return out
+
+
+async def _ask_rag_iterative_async(question, k_final, strategy, window, n_subqueries):
+    out1 = await ask_rag_async(question, k=min(3, k_final), strategy=strategy, use_rerank=True, window=window)
+
+    subq_text = await call_llm_async(
+        [{"role": "user", "content": subqueries_prompt(question, out1["answer"], n_subqueries)}],
+        temperature=0.2,
+        max_tokens=120
+    )
+    subqueries = parse_lines(subq_text, n_subqueries, strip_chars="-• ")
+
+    # retrieval des sous-questions en un seul batch, hors event loop
+    k_sub = 6 if strategy == "parent_child" else 10
+    all_hits = (await run_cpu(retrieve_many, subqueries, k=k_sub, strategy=strategy, window=window))["fused"]
+
+    top_chunks = truncate_chunks(await run_cpu(rerank_with_cross_encoder, question, all_hits, k=k_final))
+
+    final_answer = await call_llm_async(
+        rag_messages(question, top_chunks, system=ITERATIVE_SYSTEM_PROMPT), temperature=0.2, max_tokens=450
+    )
+    return {
+        "answer": final_answer,
+        "subqueries": subqueries,
+        "chunks": top_chunks,
+        "sources": sources_of(top_chunks),
+    }
+
+
+async def _demo(questions):
+    # plusieurs requêtes servies en parallèle par un seul worker
+    results = await asyncio.gather(*(ask_rag_async(q) for q in questions))
+    await close_async_client()
+    return results
+
+
+if __name__ == "__main__":
+    qs = [
+        "Comment définir une route simple dans Symfony ?",
+        "Comment sécuriser une page avec Symfony Security ?",
+        "Comment valider un formulaire avec Validator ?",
+    ]
+    for q, out in zip(qs, asyncio.run(_demo(qs))):
+        print("=" * 80)
+        print(q)
+        print(out["answer"])
+        print("Sources:", out["sources"])
@@ -1,25 +1,104 @@
-from sentence_transformers import CrossEncoder
-from src import config
+import hashlib
+import heapq
+import threading
+from collections import OrderedDict
 
+from src import batching, config, resources, tracing
 
-# Modèle reranker (cross-encoder)
-CROSS_ENCODER = CrossEncoder(config.CROSS_ENCODER_MODEL)
+
+def __getattr__(name):
+    # Modèle reranker (cross-encoder), chargé au premier accès
+    if name == "CROSS_ENCODER":
+        return resources.get_cross_encoder()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _sha1(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class RerankScoreCache:
+    """
+    Cache borné (LRU) des scores cross-encoder.
+    Clé = (hash question, chunk_id, hash texte) : un chunk étendu (parent_child)
+    ou tronqué a un autre texte, donc une autre clé.
+    """
+
+    def __init__(self, max_items: int = 20000):
+        self.max_items = max_items
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            score = self._scores.get(key)
+            if score is None:
+                self.misses += 1
+                return None
+            self._scores.move_to_end(key)
+            self.hits += 1
+            return score
+
+    def put(self, key, score: float):
+        with self._lock:
+            self._scores[key] = score
+            self._scores.move_to_end(key)
+            while len(self._scores) > self.max_items:
+                self._scores.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._scores),
+            "max_items": self.max_items,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._scores.clear()
+            self.hits = self.misses = 0
+
+
+SCORE_CACHE = RerankScoreCache(config.RERANK_CACHE_SIZE)
+
+
+def _predict(pairs):
+    return resources.get_cross_encoder().predict(pairs)
 
 
 def rerank_with_cross_encoder(question: str, retrieved_chunks: list, k: int = 5):
     """
     retrieved_chunks: liste de dicts qui contiennent au moins "text"
     Retourne les top-k rerankés.
+    Seules les paires (question, chunk) absentes du cache passent par le modèle.
     """
-    pairs = [(question, ch["text"]) for ch in retrieved_chunks]
-    scores = CROSS_ENCODER.predict(pairs)
+    with tracing.span("rerank", n=len(retrieved_chunks)) as span:
+        q_hash = _sha1(question)
+        keys = [(q_hash, ch.get("chunk_id"), _sha1(ch["text"])) for ch in retrieved_chunks]
+
+        todo = []
+        for ch, key in zip(retrieved_chunks, keys):
+            score = SCORE_CACHE.get(key)
+            if score is None:
+                todo.append((ch, key))
+            else:
+                ch["rerank_score"] = score
+        span.set(predicted=len(todo))
 
-    # On ajoute un score rerank et on trie
-    for ch, s in zip(retrieved_chunks, scores):
-        ch["rerank_score"] = float(s)
+        if todo:
+            pairs = [(question, ch["text"]) for ch, _ in todo]
+            scores = batching.dispatch("rerank", pairs, _predict)
+            for (ch, key), s in zip(todo, scores):
+                ch["rerank_score"] = float(s)
+                SCORE_CACHE.put(key, float(s))
 
-    reranked = sorted(retrieved_chunks, key=lambda x: x["rerank_score"], reverse=True)
-    return reranked[:k]
+        # top-k sans trier toute la liste (ordre stable en cas d'égalité)
+        return heapq.nlargest(k, retrieved_chunks, key=lambda x: x["rerank_score"])
 
 
 if __name__ == "__main__":
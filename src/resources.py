@@ -0,0 +1,216 @@
+import os
+import threading
+
+from src import config
+
+
+# Registre paresseux des ressources lourdes (modèles, index FAISS, BM25).
+# Rien n'est chargé à l'import : chaque ressource est créée au premier
+# besoin puis partagée par tout le processus (un seul modèle d'embeddings,
+# un seul cross-encoder).
+
+INDEX_PATHS = {
+    "fixed": (
+        os.path.join(config.INDEX_DIR, "index_fixed.faiss"),
+        os.path.join(config.INDEX_DIR, "meta_fixed.jsonl"),
+    ),
+    "semantic": (
+        os.path.join(config.INDEX_DIR, "index_semantic.faiss"),
+        os.path.join(config.INDEX_DIR, "meta_semantic.jsonl"),
+    ),
+    "structured": (
+        os.path.join(config.INDEX_DIR, "index_structured.faiss"),
+        os.path.join(config.INDEX_DIR, "meta_structured.jsonl"),
+    ),
+}
+
+BM25_PREFIX = os.path.join(config.INDEX_DIR, "bm25_fixed")
+
+_LOCK = threading.RLock()
+_RESOURCES = {}
+
+
+def _get_or_create(key, factory):
+    """
+    Retourne la ressource `key`, en la créant une seule fois (thread-safe).
+    """
+    try:
+        return _RESOURCES[key]
+    except KeyError:
+        pass
+
+    with _LOCK:
+        if key not in _RESOURCES:
+            _RESOURCES[key] = factory()
+        return _RESOURCES[key]
+
+
+def get_embedding_model():
+    def _load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(config.MODEL_NAME)
+
+    return _get_or_create("embedding_model", _load)
+
+
+def get_cross_encoder():
+    def _load():
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(config.CROSS_ENCODER_MODEL)
+
+    return _get_or_create("cross_encoder", _load)
+
+
+def get_query_cache():
+    """
+    Cache LRU (+ tier disque optionnel) des embeddings de requêtes.
+    """
+    def _load():
+        from src.embedding_cache import QueryEmbeddingCache
+        persist_dir = config.INDEX_DIR if config.QUERY_CACHE_PERSIST else None
+        return QueryEmbeddingCache(config.MODEL_NAME, max_items=config.QUERY_CACHE_SIZE, persist_dir=persist_dir)
+
+    return _get_or_create("query_cache", _load)
+
+
+def get_answer_cache():
+    """
+    Cache sémantique des réponses de ask_rag (src.answer_cache).
+    """
+    def _load():
+        from src.answer_cache import AnswerCache
+        return AnswerCache(
+            threshold=config.ANSWER_CACHE_THRESHOLD,
+            ttl=config.ANSWER_CACHE_TTL,
+            max_items=config.ANSWER_CACHE_SIZE,
+        )
+
+    return _get_or_create("answer_cache", _load)
+
+
+def index_version():
+    """
+    Version des index sur disque (taille + date de modification des fichiers) :
+    change à chaque build, ce qui invalide les réponses en cache.
+    """
+    import hashlib
+    paths = [p for pair in INDEX_PATHS.values() for p in pair]
+    paths += [p + ".json" for p, _ in INDEX_PATHS.values()]
+    paths.append(BM25_PREFIX + ".meta.json")
+    h = hashlib.sha1()
+    for path in paths:
+        if os.path.exists(path):
+            st = os.stat(path)
+            h.update(f"{path}:{st.st_size}:{st.st_mtime_ns};".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def get_chunk_embedding_store():
+    """
+    Store disque des embeddings de chunks (None si config.CHUNK_EMB_CACHE est False).
+    """
+    if not config.CHUNK_EMB_CACHE:
+        return None
+
+    def _load():
+        from src.embedding_cache import ChunkEmbeddingStore
+        return ChunkEmbeddingStore(config.MODEL_NAME, config.CHUNK_EMB_CACHE_DIR)
+
+    return _get_or_create("chunk_embedding_store", _load)
+
+
+def get_index(mode: str = "fixed"):
+    """
+    mode = "fixed", "semantic" ou "structured"
+    Retourne (index FAISS, corpus) où corpus est un src.corpus.Corpus
+    (chunks en ChunkStore colonne + lookups par chunk_id et par voisinage).
+    """
+    if mode not in INDEX_PATHS:
+        raise ValueError("mode doit être 'fixed', 'semantic' ou 'structured'")
+
+    def _load():
+        from src.corpus import Corpus
+        from src.index_faiss import load_index_and_store, read_manifest
+        index_path, meta_path = INDEX_PATHS[mode]
+        index, store = load_index_and_store(index_path, meta_path)
+        faiss_ids = read_manifest(index_path).get("ids") == "chunk_hash"
+        return index, Corpus(store, faiss_ids=faiss_ids)
+
+    return _get_or_create(f"index_{mode}", _load)
+
+
+def get_bm25():
+    """
+    Index inversé BM25 (sur fixed) : lu en mmap depuis index/ s'il existe
+    et correspond au corpus, sinon construit en mémoire.
+    """
+    def _load():
+        from src.bm25_index import BM25Index
+        _, corpus = get_index("fixed")
+        if BM25Index.exists(BM25_PREFIX):
+            bm25 = BM25Index.load(BM25_PREFIX)
+            if bm25.fingerprint is not None and bm25.fingerprint == corpus.store.fingerprint():
+                return bm25
+            print("Index BM25 obsolète, reconstruction en mémoire.")
+        return BM25Index.from_texts(corpus.texts())
+
+    return _get_or_create("bm25_fixed", _load)
+
+
+# Ressources nécessaires par stratégie de retrieve()
+STRATEGY_RESOURCES = {
+    "fixed": ("embedding_model", "index_fixed"),
+    "semantic": ("embedding_model", "index_semantic"),
+    "structured": ("embedding_model", "index_structured"),
+    "bm25": ("index_fixed", "bm25_fixed"),
+    "hybrid": ("embedding_model", "index_fixed", "bm25_fixed"),
+    "parent_child": ("embedding_model", "index_fixed", "bm25_fixed"),
+}
+
+_LOADERS = {
+    "embedding_model": get_embedding_model,
+    "cross_encoder": get_cross_encoder,
+    "index_fixed": lambda: get_index("fixed"),
+    "index_semantic": lambda: get_index("semantic"),
+    "index_structured": lambda: get_index("structured"),
+    "bm25_fixed": get_bm25,
+}
+
+
+def available_strategies():
+    """Stratégies dont les index existent sur disque (structured peut manquer sur un ancien build)."""
+    missing = {f"index_{m}" for m, (index_path, _) in INDEX_PATHS.items() if not os.path.exists(index_path)}
+    return [s for s, keys in STRATEGY_RESOURCES.items() if not missing.intersection(keys)]
+
+
+def warmup(strategies=None, rerank: bool = True):
+    """
+    Charge à l'avance tout ce dont les stratégies ont besoin
+    (utile pour un serveur, afin que la première requête ne paie pas le coût).
+    Par défaut : toutes les stratégies dont les index existent.
+    """
+    strategies = strategies or available_strategies()
+    keys = []
+    for s in strategies:
+        if s not in STRATEGY_RESOURCES:
+            raise ValueError(f"Strategy inconnue: {s}")
+        for key in STRATEGY_RESOURCES[s]:
+            if key not in keys:
+                keys.append(key)
+    if rerank:
+        keys.append("cross_encoder")
+
+    for key in keys:
+        _LOADERS[key]()
+    return loaded()
+
+
+def loaded():
+    """Liste des ressources déjà chargées dans ce processus."""
+    return sorted(_RESOURCES)
+
+
+def reset():
+    """Oublie toutes les ressources chargées (tests, benchmarks)."""
+    with _LOCK:
+        _RESOURCES.clear()
@@ -1,188 +1,263 @@
-import os
 import numpy as np
 import faiss
-from rank_bm25 import BM25Okapi
-from sentence_transformers import SentenceTransformer
-from src.parent_child import expand_with_neighbors
-from src import config
-from src.index_faiss import load_index_and_meta
+from src.bm25_index import tokenize
+from src.fusion import fuse, top_k
+from src.index_faiss import search_index
+from src.parent_child import expand_hits
+from src import batching, config, resources, tracing
 
 
 
-# Chargement modèles & index
+# Chargement modèles & index : paresseux, via src.resources
 
-EMB_MODEL = SentenceTransformer(config.MODEL_NAME)
+INDEX_FIXED_PATH, META_FIXED_PATH = resources.INDEX_PATHS["fixed"]
+INDEX_SEM_PATH, META_SEM_PATH = resources.INDEX_PATHS["semantic"]
 
-INDEX_FIXED_PATH = os.path.join(config.INDEX_DIR, "index_fixed.faiss")
-META_FIXED_PATH  = os.path.join(config.INDEX_DIR, "meta_fixed.jsonl")
+_LAZY_ATTRS = {
+    "EMB_MODEL": resources.get_embedding_model,
+    "index_fixed": lambda: resources.get_index("fixed")[0],
+    "metas_fixed": lambda: resources.get_index("fixed")[1],
+    "index_semantic": lambda: resources.get_index("semantic")[0],
+    "metas_semantic": lambda: resources.get_index("semantic")[1],
+    "bm25_fixed": resources.get_bm25,
+}
 
-INDEX_SEM_PATH = os.path.join(config.INDEX_DIR, "index_semantic.faiss")
-META_SEM_PATH  = os.path.join(config.INDEX_DIR, "meta_semantic.jsonl")
 
-index_fixed, metas_fixed = load_index_and_meta(INDEX_FIXED_PATH, META_FIXED_PATH)
-index_semantic, metas_semantic = load_index_and_meta(INDEX_SEM_PATH, META_SEM_PATH)
+def __getattr__(name):
+    # compatibilité : retrieval.EMB_MODEL, retrieval.metas_fixed, ... restent accessibles
+    if name in _LAZY_ATTRS:
+        return _LAZY_ATTRS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 
-#  BM25 (sur fixed)
+#  Dense retrieval FAISS
 
-corpus_fixed = [m["text"] for m in metas_fixed]
-tokenized_corpus_fixed = [doc.split() for doc in corpus_fixed]
-bm25_fixed = BM25Okapi(tokenized_corpus_fixed)
+def _model_encode(questions):
+    return resources.get_embedding_model().encode(list(questions), convert_to_numpy=True)
 
 
+def _encode_uncached(questions):
+    # micro-batché avec les requêtes concurrentes quand le serveur l'active
+    q_emb = batching.dispatch("encode", list(questions), _model_encode)
+    q_emb = np.ascontiguousarray(q_emb, dtype="float32")
+    faiss.normalize_L2(q_emb)
+    return q_emb
 
-#  Dense retrieval FAISS
 
-def retrieve_dense(question: str, k: int = 5, mode: str = "fixed"):
+def encode_queries(questions):
     """
-    mode = "fixed" ou "semantic"
+    Encode plusieurs questions en un seul batch (vecteurs normalisés L2, float32).
+    Les questions déjà vues sont servies par le cache d'embeddings.
     """
-    if mode == "fixed":
-        index = index_fixed
-        metas = metas_fixed
-    elif mode == "semantic":
-        index = index_semantic
-        metas = metas_semantic
-    else:
-        raise ValueError("mode doit être 'fixed' ou 'semantic'")
+    with tracing.span("encode", n=len(questions)):
+        return resources.get_query_cache().encode(questions, _encode_uncached)
 
-    q_emb = EMB_MODEL.encode([question], convert_to_numpy=True)
-    faiss.normalize_L2(q_emb)
 
-    scores, indices = index.search(q_emb, k)
-    scores = scores[0]
-    indices = indices[0]
+def query_cache_stats():
+    return resources.get_query_cache().stats()
 
-    results = []
-    for rank, (idx, score) in enumerate(zip(indices, scores)):
-        meta = metas[idx]
-        results.append({
-            "rank": rank,
-            "score": float(score),
-            "chunk_id": meta.get("chunk_id"),
-            "text": meta["text"],
-            "source": meta.get("source"),
-            "title": meta.get("title"),
-            "category": meta.get("category"),
-        })
-    return results
 
+def _chunk_hit(meta, rank, **scores):
+    hit = {"rank": rank}
+    hit.update(scores)
+    hit.update({
+        "chunk_id": meta.get("chunk_id"),
+        "text": meta["text"],
+        "source": meta.get("source"),
+        "title": meta.get("title"),
+        "category": meta.get("category"),
+    })
+    if meta.get("section") is not None:
+        hit["section"] = meta["section"]
+    return hit
 
 
-# BM25 retrieval (fixed)
+def _search(index, corpus, q_emb, k: int, nprobe: int = None, ef_search: int = None):
+    """Recherche FAISS ; les ids renvoyés sont convertis en lignes du corpus."""
+    with tracing.span("faiss_search", n=len(q_emb), k=k):
+        scores, ids = search_index(index, q_emb, k, nprobe=nprobe, ef_search=ef_search)
+        return scores, corpus.rows_from_ids(ids)
 
-def retrieve_bm25(question: str, k: int = 5):
-    tokens_q = question.split()
-    scores = bm25_fixed.get_scores(tokens_q)
-    top_idx = np.argsort(scores)[::-1][:k]
 
+def _dense_hits(scores, indices, corpus):
     results = []
-    for rank, idx in enumerate(top_idx):
-        meta = metas_fixed[idx]
-        results.append({
-            "rank": rank,
-            "bm25_score": float(scores[idx]),
-            "chunk_id": meta.get("chunk_id"),
-            "text": meta["text"],
-            "source": meta.get("source"),
-            "title": meta.get("title"),
-            "category": meta.get("category"),
-        })
+    for idx, score in zip(indices, scores):
+        if idx < 0:  # FAISS renvoie -1 quand il y a moins de k vecteurs
+            continue
+        results.append(_chunk_hit(corpus[idx], len(results), score=float(score)))
     return results
 
 
-
-# Hybrid dense + BM25 (fixed)
-
-def retrieve_hybrid(question: str, k: int = 5, k_dense: int = 20, k_bm25: int = 20, alpha: float = 0.7):
+def retrieve_dense(question: str, k: int = 5, mode: str = "fixed", nprobe: int = None, ef_search: int = None):
     """
-    Fusion  :
-    - on prend top k_dense en dense
-    - on prend top k_bm25 en bm25
-    - on normalise scores
-    - score_final = alpha*dense + (1-alpha)*bm25
+    mode = "fixed", "semantic" ou "structured"
+    nprobe / ef_search : réglages de recherche pour les index IVF / HNSW (ignorés sinon)
     """
-    dense = retrieve_dense(question, k=k_dense, mode="fixed")
+    index, corpus = resources.get_index(mode)
+    scores, indices = _search(index, corpus, encode_queries([question]), k, nprobe=nprobe, ef_search=ef_search)
+    return _dense_hits(scores[0], indices[0], corpus)
+
 
-    tokens_q = question.split()
-    bm25_scores_all = bm25_fixed.get_scores(tokens_q)
-    top_idx_bm25 = np.argsort(bm25_scores_all)[::-1][:k_bm25]
 
-    # maps chunk_id -> score
-    dense_map = {r["chunk_id"]: r["score"] for r in dense if r.get("chunk_id") is not None}
-    bm25_map = {metas_fixed[i]["chunk_id"]: float(bm25_scores_all[i]) for i in top_idx_bm25 if metas_fixed[i].get("chunk_id") is not None}
+# BM25 retrieval (fixed)
+
+def _bm25_hits(rows, scores, corpus):
+    return [
+        _chunk_hit(corpus[idx], rank, bm25_score=float(score))
+        for rank, (idx, score) in enumerate(zip(rows, scores))
+    ]
 
-    all_ids = set(dense_map.keys()) | set(bm25_map.keys())
 
-    # retrouver meta par chunk_id 
-    meta_by_id = {m.get("chunk_id"): m for m in metas_fixed}
+def retrieve_bm25(question: str, k: int = 5):
+    _, corpus_fixed = resources.get_index("fixed")
+    with tracing.span("bm25", n=1, k=k):
+        top_idx, top_scores = resources.get_bm25().top_k(tokenize(question), k)
+    return _bm25_hits(top_idx, top_scores, corpus_fixed)
+
+
+
+# Hybrid dense + BM25 (fixed)
 
-    candidates = []
-    for cid in all_ids:
-        meta = meta_by_id.get(cid)
-        if not meta:
+def _fuse_hybrid(dense_scores, dense_idx, bm25_idx, bm25_scores, corpus, k: int, alpha: float,
+                 fusion: str = None):
+    # candidats = lignes du corpus ; tout reste en tableaux jusqu'au top-k
+    fusion = fusion or config.HYBRID_FUSION
+    with tracing.span("fusion", method=fusion):
+        rows, fused, raw, norm = fuse(
+            (dense_idx, bm25_idx), (dense_scores, bm25_scores),
+            weights=(alpha, 1 - alpha), method=fusion, rrf_k=config.RRF_K,
+        )
+        best = top_k(fused, k)
+
+    hits = []
+    for pos in best:
+        row = int(rows[pos])
+        meta = corpus.meta(row, with_text=False)
+        if meta.get("chunk_id") is None:
             continue
-        candidates.append({
-            "chunk_id": cid,
-            "text": meta["text"],
+        hits.append({
+            "chunk_id": meta["chunk_id"],
             "source": meta.get("source"),
             "title": meta.get("title"),
             "category": meta.get("category"),
-            "dense_score": dense_map.get(cid, 0.0),
-            "bm25_score": bm25_map.get(cid, 0.0),
+            "dense_score": float(raw[0, pos]),
+            "bm25_score": float(raw[1, pos]),
+            "dense_norm": float(norm[0, pos]),
+            "bm25_norm": float(norm[1, pos]),
+            "score": float(fused[pos]),
+            "rank": len(hits),
+            # texte décodé seulement pour les k hits retenus
+            "text": corpus.text(row),
         })
+    return hits
 
-    if not candidates:
-        return []
 
-    dense_vals = np.array([c["dense_score"] for c in candidates], dtype=float)
-    bm25_vals  = np.array([c["bm25_score"] for c in candidates], dtype=float)
-
-    def minmax(x):
-        if x.max() == x.min():
-            return np.zeros_like(x)
-        return (x - x.min()) / (x.max() - x.min())
-
-    dense_norm = minmax(dense_vals)
-    bm25_norm  = minmax(bm25_vals)
+def retrieve_hybrid(question: str, k: int = 5, k_dense: int = 20, k_bm25: int = 20, alpha: float = 0.7,
+                    nprobe: int = None, ef_search: int = None, fusion: str = None):
+    """
+    Fusion  :
+    - on prend top k_dense en dense
+    - on prend top k_bm25 en bm25
+    - on normalise scores (fusion = "minmax" ou "zscore") ou on utilise les rangs ("rrf")
+    - score_final = alpha*dense + (1-alpha)*bm25
+    fusion=None : config.HYBRID_FUSION
+    """
+    return _retrieve_hybrid_many([question], k=k, k_dense=k_dense, k_bm25=k_bm25, alpha=alpha,
+                                 nprobe=nprobe, ef_search=ef_search, fusion=fusion)[0]
 
-    for i, c in enumerate(candidates):
-        c["dense_norm"] = float(dense_norm[i])
-        c["bm25_norm"] = float(bm25_norm[i])
-        c["score"] = alpha * c["dense_norm"] + (1 - alpha) * c["bm25_norm"]
 
-    candidates = sorted(candidates, key=lambda x: x["score"], reverse=True)[:k]
-    for rank, c in enumerate(candidates):
-        c["rank"] = rank
+def _retrieve_hybrid_many(questions, k: int = 5, k_dense: int = 20, k_bm25: int = 20, alpha: float = 0.7,
+                          nprobe: int = None, ef_search: int = None, fusion: str = None):
+    index, corpus_fixed = resources.get_index("fixed")
+    dense_scores, dense_idx = _search(index, corpus_fixed, encode_queries(questions), k_dense, nprobe=nprobe, ef_search=ef_search)
+    with tracing.span("bm25", n=len(questions), k=k_bm25):
+        bm25_results = resources.get_bm25().top_k_many([tokenize(q) for q in questions], k_bm25)
 
-    return candidates
+    return [
+        _fuse_hybrid(dense_scores[i], dense_idx[i], bm25_idx, bm25_scores, corpus_fixed, k, alpha, fusion)
+        for i, (bm25_idx, bm25_scores) in enumerate(bm25_results)
+    ]
 
 
 
 
-def retrieve(question: str, k: int = 5, strategy: str = "hybrid", window: int = 1):
+def retrieve(question: str, k: int = 5, strategy: str = "hybrid", window: int = 1,
+             nprobe: int = None, ef_search: int = None):
+    ann = {"nprobe": nprobe, "ef_search": ef_search}
     if strategy == "fixed":
-        return retrieve_dense(question, k=k, mode="fixed")
-    if strategy == "semantic":
-        return retrieve_dense(question, k=k, mode="semantic")
+        return retrieve_dense(question, k=k, mode="fixed", **ann)
+    if strategy in ("semantic", "structured"):
+        return retrieve_dense(question, k=k, mode=strategy, **ann)
     if strategy == "bm25":
         return retrieve_bm25(question, k=k)
     if strategy == "hybrid":
-        return retrieve_hybrid(question, k=k)
+        return retrieve_hybrid(question, k=k, **ann)
 
     if strategy == "parent_child":
         # child retrieval (simple) hybrid on fixed
-        results = retrieve_hybrid(question, k=k)
+        results = retrieve_hybrid(question, k=k, **ann)
 
         # expand context with neighbors (fixed)
-        expanded = [expand_with_neighbors(r, metas_fixed, window) for r in results]
-        return expanded
+        _, corpus_fixed = resources.get_index("fixed")
+        return expand_hits(results, corpus_fixed, window)
 
     raise ValueError(f"Strategy inconnue: {strategy}")
 
 
 
+# Retrieval batché (multi-query, RAG itératif)
+
+def fuse_hits(hit_lists):
+    """
+    Fusionne plusieurs listes de hits en gardant la première occurrence
+    de chaque chunk_id (ordre des requêtes puis rang).
+    """
+    fused = []
+    seen = set()
+    for hits in hit_lists:
+        for h in hits:
+            cid = h.get("chunk_id")
+            if cid and cid not in seen:
+                seen.add(cid)
+                fused.append(h)
+    return fused
+
+
+def retrieve_many(queries, k: int = 5, strategy: str = "hybrid", window: int = 1,
+                  nprobe: int = None, ef_search: int = None):
+    """
+    Comme retrieve(), mais pour plusieurs requêtes à la fois :
+    un seul encodage batché, une seule recherche FAISS (n, d)
+    et un seul passage BM25 pour toutes les requêtes.
+
+    Retourne {"per_query": [hits de chaque requête], "fused": hits dédupliqués}.
+    """
+    queries = list(queries)
+    if not queries:
+        return {"per_query": [], "fused": []}
+
+    if strategy in ("fixed", "semantic", "structured"):
+        index, corpus = resources.get_index(strategy)
+        scores, indices = _search(index, corpus, encode_queries(queries), k, nprobe=nprobe, ef_search=ef_search)
+        per_query = [_dense_hits(scores[i], indices[i], corpus) for i in range(len(queries))]
+    elif strategy == "bm25":
+        _, corpus_fixed = resources.get_index("fixed")
+        with tracing.span("bm25", n=len(queries), k=k):
+            results = resources.get_bm25().top_k_many([tokenize(q) for q in queries], k)
+        per_query = [_bm25_hits(rows, scores, corpus_fixed) for rows, scores in results]
+    elif strategy in ("hybrid", "parent_child"):
+        per_query = _retrieve_hybrid_many(queries, k=k, nprobe=nprobe, ef_search=ef_search)
+        if strategy == "parent_child":
+            _, corpus_fixed = resources.get_index("fixed")
+            per_query = [expand_hits(hits, corpus_fixed, window) for hits in per_query]
+    else:
+        raise ValueError(f"Strategy inconnue: {strategy}")
+
+    return {"per_query": per_query, "fused": fuse_hits(per_query)}
+
+
+
 
 # Test
 
@@ -0,0 +1,276 @@
+import os
+import json
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src import batching, config, resources, tracing
+from src.rag import answer_cache_stats, ask_rag, ask_rag_iterative, ask_rag_multi_query
+from src.rerank import SCORE_CACHE, _predict
+from src.retrieval import _model_encode, query_cache_stats, retrieve, retrieve_many
+
+
+# Serveur de requêtes longue durée (stdlib, un thread par requête) :
+#   POST /retrieve       {"question" ou "questions", "k", "strategy", "window"}
+#   POST /ask            {"question", "k", "strategy", "use_rerank", "window", "use_cache", "stream"}
+#   POST /ask_multi      {"question", "k", "use_rerank"}
+#   POST /ask_iterative  {"question", "k_final", "strategy", "window", "n_subqueries", "stream"}
+#   GET  /health, GET /stats
+# Les encodages de requêtes et les predict du cross-encoder des requêtes
+# concurrentes sont regroupés par src.batching.
+#
+#   python -m src.server [port] [workers]
+
+
+def _ask(body):
+    return ask_rag(
+        body["question"],
+        k=body.get("k", 5),
+        strategy=body.get("strategy", "hybrid"),
+        use_rerank=body.get("use_rerank", True),
+        window=body.get("window", 1),
+        use_cache=body.get("use_cache"),
+        stream=body.get("stream", False),
+    )
+
+
+def _ask_multi(body):
+    return ask_rag_multi_query(body["question"], k=body.get("k", 5), use_rerank=body.get("use_rerank", True))
+
+
+def _ask_iterative(body):
+    return ask_rag_iterative(
+        body["question"],
+        k_final=body.get("k_final", 5),
+        strategy=body.get("strategy", "parent_child"),
+        window=body.get("window", 1),
+        n_subqueries=body.get("n_subqueries", 3),
+        stream=body.get("stream", False),
+    )
+
+
+def _retrieve(body):
+    k = body.get("k", 5)
+    strategy = body.get("strategy", "hybrid")
+    window = body.get("window", 1)
+    if "questions" in body:
+        return retrieve_many(body["questions"], k=k, strategy=strategy, window=window)
+    return {"hits": retrieve(body["question"], k=k, strategy=strategy, window=window)}
+
+
+ROUTES = {
+    "/retrieve": _retrieve,
+    "/ask": _ask,
+    "/ask_multi": _ask_multi,
+    "/ask_iterative": _ask_iterative,
+}
+
+_STATS = {"started": time.time(), "requests": 0, "errors": 0}
+_STATS_LOCK = threading.Lock()  # un thread par requête : += n'est pas atomique
+
+
+def _count(key: str):
+    with _STATS_LOCK:
+        _STATS[key] += 1
+
+
+def server_stats():
+    return {
+        "pid": os.getpid(),
+        "uptime_s": time.time() - _STATS["started"],
+        "requests": _STATS["requests"],
+        "errors": _STATS["errors"],
+        "loaded": resources.loaded(),
+        "query_cache": query_cache_stats(),
+        "rerank_cache": SCORE_CACHE.stats(),
+        "answer_cache": answer_cache_stats(),
+        "batching": batching.stats(),
+        "tracing": tracing.stats(),
+    }
+
+
+class RAGHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # en-têtes et corps écrits séparément : sinon ~40 ms d'ACK retardé par réponse
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body):
+        data = json.dumps(body, ensure_ascii=False, default=float).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_event(self, event: str, data):
+        payload = json.dumps(data, ensure_ascii=False, default=float)
+        self.wfile.write(f"event: {event}\ndata: {payload}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _send_stream(self, out):
+        # SSE : sources d'abord, puis les tokens, puis les métriques (TTFT...)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        answer_stream = out.pop("answer_stream")
+        out.pop("metrics", None)
+        self._send_event("sources", out)
+        try:
+            for token in answer_stream:
+                self._send_event("token", {"text": token})
+        except OSError:
+            _count("errors")  # client parti : plus rien à lui envoyer
+            return
+        except Exception as e:
+            # en-têtes 200 déjà envoyés : l'erreur part comme dernier événement
+            _count("errors")
+            self._send_event("error", {"error": repr(e), "partial_answer": answer_stream.text})
+            return
+        self._send_event("done", {"answer": answer_stream.text, "metrics": answer_stream.metrics})
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "loaded": resources.loaded()})
+        elif self.path == "/stats":
+            self._send_json(200, server_stats())
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        _count("requests")
+        route = ROUTES.get(self.path.rstrip("/"))
+        if route is None:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            _count("errors")
+            self._send_json(400, {"error": f"JSON invalide : {e}"})
+            return
+        if not isinstance(body, dict):
+            _count("errors")
+            self._send_json(400, {"error": f"objet JSON attendu, reçu {type(body).__name__}"})
+            return
+
+        try:
+            out = route(body)
+        except (KeyError, ValueError) as e:
+            _count("errors")
+            self._send_json(400, {"error": f"requête invalide : {e!r}"})
+            return
+        except Exception as e:
+            _count("errors")
+            self._send_json(500, {"error": repr(e)})
+            return
+
+        if "answer_stream" in out:
+            self._send_stream(out)
+        else:
+            self._send_json(200, out)
+
+
+class RAGServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # file d'attente du listen() (5 par défaut : connexions refusées sous charge)
+
+
+def enable_batching(max_batch: int = None, max_wait_ms: float = None):
+    max_batch = max_batch or config.BATCH_MAX_SIZE
+    max_wait_ms = config.BATCH_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+    batching.enable("encode", _model_encode, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    batching.enable("rerank", _predict, max_batch=max_batch, max_wait_ms=max_wait_ms)
+
+
+def make_server(host: str = None, port: int = None, warmup: bool = True, batch: bool = True):
+    """
+    Crée le serveur (sans le démarrer) ; port=0 : port libre choisi par l'OS.
+    """
+    if warmup:
+        print("Chargement des modèles et des index...")
+        print("Ressources :", resources.warmup())
+    if batch:
+        enable_batching()
+    tracing.configure()
+    host = host or config.SERVER_HOST
+    port = config.SERVER_PORT if port is None else port
+    return RAGServer((host, port), RAGHandler)
+
+
+def _run_worker(server):
+    # processus enfant : index / stores / BM25 en mmap -> chargement quasi instantané,
+    # pages partagées avec les autres workers via le cache du noyau
+    signal.signal(signal.SIGTERM, lambda *_: os._exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # le parent gère Ctrl-C
+    try:
+        resources.warmup()
+        enable_batching()
+        server.serve_forever()
+    finally:
+        os._exit(0)
+
+
+def serve_prefork(n_workers: int = None, host: str = None, port: int = None):
+    """
+    Sert avec n_workers processus pré-forkés qui acceptent sur le même socket.
+    Les fichiers mmap sont écrits une fois avant le fork (voir
+    index_faiss.prepare_serving_files) ; chaque worker charge ses modèles.
+    """
+    from src.index_faiss import prepare_serving_files
+
+    n_workers = n_workers or config.SERVER_WORKERS
+    prepare_serving_files()
+    server = make_server(host, port, warmup=False, batch=False)
+    print(f"Serveur RAG sur http://{server.server_address[0]}:{server.server_address[1]} ({n_workers} workers)")
+
+    children = []
+    for _ in range(n_workers):
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(server)
+        children.append(pid)
+
+    def _stop(*_):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, lambda *_: _stop())
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        _stop()
+        for pid in children:
+            os.waitpid(pid, 0)
+    finally:
+        server.server_close()
+    return children
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else config.SERVER_WORKERS
+    if workers > 1:
+        serve_prefork(workers, port=port)
+    else:
+        server = make_server(port=port)
+        print(f"Serveur RAG sur http://{server.server_address[0]}:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            batching.disable()
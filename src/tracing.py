@@ -0,0 +1,302 @@
+import sys
+import threading
+import time
+import contextvars
+from collections import deque
+
+import numpy as np
+
+from src import config
+
+
+# Instrumentation par étape du pipeline RAG.
+#
+#   with tracing.request() as trace:          # une requête (ask_rag...)
+#       with tracing.span("encode"):          # une étape
+#           ...
+#       out["timings"] = trace.timings()      # {"encode": ms, ..., "total": ms}
+#
+# Les durées d'une requête sont cumulées par nom d'étape dans un Trace porté par un
+# contextvar (suit les threads lancés via contextvars.copy_context, cf. rag_async).
+# Chaque span terminé est aussi envoyé aux sinks enregistrés (log, histogramme,
+# OpenTelemetry). Sans sink et sans requête tracée (config.TRACE_TIMINGS = False),
+# span() renvoie un context manager vide partagé : quasiment aucun coût.
+
+_SINKS = []
+_TRACE = contextvars.ContextVar("rag_trace", default=None)
+_PARENT = contextvars.ContextVar("rag_span", default=None)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("name", "attrs", "parent", "start", "duration", "error", "_token", "_trace", "sink_data")
+
+    def __init__(self, name: str, attrs: dict, trace):
+        self.name = name
+        self.attrs = attrs
+        self.parent = _PARENT.get()
+        self.start = 0.0
+        self.duration = None
+        self.error = None
+        self._trace = trace
+        self._token = None
+        self.sink_data = {}
+
+    def set(self, **attrs):
+        """Attributs connus en cours d'étape (nb de candidats, hit de cache...)."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self._token = _PARENT.set(self)
+        for sink in _SINKS:
+            sink.on_start(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        _PARENT.reset(self._token)
+        if exc is not None:
+            self.error = repr(exc)
+        if self._trace is not None:
+            self._trace.add(self.name, self.duration)
+        for sink in _SINKS:
+            sink.on_end(self)
+        return False
+
+
+class Trace:
+    """Durées cumulées par étape pour une requête."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self._totals[name] = self._totals.get(name, 0.0) + seconds
+
+    def timings(self):
+        """{étape: ms} dans l'ordre de première apparition, plus "total" depuis le début de la requête."""
+        with self._lock:
+            out = {name: round(s * 1000.0, 3) for name, s in self._totals.items()}
+        out["total"] = round((time.perf_counter() - self.start) * 1000.0, 3)
+        return out
+
+
+class _NoopTrace:
+    def timings(self):
+        return {}
+
+
+_NOOP_TRACE = _NoopTrace()
+
+
+def enabled() -> bool:
+    return bool(_SINKS) or config.TRACE_TIMINGS
+
+
+def span(name: str, **attrs):
+    """Context manager qui mesure une étape (no-op si le tracing est désactivé)."""
+    trace = _TRACE.get()
+    if trace is None and not _SINKS:
+        return _NOOP
+    return Span(name, attrs, trace)
+
+
+class request:
+    """
+    Ouvre le Trace d'une requête (context manager, renvoie le Trace).
+    Imbriqué dans une requête déjà tracée (ask_rag appelé par ask_rag_iterative),
+    renvoie le Trace englobant : les étapes s'ajoutent à la requête principale.
+    """
+
+    __slots__ = ("name", "_span", "_token", "trace")
+
+    def __init__(self, name: str = "request"):
+        self.name = name
+        self._span = None
+        self._token = None
+        self.trace = None
+
+    def __enter__(self):
+        outer = _TRACE.get()
+        if outer is not None:
+            self.trace = outer
+            return outer
+        if not enabled():
+            self.trace = _NOOP_TRACE
+            return _NOOP_TRACE
+        self.trace = Trace(self.name)
+        self._token = _TRACE.set(self.trace)
+        if _SINKS:
+            # span racine pour les sinks (parent des étapes) ; pas compté dans timings()
+            self._span = Span(self.name, {}, None)
+            self._span.__enter__()
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is not None:
+            self._span.__exit__(exc_type, exc, tb)
+        if self._token is not None:
+            _TRACE.reset(self._token)
+        return False
+
+
+# ----------------------------
+# Sinks
+# ----------------------------
+
+class Sink:
+    def on_start(self, span: Span):
+        pass
+
+    def on_end(self, span: Span):
+        pass
+
+
+class LogSink(Sink):
+    """Une ligne par span terminé (au-delà de min_ms)."""
+
+    def __init__(self, stream=None, min_ms: float = 0.0):
+        self.stream = stream or sys.stderr
+        self.min_ms = min_ms
+        self._lock = threading.Lock()
+
+    def on_end(self, span):
+        ms = span.duration * 1000.0
+        if ms < self.min_ms:
+            return
+        depth, p = 0, span.parent
+        while p is not None:
+            depth, p = depth + 1, p.parent
+        attrs = " ".join(f"{k}={v}" for k, v in span.attrs.items())
+        error = f" error={span.error}" if span.error else ""
+        with self._lock:
+            self.stream.write(f"[trace] {'  ' * depth}{span.name} {ms:.2f} ms {attrs}{error}".rstrip() + "\n")
+
+
+class HistogramSink(Sink):
+    """
+    Latences par étape en mémoire : nb, somme, max, et les `window` dernières
+    mesures pour les percentiles.
+    """
+
+    def __init__(self, window: int = 10000):
+        self.window = window
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def on_end(self, span):
+        with self._lock:
+            d = self._data.get(span.name)
+            if d is None:
+                d = self._data[span.name] = {"count": 0, "sum": 0.0, "max": 0.0, "errors": 0,
+                                             "recent": deque(maxlen=self.window)}
+            d["count"] += 1
+            d["sum"] += span.duration
+            d["max"] = max(d["max"], span.duration)
+            d["errors"] += span.error is not None
+            d["recent"].append(span.duration)
+
+    def summary(self):
+        with self._lock:
+            items = [(name, dict(d, recent=np.asarray(d["recent"]))) for name, d in self._data.items()]
+        out = {}
+        for name, d in items:
+            ms = d["recent"] * 1000.0
+            out[name] = {
+                "count": d["count"],
+                "errors": d["errors"],
+                "mean_ms": d["sum"] * 1000.0 / d["count"],
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": d["max"] * 1000.0,
+            }
+        return out
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class OpenTelemetrySink(Sink):
+    """
+    Exporte les spans vers OpenTelemetry (paquet opentelemetry-api, optionnel) ;
+    exporteur et provider sont configurés côté application comme d'habitude.
+    """
+
+    def __init__(self, tracer=None, tracer_name: str = "symfony-rag"):
+        try:
+            from opentelemetry import trace as otel_trace
+        except ImportError as e:
+            raise ImportError("OpenTelemetrySink nécessite le paquet opentelemetry-api") from e
+        self._otel = otel_trace
+        self.tracer = tracer or otel_trace.get_tracer(tracer_name)
+
+    def on_start(self, span):
+        parent = span.parent.sink_data.get(id(self)) if span.parent is not None else None
+        context = self._otel.set_span_in_context(parent) if parent is not None else None
+        span.sink_data[id(self)] = self.tracer.start_span(span.name, context=context)
+
+    def on_end(self, span):
+        otel_span = span.sink_data.pop(id(self), None)
+        if otel_span is None:
+            return
+        for k, v in span.attrs.items():
+            if isinstance(v, (str, bool, int, float)):
+                otel_span.set_attribute(k, v)
+        if span.error:
+            otel_span.set_attribute("error", span.error)
+        otel_span.end()
+
+
+def add_sink(sink: Sink):
+    _SINKS.append(sink)
+    return sink
+
+
+def remove_sink(sink: Sink):
+    if sink in _SINKS:
+        _SINKS.remove(sink)
+
+
+def sinks():
+    return list(_SINKS)
+
+
+def configure():
+    """Sinks demandés par la config (appelé par le serveur) ; idempotent."""
+    kinds = {type(s) for s in _SINKS}
+    if config.TRACE_HISTOGRAM and HistogramSink not in kinds:
+        add_sink(HistogramSink())
+    if config.TRACE_LOG and LogSink not in kinds:
+        add_sink(LogSink())
+    return sinks()
+
+
+def stats():
+    """Résumés des HistogramSink enregistrés (pour /stats du serveur)."""
+    out = {}
+    for sink in _SINKS:
+        if isinstance(sink, HistogramSink):
+            out.update(sink.summary())
+    return out